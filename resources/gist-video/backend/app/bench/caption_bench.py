@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from app.bench.mock_relay import MockRelay, add_relay_args, relay_config_from_args
+
+
+def _synth_videos(ffmpeg: str, out_dir: str, *, count: int, seconds: float, log) -> list[str]:
+    from app.core.ffmpeg import run_cmd
+
+    os.makedirs(out_dir, exist_ok=True)
+    out: list[str] = []
+    for i in range(int(count)):
+        dst = os.path.join(out_dir, f"synth_{i:03d}.mp4")
+        # testsrc2 changes every frame; a per-video hue shift keeps frames distinct across videos.
+        run_cmd(
+            [
+                ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-y",
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc2=size=640x360:rate=25:duration={float(seconds):.3f}",
+                "-vf",
+                f"hue=h={(i * 47) % 360}",
+                "-pix_fmt",
+                "yuv420p",
+                "-an",
+                dst,
+            ],
+            log_fn=log,
+        )
+        out.append(dst)
+    return out
+
+
+def run_bench(args: argparse.Namespace) -> dict:
+    work = tempfile.mkdtemp(prefix="gist-caption-bench-")
+    # Isolate settings/projects/caches from the real data dir (default_paths() reads these per call).
+    os.environ["GIST_VIDEO_DATA_DIR"] = os.path.join(work, "data")
+    os.environ["GIST_VIDEO_PROJECTS_DIR"] = os.path.join(work, "data", "projects")
+
+    from app.core.ffmpeg import find_ffmpeg
+    from app.core.project_store import ProjectStore
+    from app.core.runtime_config import clear_runtime_vision_credentials, set_runtime_vision_credentials
+    from app.core.settings import AppSettings, EmbeddingSettings, VisionSettings, save_settings
+    from app.jobs.index_job import IndexJobRequest, run_index_job
+
+    lines: list[str] = []
+
+    def log(msg: str) -> None:
+        lines.append(str(msg))
+        if args.verbose:
+            print(msg, flush=True)
+
+    relays = [
+        MockRelay(relay_config_from_args(args, api_key=f"bench-{i}")).start() for i in range(max(1, int(args.relays)))
+    ]
+    try:
+        save_settings(
+            AppSettings(
+                embedding=EmbeddingSettings(backend="local_hash"),
+                vision=VisionSettings(
+                    backend="gemini_proxy",
+                    vision_model="mock-vision",
+                    caption_workers=int(args.caption_workers),
+                    caption_in_flight=int(args.caption_in_flight),
+                    caption_batch_clips=int(args.batch_clips),
+                    caption_batch_max_images=int(args.batch_max_images),
+                    slice_mode=str(args.slice_mode),
+                    # Measure the relay path, not cache hits.
+                    caption_global_cache=False,
+                    caption_hedge_enable=bool(args.hedge),
+                ),
+            )
+        )
+        set_runtime_vision_credentials(
+            api_base=relays[0].url,
+            api_key="bench-0",
+            endpoints=[{"api_base": r.url, "api_key": f"bench-{i}"} for i, r in enumerate(relays)][1:],
+        )
+
+        bins = find_ffmpeg()
+        videos = [os.path.abspath(v) for v in (args.videos or [])]
+        if not videos:
+            videos = _synth_videos(bins.ffmpeg, os.path.join(work, "videos"), count=args.synth, seconds=args.synth_sec, log=log)
+
+        store = ProjectStore.default()
+        proj = store.create_project("caption-bench")
+        store.add_videos(proj.project_id, videos)
+
+        req = IndexJobRequest(
+            project_id=proj.project_id,
+            frames_per_clip=int(args.frames_per_clip),
+            caption_workers=int(args.caption_workers),
+            caption_in_flight=int(args.caption_in_flight),
+            caption_batch_clips=int(args.batch_clips),
+            caption_batch_max_images=int(args.batch_max_images),
+        )
+        t0 = time.monotonic()
+        err = ""
+        try:
+            run_index_job(req, lambda *_a: None, log, threading.Event(), threading.Event())
+        except Exception as e:
+            err = str(e)
+        wall = time.monotonic() - t0
+
+        server: dict[str, int] = {}
+        for r in relays:
+            for k, v in r.stats().items():
+                if k == "active_sec":
+                    server[k] = max(float(server.get(k, 0.0)), float(v))
+                else:
+                    server[k] = int(server.get(k, 0)) + int(v)
+        relay_lines = [ln for ln in lines if ln.startswith("Caption relay stats:")]
+        active = float(server.get("active_sec", 0.0)) or wall
+        return {
+            "config": {
+                "videos": len(videos),
+                "relays": len(relays),
+                "caption_workers": int(args.caption_workers),
+                "caption_in_flight": int(args.caption_in_flight),
+                "batch_clips": int(args.batch_clips),
+                "batch_max_images": int(args.batch_max_images),
+                "frames_per_clip": int(args.frames_per_clip),
+                "latency": f"{args.latency}:{args.latency_ms}ms",
+                "p_429": args.p_429,
+                "p_5xx": args.p_5xx,
+                "p_malformed": args.p_malformed,
+                "hedge": bool(args.hedge),
+            },
+            "wall_sec": round(wall, 3),
+            "relay_active_sec": round(active, 3),
+            "images": int(server.get("images", 0)),
+            "requests": int(server.get("requests", 0)),
+            "images_per_sec": round(int(server.get("images", 0)) / max(1e-6, active), 2),
+            "requests_per_sec": round(int(server.get("requests", 0)) / max(1e-6, active), 2),
+            "retries": max(0, int(server.get("requests", 0)) - int(server.get("ok", 0))),
+            "server": server,
+            "client": relay_lines[-1].split(":", 1)[1].strip() if relay_lines else "",
+            "error": err,
+            "work_dir": work if args.keep else "",
+        }
+    finally:
+        for r in relays:
+            r.stop()
+        clear_runtime_vision_credentials()
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Caption pipeline throughput benchmark against a local mock relay")
+    ap.add_argument("videos", nargs="*", help="videos to index (default: synthesize test videos with ffmpeg)")
+    ap.add_argument("--synth", type=int, default=2, help="number of synthetic videos")
+    ap.add_argument("--synth-sec", type=float, default=60.0, help="length of each synthetic video")
+    ap.add_argument("--relays", type=int, default=1, help="mock relay endpoints (pooled via vision.api_endpoints)")
+    ap.add_argument("--caption-workers", type=int, default=2)
+    ap.add_argument("--caption-in-flight", type=int, default=8)
+    ap.add_argument("--batch-clips", type=int, default=1)
+    ap.add_argument("--batch-max-images", type=int, default=0)
+    ap.add_argument("--frames-per-clip", type=int, default=3)
+    ap.add_argument("--slice-mode", default="fixed", choices=["fixed", "scene"])
+    ap.add_argument("--hedge", action="store_true", help="enable hedged caption requests")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary work dir")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON only")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print index job logs")
+    add_relay_args(ap)
+    args = ap.parse_args()
+
+    rep = run_bench(args)
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        c = rep["config"]
+        print(
+            f"videos={c['videos']} relays={c['relays']} workers={c['caption_workers']} in_flight={c['caption_in_flight']} "
+            f"batch_clips={c['batch_clips']} latency={c['latency']}"
+        )
+        print(f"wall: {rep['wall_sec']:.2f}s (relay active {rep['relay_active_sec']:.2f}s)")
+        print(f"images: {rep['images']} ({rep['images_per_sec']}/s), requests: {rep['requests']} ({rep['requests_per_sec']}/s)")
+        print(f"retries: {rep['retries']}, server: {rep['server']}")
+        if rep["client"]:
+            print(f"client: {rep['client']}")
+        if rep["error"]:
+            print(f"job error: {rep['error']}")
+    return 1 if rep["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_WORDS = ["房间", "街道", "森林", "战场", "少年", "少女", "对话", "奔跑", "打斗", "翻书", "手枪", "血迹", "夜晚", "雨天"]
+
+
+@dataclass
+class MockRelayConfig:
+    # Latency model for /chat/completions (milliseconds):
+    #   fixed: latency_ms; uniform: [latency_ms, latency_max_ms]; lognormal: median latency_ms, sigma latency_sigma;
+    #   pareto: latency_ms * pareto(latency_alpha) (heavy tail), capped at latency_max_ms.
+    latency: str = "lognormal"
+    latency_ms: float = 800.0
+    latency_max_ms: float = 20000.0
+    latency_sigma: float = 0.5
+    latency_alpha: float = 2.5
+    # Extra latency per image in the request (models a bigger upload / longer generation).
+    per_image_ms: float = 40.0
+    # Fault injection probabilities (0..1), evaluated per request in this order.
+    p_429: float = 0.0
+    p_5xx: float = 0.0
+    p_malformed: float = 0.0
+    # Require this bearer token (empty = accept any).
+    api_key: str = ""
+    models: list[str] = field(default_factory=lambda: ["mock-vision"])
+    seed: int | None = None
+
+
+class MockRelay:
+    """
+    Local OpenAI-compatible stand-in for the caption relay (`/v1/chat/completions`, `/v1/models`).
+
+    Responses follow the JSON shape GeminiRelayCaptionProvider asks for (keys 0..N-1 per image or per
+    "CLIP i" group), with deterministic fake tags derived from the image payload.
+    """
+
+    def __init__(self, cfg: MockRelayConfig | None = None, *, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.cfg = cfg or MockRelayConfig()
+        self._rng = random.Random(self.cfg.seed)
+        self._rng_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.first_ts: float | None = None
+        self.last_ts: float | None = None
+        self._in_flight = 0
+        self.max_in_flight = 0
+        self._server = ThreadingHTTPServer((host, int(port)), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockRelay":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-relay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "MockRelay":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+    def _bump(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = int(self.counters.get(name, 0)) + int(n)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out: dict = dict(self.counters)
+            out["max_in_flight"] = int(self.max_in_flight)
+            if self.first_ts is not None and self.last_ts is not None:
+                out["active_sec"] = round(self.last_ts - self.first_ts, 3)
+            return out
+
+    def _random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _latency_sec(self, n_images: int) -> float:
+        c = self.cfg
+        with self._rng_lock:
+            if c.latency == "fixed":
+                ms = c.latency_ms
+            elif c.latency == "uniform":
+                ms = self._rng.uniform(c.latency_ms, max(c.latency_ms, c.latency_max_ms))
+            elif c.latency == "pareto":
+                ms = c.latency_ms * self._rng.paretovariate(max(0.1, c.latency_alpha))
+            else:
+                ms = self._rng.lognormvariate(0.0, max(0.0, c.latency_sigma)) * c.latency_ms
+        ms = min(float(c.latency_max_ms), ms) + float(c.per_image_ms) * max(0, n_images)
+        return max(0.0, ms) / 1000.0
+
+    def _handler_class(self):
+        relay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args) -> None:
+                return
+
+            def _send_json(self, code: int, obj: object, *, raw: bytes | None = None) -> None:
+                data = raw if raw is not None else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self) -> bool:
+                if not relay.cfg.api_key:
+                    return True
+                return self.headers.get("Authorization", "") == f"Bearer {relay.cfg.api_key}"
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") != "/v1/models":
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                if not self._authorized():
+                    self._send_json(401, {"error": {"message": "invalid api key"}})
+                    return
+                relay._bump("models")
+                self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in relay.cfg.models]})
+
+            def do_POST(self) -> None:
+                n = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(n) if n > 0 else b""
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                if not self._authorized():
+                    self._send_json(401, {"error": {"message": "invalid api key"}})
+                    return
+                try:
+                    body = json.loads(raw.decode("utf-8"))
+                except Exception:
+                    self._send_json(400, {"error": {"message": "invalid json body"}})
+                    return
+
+                images: list[str] = []
+                clips = 0
+                for msg in body.get("messages") or []:
+                    content = msg.get("content")
+                    if not isinstance(content, list):
+                        continue
+                    for part in content:
+                        if part.get("type") == "image_url":
+                            images.append(str((part.get("image_url") or {}).get("url") or ""))
+                        elif part.get("type") == "text" and str(part.get("text") or "").startswith("CLIP "):
+                            clips += 1
+
+                now = time.monotonic()
+                with relay._lock:
+                    relay.first_ts = now if relay.first_ts is None else relay.first_ts
+                    relay._in_flight += 1
+                    relay.max_in_flight = max(relay.max_in_flight, relay._in_flight)
+                try:
+                    relay._bump("requests")
+                    relay._bump("images", len(images))
+                    time.sleep(relay._latency_sec(len(images)))
+
+                    cfg = relay.cfg
+                    if relay._random() < cfg.p_429:
+                        relay._bump("injected_429")
+                        self._send_json(429, {"error": {"message": "rate limited (mock)"}})
+                        return
+                    if relay._random() < cfg.p_5xx:
+                        relay._bump("injected_5xx")
+                        self._send_json(503, {"error": {"message": "upstream unavailable (mock)"}})
+                        return
+                    if relay._random() < cfg.p_malformed:
+                        relay._bump("injected_malformed")
+                        if relay._random() < 0.5:
+                            # Broken HTTP body: the client's r.json() fails.
+                            self._send_json(200, None, raw=b'{"choices": [{"message": ')
+                        else:
+                            # Valid envelope, unparseable model output.
+                            self._send_json(200, _completion(body, "抱歉，我无法按 JSON 输出。{not json"))
+                        return
+
+                    n_items = clips if clips > 0 else len(images)
+                    out: dict[str, dict] = {}
+                    for i in range(n_items):
+                        url = images[i] if clips <= 0 and i < len(images) else f"{i}:{len(images)}"
+                        out[str(i)] = _fake_caption(url)
+                    relay._bump("ok")
+                    self._send_json(200, _completion(body, "```json\n" + json.dumps(out, ensure_ascii=False) + "\n```"))
+                finally:
+                    with relay._lock:
+                        relay._in_flight -= 1
+                        relay.last_ts = time.monotonic()
+
+        return Handler
+
+
+def _completion(body: dict, content: str) -> dict:
+    return {
+        "id": f"mock-{time.time_ns()}",
+        "object": "chat.completion",
+        "model": str(body.get("model") or ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def _fake_caption(seed: str) -> dict:
+    h = hashlib.sha1(seed.encode("utf-8", errors="ignore")).digest()
+    tags = [_WORDS[b % len(_WORDS)] for b in h[:6]]
+    return {
+        "summary": f"测试画面 {h.hex()[:6]}",
+        "title": "",
+        "characters": [],
+        "who": tags[0],
+        "action": tags[1],
+        "scene": tags[2],
+        "objects": [tags[3]],
+        "mood": "平静",
+        "shot": "中景",
+        "tags": sorted(set(tags)),
+        "flags": [],
+    }
+
+
+def add_relay_args(ap: argparse.ArgumentParser) -> None:
+    d = MockRelayConfig()
+    ap.add_argument("--latency", default=d.latency, choices=["fixed", "uniform", "lognormal", "pareto"])
+    ap.add_argument("--latency-ms", type=float, default=d.latency_ms)
+    ap.add_argument("--latency-max-ms", type=float, default=d.latency_max_ms)
+    ap.add_argument("--latency-sigma", type=float, default=d.latency_sigma)
+    ap.add_argument("--latency-alpha", type=float, default=d.latency_alpha)
+    ap.add_argument("--per-image-ms", type=float, default=d.per_image_ms)
+    ap.add_argument("--p-429", type=float, default=0.0)
+    ap.add_argument("--p-5xx", type=float, default=0.0)
+    ap.add_argument("--p-malformed", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+
+
+def relay_config_from_args(args: argparse.Namespace, *, api_key: str = "") -> MockRelayConfig:
+    return MockRelayConfig(
+        latency=str(args.latency),
+        latency_ms=float(args.latency_ms),
+        latency_max_ms=float(args.latency_max_ms),
+        latency_sigma=float(args.latency_sigma),
+        latency_alpha=float(args.latency_alpha),
+        per_image_ms=float(args.per_image_ms),
+        p_429=float(args.p_429),
+        p_5xx=float(args.p_5xx),
+        p_malformed=float(args.p_malformed),
+        api_key=api_key,
+        seed=args.seed,
+    )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Mock OpenAI-compatible vision relay (for caption benchmarks)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8799)
+    ap.add_argument("--api-key", default="")
+    add_relay_args(ap)
+    args = ap.parse_args()
+
+    relay = MockRelay(relay_config_from_args(args, api_key=str(args.api_key)), host=args.host, port=args.port).start()
+    print(f"mock relay listening on {relay.url}", flush=True)
+    try:
+        while True:
+            time.sleep(5.0)
+            print(json.dumps(relay.stats(), ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -57,11 +57,24 @@ def _decode_process_output(b: bytes) -> str:
     return b.decode("utf-8", errors="replace")
 
 
-def run_cmd(args: list[str], *, log_fn=None) -> None:
+def run_cmd(args: list[str], *, log_fn=None, cancel_evt=None) -> None:
+    """
+    Run a command, capturing combined output. With `cancel_evt`, the process is killed as soon as
+    the event is set (RuntimeError("Cancelled")), so long ffmpeg encodes don't outlive a cancelled job.
+    """
     if log_fn:
         log_fn(" ".join(args))
-    p = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    out = _decode_process_output(p.stdout).strip()
+    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    while True:
+        try:
+            raw, _ = p.communicate(timeout=None if cancel_evt is None else 0.2)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_evt is not None and cancel_evt.is_set():
+                p.kill()
+                p.communicate()
+                raise RuntimeError("Cancelled")
+    out = _decode_process_output(raw).strip()
     if log_fn and out:
         log_fn(out)
     if p.returncode != 0:
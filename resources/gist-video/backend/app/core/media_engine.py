@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import io
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from fractions import Fraction
+
+import numpy as np
+
+from app.core.ffmpeg import run_cmd
+
+
+@dataclass
+class DecodedFrame:
+    t: float
+    path: str
+    # In-memory JPEG bytes (None when the file already existed or was written by an external process).
+    jpeg: bytes | None = None
+    # 8x9 grayscale thumbnail for dHash (None when not decoded in-process).
+    gray: np.ndarray | None = None
+
+
+class MediaEngine(ABC):
+    """
+    Frame extraction backend used by the index job. Implementations write `out_paths` (JPEG, `width`
+    wide) for the given source timestamps and skip files that already exist.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def extract_frames(
+        self,
+        src: str,
+        times: list[float],
+        out_paths: list[str],
+        *,
+        width: int = 640,
+        keyframe: bool = False,
+        log=None,
+    ) -> list[DecodedFrame]:
+        ...
+
+    def close(self) -> None:
+        return
+
+
+class FFmpegCliEngine(MediaEngine):
+    """One ffmpeg process per frame (input seek); always available."""
+
+    name = "ffmpeg"
+
+    def __init__(self, ffmpeg: str) -> None:
+        self.ffmpeg = ffmpeg
+
+    def extract_frames(
+        self,
+        src: str,
+        times: list[float],
+        out_paths: list[str],
+        *,
+        width: int = 640,
+        keyframe: bool = False,
+        log=None,
+    ) -> list[DecodedFrame]:
+        out: list[DecodedFrame] = []
+        for t, out_jpg in zip(times, out_paths):
+            out.append(DecodedFrame(t=float(t), path=out_jpg))
+            if os.path.isfile(out_jpg):
+                continue
+            os.makedirs(os.path.dirname(out_jpg), exist_ok=True)
+            # At a keyframe only that frame needs decoding: seek just before it and skip everything but keyframes.
+            seek = ["-skip_frame", "nokey", "-ss", f"{max(0.0, t - 0.001):.3f}"] if keyframe else ["-ss", f"{t:.3f}"]
+            run_cmd(
+                [
+                    self.ffmpeg,
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-y",
+                    *seek,
+                    "-i",
+                    src,
+                    "-vf",
+                    f"scale={int(width)}:-2",
+                    # Avoid "image sequence pattern" warnings when writing a single JPG.
+                    "-update",
+                    "1",
+                    "-frames:v",
+                    "1",
+                    "-q:v",
+                    "4",
+                    out_jpg,
+                ],
+                log_fn=log,
+            )
+        return out
+
+
+class PyAVEngine(MediaEngine):
+    """
+    In-process decode via PyAV: one open container per source (a single demux for all of its frames),
+    frames land directly in NumPy arrays and are JPEG-encoded in memory (Pillow, else libavcodec mjpeg).
+    Forward requests close to the current decode position continue decoding instead of seeking.
+    """
+
+    name = "pyav"
+    # Decode forward instead of seeking when the next timestamp is this close (seconds).
+    _FORWARD_SEC = 2.0
+
+    def __init__(self) -> None:
+        import av  # type: ignore
+
+        self._av = av
+        self._lock = threading.Lock()
+        self._src = ""
+        self._container = None
+        self._stream = None
+        self._frames = None
+        self._pos = -1.0
+        # Source timestamps are relative to the stream start (like `ffmpeg -ss`).
+        self._t0 = 0.0
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import av  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return True
+
+    def _open(self, src: str) -> None:
+        if self._src == src and self._container is not None:
+            return
+        self.close()
+        self._container = self._av.open(src)
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self._src = src
+        self._frames = None
+        self._pos = -1.0
+        st = self._stream
+        self._t0 = float(st.start_time * st.time_base) if st.start_time is not None and st.time_base else 0.0
+
+    def _seek(self, t: float, *, keyframe: bool) -> None:
+        st = self._stream
+        assert self._container is not None and st is not None
+        st.codec_context.skip_frame = "NONKEY" if keyframe else "DEFAULT"
+        if self._frames is None or not (self._pos <= t <= self._pos + self._FORWARD_SEC) or keyframe:
+            tb = st.time_base
+            self._container.seek(max(0, int(t / float(tb))) if tb else int(t * 1_000_000), stream=st, backward=True)
+            self._frames = self._container.decode(st)
+            self._pos = -1.0
+
+    def _frame_at(self, t: float, *, keyframe: bool):
+        t = t + self._t0
+        self._seek(t, keyframe=keyframe)
+        last = None
+        for fr in self._frames:  # type: ignore[union-attr]
+            ft = float(fr.time) if fr.time is not None else self._pos
+            self._pos = ft
+            last = fr
+            if ft >= t - 0.001:
+                return fr
+        # End of stream: the next request must seek again.
+        self._frames = None
+        return last
+
+    def _encode_jpeg(self, rgb: np.ndarray) -> bytes:
+        try:
+            from PIL import Image  # type: ignore
+        except Exception:
+            Image = None
+        if Image is not None:
+            buf = io.BytesIO()
+            Image.fromarray(rgb).save(buf, "JPEG", quality=85)
+            return buf.getvalue()
+        av = self._av
+        h, w = int(rgb.shape[0]), int(rgb.shape[1])
+        ctx = av.CodecContext.create("mjpeg", "w")
+        ctx.width, ctx.height, ctx.pix_fmt = w, h, "yuvj420p"
+        ctx.time_base = Fraction(1, 25)
+        ctx.options = {"qmin": "2", "qmax": "6"}
+        frame = av.VideoFrame.from_ndarray(rgb, format="rgb24").reformat(format="yuvj420p")
+        data = b"".join(bytes(p) for p in ctx.encode(frame))
+        data += b"".join(bytes(p) for p in ctx.encode(None))
+        return data
+
+    @staticmethod
+    def _gray_thumb(rgb: np.ndarray) -> np.ndarray:
+        # Area-average to 8 rows x 9 cols (matches the dHash input of app.vision.phash).
+        g = rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        rows = np.array_split(np.arange(g.shape[0]), 8)
+        cols = np.array_split(np.arange(g.shape[1]), 9)
+        return np.array([[g[np.ix_(r, c)].mean() for c in cols] for r in rows], dtype=np.uint8)
+
+    def extract_frames(
+        self,
+        src: str,
+        times: list[float],
+        out_paths: list[str],
+        *,
+        width: int = 640,
+        keyframe: bool = False,
+        log=None,
+    ) -> list[DecodedFrame]:
+        out: list[DecodedFrame] = []
+        with self._lock:
+            for t, out_jpg in zip(times, out_paths):
+                if os.path.isfile(out_jpg):
+                    out.append(DecodedFrame(t=float(t), path=out_jpg))
+                    continue
+                self._open(src)
+                fr = self._frame_at(float(t), keyframe=keyframe)
+                if fr is None:
+                    raise RuntimeError(f"PyAV decode failed at {t:.3f}s: {src}")
+                w = int(width)
+                h = max(2, int(round(fr.height * w / max(1, fr.width) / 2)) * 2)
+                rgb = fr.to_ndarray(width=w, height=h, format="rgb24")
+                data = self._encode_jpeg(rgb)
+                os.makedirs(os.path.dirname(out_jpg), exist_ok=True)
+                tmp = out_jpg + ".part"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, out_jpg)
+                out.append(DecodedFrame(t=float(t), path=out_jpg, jpeg=data, gray=self._gray_thumb(rgb)))
+        return out
+
+    def close(self) -> None:
+        if self._container is not None:
+            try:
+                self._container.close()
+            except Exception:
+                pass
+        self._container = None
+        self._stream = None
+        self._frames = None
+        self._src = ""
+
+
+def get_media_engine(name: str, *, ffmpeg: str, log=None) -> MediaEngine:
+    """
+    name: "auto" (PyAV when installed, else ffmpeg CLI) | "pyav" | "ffmpeg".
+    PyAV problems never fail the job: we fall back to the ffmpeg CLI.
+    """
+    name = (name or "auto").strip().lower()
+    if name in ("auto", "pyav"):
+        try:
+            if PyAVEngine.available():
+                return PyAVEngine()
+            if name == "pyav" and log:
+                log("WARNING: media_engine=pyav 但未安装 PyAV（pip install av），回退 ffmpeg 命令行。")
+        except Exception as e:
+            if log:
+                log(f"WARNING: PyAV 初始化失败，回退 ffmpeg 命令行：{e}")
+    return FFmpegCliEngine(ffmpeg)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from threading import Lock
 
 
@@ -8,27 +8,30 @@ from threading import Lock
 class RuntimeVisionCredentials:
     api_base: str = ""
     api_key: str = ""
+    endpoints: list[dict] = field(default_factory=list)
 
 
 _LOCK = Lock()
 _VISION = RuntimeVisionCredentials()
 
 
-def set_runtime_vision_credentials(*, api_base: str, api_key: str) -> None:
+def set_runtime_vision_credentials(*, api_base: str, api_key: str, endpoints: list[dict] | None = None) -> None:
     with _LOCK:
         _VISION.api_base = str(api_base or "").strip()
         _VISION.api_key = str(api_key or "").strip()
+        _VISION.endpoints = [dict(e) for e in (endpoints or []) if isinstance(e, dict) and str(e.get("api_base") or "").strip()]
 
 
 def clear_runtime_vision_credentials() -> None:
     with _LOCK:
         _VISION.api_base = ""
         _VISION.api_key = ""
+        _VISION.endpoints = []
 
 
 def get_runtime_vision_credentials() -> RuntimeVisionCredentials:
     with _LOCK:
-        return RuntimeVisionCredentials(api_base=_VISION.api_base, api_key=_VISION.api_key)
+        return RuntimeVisionCredentials(api_base=_VISION.api_base, api_key=_VISION.api_key, endpoints=list(_VISION.endpoints))
 
 
 def has_runtime_vision_credentials() -> bool:
@@ -13,6 +13,8 @@ class EmbeddingSettings:
     backend: str = "auto"
     # Default to a lightweight local ONNX model shipped alongside the tool when available.
     model_id: str = "m3e-small/onnx/model.onnx"
+    # Optional local ONNX image-text (CLIP-style) model dir with vision.onnx/text.onnx/tokenizer.json; empty = off.
+    clip_model_id: str = ""
 
 
 @dataclass(frozen=True)
@@ -22,6 +24,9 @@ class VisionSettings:
     # OpenAI-compatible relay base URL (recommended to end with /v1).
     api_base: str = ""
     api_key: str = ""
+    # Extra relay endpoints (mirrors / additional keys) pooled with api_base/api_key:
+    # [{"api_base": "...", "api_key": "...", "max_in_flight": 4, "weight": 1.0}, ...]
+    api_endpoints: list[dict] | None = None
     vision_model: str = ""
     caption_workers: int = 2
     caption_in_flight: int = 8
@@ -34,7 +39,8 @@ class VisionSettings:
     # Default to 0 to avoid accidentally skipping the whole video on short clips.
     skip_head_sec: int = 0
     skip_tail_sec: int = 0
-    # Index slicing mode: "scene" uses ffmpeg scene detection on proxy.mp4; "fixed" uses fixed seconds.
+    # Index slicing mode: "scene" uses ffmpeg scene detection on the proxy; "fixed" uses fixed seconds;
+    # "keyframe" (fast preview) slices at source keyframes and extracts frames there.
     slice_mode: str = "scene"
     # ffmpeg select(scene) threshold: 0..1 (higher = fewer cuts). Anime often works around 0.30-0.45.
     scene_threshold: float = 0.35
@@ -44,6 +50,41 @@ class VisionSettings:
     clip_min_sec: float = 3.0
     clip_target_sec: float = 4.5
     clip_max_sec: float = 6.0
+    # Content-addressed caption cache shared across projects (keyed by frame bytes + provider cache_key).
+    caption_global_cache: bool = True
+    caption_global_cache_max_entries: int = 50000
+    # Caption versions kept per project (per provider cache_key); switching back to a kept version is instant.
+    caption_cache_versions: int = 3
+    # After a cache_key change: "full" re-captions everything; "on_demand" keeps older-version captions as provisional text.
+    caption_refresh: str = "full"
+    # In-memory budget for pre-encoded base64 frame payloads (reused across caption retries). 0 disables.
+    caption_payload_cache_mb: int = 256
+    # Hedged caption requests: fire a duplicate when a request exceeds the rolling p95 latency.
+    caption_hedge_enable: bool = False
+    # Max hedged duplicates per request (0.1 = at most +10% relay calls).
+    caption_hedge_budget: float = 0.1
+    # Per-endpoint concurrency cap for the relay endpoint pool (requests in flight per api_base/api_key).
+    caption_endpoint_max_in_flight: int = 4
+    # Perceptual-hash dedup: near-identical clips (within/across videos) reuse an existing caption instead of a relay request.
+    caption_dedup_enable: bool = True
+    # Max dHash hamming distance (0..64) per frame for two clips to count as near-identical.
+    caption_dedup_max_hamming: int = 4
+    # Detect openings/endings/recaps repeated across episodes (1 fps proxy fingerprints) and drop them before captioning.
+    repeat_skip_enable: bool = False
+    # Minimum length (seconds) of a cross-episode repeat.
+    repeat_min_sec: float = 20.0
+    # Per-second dHash distance (0..64) for two frames to count as the same.
+    repeat_max_hamming: int = 6
+    # Repeats within this many seconds of the head/tail of both episodes are openings/endings (dropped everywhere); others are recaps (dropped in the later episode).
+    repeat_edge_sec: float = 360.0
+    # Index captioning: "full" captions every clip; "lazy" only reuses cached/near-duplicate captions and leaves the rest to frame vectors until renders caption them on demand (needs an image embedding model).
+    caption_mode: str = "full"
+    # Index: publish a partial index snapshot after every N completed videos so renders can start early (0 = off).
+    index_snapshot_every: int = 1
+    # Index proxy: "analysis" (low-fps, decoder frame dropping), "keyframes" (keyframe-only decode, fastest) or "full" (legacy full-rate proxy).
+    proxy_mode: str = "analysis"
+    # Index frame decoding: "auto" (in-process PyAV when installed, else ffmpeg CLI), "pyav" or "ffmpeg".
+    media_engine: str = "auto"
 
 
 @dataclass(frozen=True)
@@ -78,6 +119,29 @@ class RenderSettings:
     bgm_volume: float = 0.12
     # Output video FPS for segment rendering / concat stability.
     output_fps: int = 25
+    # Render: caption pending/stale clips among the top-K matches per line before final matching (0 = off).
+    lazy_caption_topk: int = 8
+    # Weight of frame image-embedding similarity fused into caption similarity (0 = captions only).
+    match_image_weight: float = 0.5
+    # Parallel segment encodes (0 = auto from CPU count; 1 = serial).
+    render_workers: int = 0
+    # Opt-in: burn subtitles while rendering each segment so the final mux stream-copies video (one encode per frame).
+    single_encode: bool = False
+    # Project-level cache of rendered segments reused across render jobs (MB quota, LRU; 0 = off).
+    segment_cache_mb: int = 4096
+    # Draft renders: output/proxy height (width follows the output aspect).
+    draft_height: int = 360
+    # Max consecutive same-source segments rendered in one ffmpeg run (1 = one run per segment).
+    segment_group_max: int = 6
+    # Transcode sources used by this many render jobs into short-GOP mezzanines in the background (0 = off).
+    mezzanine_min_uses: int = 0
+    # Mezzanine cache quota per project (MB, LRU).
+    mezzanine_cache_mb: int = 20480
+    # Draft proxy cache quota per project (MB, LRU).
+    draft_proxy_cache_mb: int = 8192
+    # Opt-in: also queue a background draft proxy (draft_height, output_fps) for each source while indexing
+    # (otherwise proxies are only queued by draft renders that miss one).
+    draft_proxy_at_index: bool = False
 
 
 @dataclass(frozen=True)
@@ -90,6 +154,13 @@ class AppSettings:
 from app.core.runtime_config import get_runtime_vision_credentials, has_runtime_vision_credentials
 
 
+def _endpoint_list(v: object) -> list[dict] | None:
+    if not isinstance(v, list):
+        return None
+    out = [dict(e) for e in v if isinstance(e, dict) and str(e.get("api_base") or "").strip()]
+    return out or None
+
+
 def apply_runtime_overrides(st: AppSettings) -> AppSettings:
     """Apply in-memory runtime overrides.
 
@@ -107,6 +178,7 @@ def apply_runtime_overrides(st: AppSettings) -> AppSettings:
         backend=vis.backend,
         api_base=cred.api_base,
         api_key=cred.api_key,
+        api_endpoints=(list(cred.endpoints) if cred.endpoints else vis.api_endpoints),
         vision_model=vis.vision_model,
         caption_workers=vis.caption_workers,
         caption_in_flight=vis.caption_in_flight,
@@ -120,6 +192,24 @@ def apply_runtime_overrides(st: AppSettings) -> AppSettings:
         clip_min_sec=vis.clip_min_sec,
         clip_target_sec=vis.clip_target_sec,
         clip_max_sec=vis.clip_max_sec,
+        caption_global_cache=vis.caption_global_cache,
+        caption_global_cache_max_entries=vis.caption_global_cache_max_entries,
+        caption_cache_versions=vis.caption_cache_versions,
+        caption_refresh=vis.caption_refresh,
+        caption_payload_cache_mb=vis.caption_payload_cache_mb,
+        caption_hedge_enable=vis.caption_hedge_enable,
+        caption_hedge_budget=vis.caption_hedge_budget,
+        caption_endpoint_max_in_flight=vis.caption_endpoint_max_in_flight,
+        caption_dedup_enable=vis.caption_dedup_enable,
+        caption_dedup_max_hamming=vis.caption_dedup_max_hamming,
+        repeat_skip_enable=vis.repeat_skip_enable,
+        repeat_min_sec=vis.repeat_min_sec,
+        repeat_max_hamming=vis.repeat_max_hamming,
+        repeat_edge_sec=vis.repeat_edge_sec,
+        caption_mode=vis.caption_mode,
+        index_snapshot_every=vis.index_snapshot_every,
+        proxy_mode=vis.proxy_mode,
+        media_engine=vis.media_engine,
     )
 
     return AppSettings(embedding=st.embedding, vision=vis2, render=st.render)
@@ -166,11 +256,13 @@ def load_settings(*, apply_runtime: bool = True) -> AppSettings:
             embedding=EmbeddingSettings(
                 backend=str(emb.get("backend", "auto")),
                 model_id=str(emb.get("model_id", EmbeddingSettings().model_id)),
+                clip_model_id=str(emb.get("clip_model_id", "") or "").strip(),
             ),
             vision=VisionSettings(
                 backend=str(vis.get("backend", "auto")),
                 api_base=str(vis.get("api_base", "")),
                 api_key=str(vis.get("api_key", "")),
+                api_endpoints=_endpoint_list(vis.get("api_endpoints")),
                 vision_model=str(vis.get("vision_model", "")),
                 caption_workers=int(vis.get("caption_workers", 2) or 2),
                 caption_in_flight=int(vis.get("caption_in_flight", 8) or 8),
@@ -184,6 +276,24 @@ def load_settings(*, apply_runtime: bool = True) -> AppSettings:
                 clip_min_sec=_float_or_default(vis.get("clip_min_sec", 3.0), 3.0),
                 clip_target_sec=_float_or_default(vis.get("clip_target_sec", 4.5), 4.5),
                 clip_max_sec=_float_or_default(vis.get("clip_max_sec", 6.0), 6.0),
+                caption_global_cache=bool(vis.get("caption_global_cache", True)),
+                caption_global_cache_max_entries=_int_or_default(vis.get("caption_global_cache_max_entries", 50000), 50000),
+                caption_cache_versions=_int_or_default(vis.get("caption_cache_versions", 3), 3),
+                caption_refresh=str(vis.get("caption_refresh", "full") or "full").strip(),
+                caption_payload_cache_mb=_int_or_default(vis.get("caption_payload_cache_mb", 256), 256),
+                caption_hedge_enable=bool(vis.get("caption_hedge_enable", False)),
+                caption_hedge_budget=_float_or_default(vis.get("caption_hedge_budget", 0.1), 0.1),
+                caption_endpoint_max_in_flight=_int_or_default(vis.get("caption_endpoint_max_in_flight", 4), 4),
+                caption_dedup_enable=bool(vis.get("caption_dedup_enable", True)),
+                caption_dedup_max_hamming=_int_or_default(vis.get("caption_dedup_max_hamming", 4), 4),
+                repeat_skip_enable=bool(vis.get("repeat_skip_enable", False)),
+                repeat_min_sec=_float_or_default(vis.get("repeat_min_sec", 20.0), 20.0),
+                repeat_max_hamming=_int_or_default(vis.get("repeat_max_hamming", 6), 6),
+                repeat_edge_sec=_float_or_default(vis.get("repeat_edge_sec", 360.0), 360.0),
+                caption_mode=str(vis.get("caption_mode", "full") or "full").strip(),
+                index_snapshot_every=_int_or_default(vis.get("index_snapshot_every", 1), 1),
+                proxy_mode=str(vis.get("proxy_mode", "analysis") or "analysis").strip(),
+                media_engine=str(vis.get("media_engine", "auto") or "auto").strip(),
             ),
             render=RenderSettings(
                 keep_speed=bool(ren.get("keep_speed", True)),
@@ -206,6 +316,17 @@ def load_settings(*, apply_runtime: bool = True) -> AppSettings:
                 timeline_mode=str(ren.get("timeline_mode", "edgetts") or "edgetts").strip(),
                 bgm_volume=float(ren.get("bgm_volume", 0.12) or 0.12),
                 output_fps=int(ren.get("output_fps", 25) or 25),
+                lazy_caption_topk=_int_or_default(ren.get("lazy_caption_topk", 8), 8),
+                match_image_weight=_float_or_default(ren.get("match_image_weight", 0.5), 0.5),
+                render_workers=_int_or_default(ren.get("render_workers", 0), 0),
+                single_encode=bool(ren.get("single_encode", False)),
+                segment_cache_mb=_int_or_default(ren.get("segment_cache_mb", 4096), 4096),
+                draft_height=_int_or_default(ren.get("draft_height", 360), 360),
+                segment_group_max=_int_or_default(ren.get("segment_group_max", 6), 6),
+                mezzanine_min_uses=_int_or_default(ren.get("mezzanine_min_uses", 0), 0),
+                mezzanine_cache_mb=_int_or_default(ren.get("mezzanine_cache_mb", 20480), 20480),
+                draft_proxy_cache_mb=_int_or_default(ren.get("draft_proxy_cache_mb", 8192), 8192),
+                draft_proxy_at_index=bool(ren.get("draft_proxy_at_index", False)),
             ),
         )
         return apply_runtime_overrides(st) if apply_runtime else st
@@ -222,11 +343,13 @@ def save_settings(st: AppSettings) -> str:
         "embedding": {
             "backend": st.embedding.backend,
             "model_id": st.embedding.model_id,
+            "clip_model_id": str(st.embedding.clip_model_id),
         },
         "vision": {
             "backend": st.vision.backend,
             "api_base": st.vision.api_base,
             "api_key": st.vision.api_key,
+            "api_endpoints": list(st.vision.api_endpoints or []),
             "vision_model": st.vision.vision_model,
             "caption_workers": int(st.vision.caption_workers),
             "caption_in_flight": int(st.vision.caption_in_flight),
@@ -240,6 +363,24 @@ def save_settings(st: AppSettings) -> str:
             "clip_min_sec": float(st.vision.clip_min_sec),
             "clip_target_sec": float(st.vision.clip_target_sec),
             "clip_max_sec": float(st.vision.clip_max_sec),
+            "caption_global_cache": bool(st.vision.caption_global_cache),
+            "caption_global_cache_max_entries": int(st.vision.caption_global_cache_max_entries),
+            "caption_cache_versions": int(st.vision.caption_cache_versions),
+            "caption_refresh": str(st.vision.caption_refresh),
+            "caption_payload_cache_mb": int(st.vision.caption_payload_cache_mb),
+            "caption_hedge_enable": bool(st.vision.caption_hedge_enable),
+            "caption_hedge_budget": float(st.vision.caption_hedge_budget),
+            "caption_endpoint_max_in_flight": int(st.vision.caption_endpoint_max_in_flight),
+            "caption_dedup_enable": bool(st.vision.caption_dedup_enable),
+            "caption_dedup_max_hamming": int(st.vision.caption_dedup_max_hamming),
+            "repeat_skip_enable": bool(st.vision.repeat_skip_enable),
+            "repeat_min_sec": float(st.vision.repeat_min_sec),
+            "repeat_max_hamming": int(st.vision.repeat_max_hamming),
+            "repeat_edge_sec": float(st.vision.repeat_edge_sec),
+            "caption_mode": str(st.vision.caption_mode),
+            "index_snapshot_every": int(st.vision.index_snapshot_every),
+            "proxy_mode": str(st.vision.proxy_mode),
+            "media_engine": str(st.vision.media_engine),
         },
         "render": {
             "keep_speed": bool(getattr(st, "render", RenderSettings()).keep_speed),
@@ -261,6 +402,17 @@ def save_settings(st: AppSettings) -> str:
             "timeline_mode": str(getattr(st, "render", RenderSettings()).timeline_mode),
             "bgm_volume": float(getattr(st, "render", RenderSettings()).bgm_volume),
             "output_fps": int(getattr(st, "render", RenderSettings()).output_fps),
+            "lazy_caption_topk": int(getattr(st, "render", RenderSettings()).lazy_caption_topk),
+            "match_image_weight": float(getattr(st, "render", RenderSettings()).match_image_weight),
+            "render_workers": int(getattr(st, "render", RenderSettings()).render_workers),
+            "single_encode": bool(getattr(st, "render", RenderSettings()).single_encode),
+            "segment_cache_mb": int(getattr(st, "render", RenderSettings()).segment_cache_mb),
+            "draft_height": int(getattr(st, "render", RenderSettings()).draft_height),
+            "segment_group_max": int(getattr(st, "render", RenderSettings()).segment_group_max),
+            "mezzanine_min_uses": int(getattr(st, "render", RenderSettings()).mezzanine_min_uses),
+            "mezzanine_cache_mb": int(getattr(st, "render", RenderSettings()).mezzanine_cache_mb),
+            "draft_proxy_cache_mb": int(getattr(st, "render", RenderSettings()).draft_proxy_cache_mb),
+            "draft_proxy_at_index": bool(getattr(st, "render", RenderSettings()).draft_proxy_at_index),
         },
     }
     tmp = f"{path}.tmp"
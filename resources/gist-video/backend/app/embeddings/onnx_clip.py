@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.core.paths import default_paths
+from app.embeddings.onnx_m3e import _find_first_existing, _l2_normalize, _prepare_onnxruntime_dll_search
+
+
+# OpenAI CLIP / Chinese-CLIP preprocessing constants (RGB).
+_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32).reshape(1, 1, 3)
+_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32).reshape(1, 1, 3)
+
+
+def _resolve_clip_model(model_id_or_path: str) -> tuple[str, str, str]:
+    """
+    Resolve (vision.onnx, text.onnx, tokenizer.json) from a model dir.
+
+    Supported layouts (relative paths are relative to the app root):
+    - <dir>/vision.onnx + <dir>/text.onnx + <dir>/tokenizer.json
+    - <dir>/onnx/vision.onnx + <dir>/onnx/text.onnx (tokenizer.json in <dir> or <dir>/onnx)
+    - models/<name>/... for HF-style ids (e.g. "OFA-Sys/chinese-clip-vit-base-patch16")
+    """
+    raw = (model_id_or_path or "").strip()
+    if not raw:
+        raise RuntimeError("embedding.clip_model_id 为空（请填入图文向量 ONNX 模型目录）。")
+
+    root = default_paths().root
+    p = raw if os.path.isabs(raw) else os.path.join(root, raw)
+    p = os.path.abspath(p)
+    if os.path.isfile(p):
+        p = os.path.dirname(p)
+
+    name = raw.replace("\\", "/").strip().strip("/")
+    dirs = [p]
+    if name and not os.path.isabs(raw):
+        dirs.append(os.path.join(root, "models", *name.split("/")))
+        dirs.append(os.path.join(root, "models", name.split("/")[-1]))
+
+    for d in dirs:
+        for sub in (d, os.path.join(d, "onnx")):
+            vis = _find_first_existing([os.path.join(sub, "vision.onnx")])
+            txt = _find_first_existing([os.path.join(sub, "text.onnx")])
+            if not vis or not txt:
+                continue
+            tok = _find_first_existing([os.path.join(sub, "tokenizer.json"), os.path.join(d, "tokenizer.json")])
+            if not tok:
+                raise RuntimeError(
+                    "已找到图文向量模型，但未找到 tokenizer.json。\n"
+                    f"- 模型目录：{sub}\n"
+                    "请把 tokenizer.json 放在模型目录或其上级目录。"
+                )
+            return vis, txt, tok
+
+    raise RuntimeError(
+        "embedding.clip_model_id 无法解析为本地图文向量模型。\n"
+        f"- 当前配置：{raw}\n"
+        "- 期望文件：vision.onnx、text.onnx、tokenizer.json（同目录或 onnx/ 子目录）"
+    )
+
+
+def can_resolve_clip_model(model_id_or_path: str) -> bool:
+    try:
+        _resolve_clip_model(model_id_or_path)
+        return True
+    except Exception:
+        return False
+
+
+def _load_rgb_pil(path: str, size: int) -> np.ndarray | None:
+    try:
+        from PIL import Image  # type: ignore
+    except Exception:
+        return None
+    with Image.open(path) as im:
+        im = im.convert("RGB")
+        w, h = im.size
+        s = float(size) / float(max(1, min(w, h)))
+        nw, nh = max(size, int(round(w * s))), max(size, int(round(h * s)))
+        im = im.resize((nw, nh), Image.BICUBIC)
+        left, top = (nw - size) // 2, (nh - size) // 2
+        return np.asarray(im.crop((left, top, left + size, top + size)), dtype=np.uint8)
+
+
+def _load_rgb_ffmpeg(ffmpeg: str, path: str, size: int) -> np.ndarray | None:
+    p = subprocess.run(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-vf",
+            f"scale={size}:{size}:force_original_aspect_ratio=increase:flags=bicubic,crop={size}:{size}",
+            "-frames:v",
+            "1",
+            "-pix_fmt",
+            "rgb24",
+            "-f",
+            "rawvideo",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    n = size * size * 3
+    if p.returncode != 0 or len(p.stdout) < n:
+        return None
+    return np.frombuffer(p.stdout[:n], dtype=np.uint8).reshape(size, size, 3)
+
+
+@dataclass
+class OnnxClipEmbeddingProvider:
+    """
+    Local image-text dual encoder (CLIP / Chinese-CLIP style) via ONNX Runtime, CPU only.
+
+    Frames and narration text are embedded into the same space, so clips can be retrieved
+    without relay captions. Image decoding and inference batches run on a small thread pool.
+
+    Dependencies:
+    - onnxruntime (CPU)
+    - tokenizers
+    - numpy
+    - Pillow (optional; falls back to an ffmpeg decode per frame)
+    """
+
+    model_id: str
+    image_size: int = 224
+    max_length: int = 52
+    batch_size: int = 16
+    # Parallel image batches (0 = auto); ORT intra-op threads are split between them.
+    workers: int = 0
+    ffmpeg: str = ""
+    _vision: object | None = None
+    _text: object | None = None
+    _tok: object | None = None
+    _pad_id: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _workers(self) -> int:
+        n = int(self.workers or 0)
+        if n <= 0:
+            n = max(1, min(4, (os.cpu_count() or 2) // 2))
+        return n
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._vision is not None and self._text is not None and self._tok is not None:
+                return
+            try:
+                _prepare_onnxruntime_dll_search()
+                import onnxruntime as ort  # type: ignore
+                from tokenizers import Tokenizer  # type: ignore
+            except ModuleNotFoundError as e:
+                import sys
+
+                py = sys.executable or "python"
+                raise RuntimeError(
+                    f"缺少依赖：{e.name}。\n"
+                    f"当前 Python：{py}\n"
+                    f"请执行：\"{py}\" -m pip install onnxruntime tokenizers"
+                ) from e
+
+            vis_path, txt_path, tok_json = _resolve_clip_model(self.model_id)
+            tok = Tokenizer.from_file(tok_json)
+            try:
+                pid = tok.token_to_id("[PAD]")
+                self._pad_id = int(pid) if pid is not None else 0
+            except Exception:
+                self._pad_id = 0
+
+            so = ort.SessionOptions()
+            so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            so.intra_op_num_threads = max(1, (os.cpu_count() or 2) // self._workers())
+            self._vision = ort.InferenceSession(vis_path, sess_options=so, providers=["CPUExecutionProvider"])
+            self._text = ort.InferenceSession(txt_path, sess_options=so, providers=["CPUExecutionProvider"])
+            self._tok = tok
+
+    def _ffmpeg(self) -> str:
+        if not self.ffmpeg:
+            from app.core.ffmpeg import find_ffmpeg
+
+            self.ffmpeg = find_ffmpeg().ffmpeg
+        return self.ffmpeg
+
+    def _load_image(self, path: str) -> np.ndarray | None:
+        size = int(self.image_size)
+        rgb = None
+        try:
+            rgb = _load_rgb_pil(path, size)
+        except Exception:
+            rgb = None
+        if rgb is None:
+            rgb = _load_rgb_ffmpeg(self._ffmpeg(), path, size)
+        if rgb is None:
+            return None
+        x = (rgb.astype(np.float32) / 255.0 - _MEAN) / _STD
+        return x.transpose(2, 0, 1)
+
+    def _run_images(self, paths: list[str]) -> np.ndarray:
+        sess = self._vision
+        assert sess is not None
+        size = int(self.image_size)
+        imgs = [self._load_image(p) for p in paths]
+        ok = [i for i, x in enumerate(imgs) if x is not None]
+        if not ok:
+            return np.zeros((len(paths), 0), dtype=np.float32)
+        batch = np.stack([imgs[i] for i in ok]).astype(np.float32).reshape(len(ok), 3, size, size)
+        name = sess.get_inputs()[0].name
+        arr = np.asarray(sess.run(None, {name: batch})[0], dtype=np.float32)
+        if arr.ndim == 3:
+            # Token outputs: use the class token.
+            arr = arr[:, 0, :]
+        out = np.zeros((len(paths), arr.shape[1]), dtype=np.float32)
+        out[ok, :] = _l2_normalize(arr)
+        return out
+
+    def embed_images(self, paths: list[str]) -> np.ndarray:
+        """L2-normalized image vectors; unreadable images get zero rows."""
+        self._ensure_loaded()
+        if not paths:
+            return np.zeros((0, 0), dtype=np.float32)
+        bs = max(1, int(self.batch_size))
+        chunks = [paths[i : i + bs] for i in range(0, len(paths), bs)]
+        with ThreadPoolExecutor(max_workers=self._workers()) as ex:
+            parts = list(ex.map(self._run_images, chunks))
+        dim = max((int(p.shape[1]) for p in parts), default=0)
+        if dim <= 0:
+            return np.zeros((len(paths), 0), dtype=np.float32)
+        return np.concatenate(
+            [p if p.shape[1] == dim else np.zeros((p.shape[0], dim), dtype=np.float32) for p in parts], axis=0
+        )
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        self._ensure_loaded()
+        sess = self._text
+        assert sess is not None and self._tok is not None
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        max_len = max(8, min(512, int(self.max_length) or 52))
+        ins = sess.get_inputs()
+        names = [i.name for i in ins]
+        bs = max(1, int(self.batch_size))
+        vecs: list[np.ndarray] = []
+        for i in range(0, len(texts), bs):
+            batch = [(" " if not (t or "").strip() else str(t)) for t in texts[i : i + bs]]
+            encs = self._tok.encode_batch(batch)  # type: ignore[attr-defined]
+            ids = np.full((len(encs), max_len), int(self._pad_id), dtype=np.int64)
+            att = np.zeros((len(encs), max_len), dtype=np.int64)
+            for j, e in enumerate(encs):
+                toks = list(getattr(e, "ids", []) or [])[:max_len]
+                ids[j, : len(toks)] = np.asarray(toks, dtype=np.int64)
+                att[j, : len(toks)] = 1
+            # Chinese-CLIP exports take a single "text" input; HF-style exports take input_ids/attention_mask.
+            feed: dict[str, np.ndarray] = {}
+            for n in names:
+                feed[n] = att if "mask" in n.lower() else ids
+            arr = np.asarray(sess.run(None, feed)[0], dtype=np.float32)
+            if arr.ndim == 3:
+                arr = arr[:, 0, :]
+            vecs.append(_l2_normalize(arr))
+
+        out = np.concatenate(vecs, axis=0)
+        for idx, t in enumerate(texts):
+            if not (t or "").strip():
+                out[idx, :] = 0.0
+        return out
+
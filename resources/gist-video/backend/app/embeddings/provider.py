@@ -50,3 +50,14 @@ def get_embedding_provider() -> EmbeddingProvider:
     # Fallback: lightweight local hashing (no heavy deps).
     return LocalHashEmbeddingProvider()
 
+
+def get_image_embedding_provider(*, ffmpeg: str = "") -> object | None:
+    """Local image-text (CLIP-style) provider from embedding.clip_model_id, or None when not configured."""
+    mid = str(load_settings().embedding.clip_model_id or "").strip()
+    if not mid:
+        return None
+    from app.embeddings.onnx_clip import OnnxClipEmbeddingProvider, can_resolve_clip_model
+
+    if not can_resolve_clip_model(mid):
+        return None
+    return OnnxClipEmbeddingProvider(model_id=mid, ffmpeg=ffmpeg)
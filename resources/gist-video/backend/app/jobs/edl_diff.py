@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import difflib
+import json
+import os
+import shutil
+
+
+def _norm(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path or ""))
+
+
+def find_previous_render(jobs_dir: str, job_id: str, output_path: str) -> tuple[str, dict] | None:
+    """
+    Newest earlier render job of the project that wrote the same output and recorded its segment keys
+    (edl.json "outputs" entries). Returns (job_dir, {"segment_keys", "segment_files", ...}) or None.
+    """
+    try:
+        names = sorted((n for n in os.listdir(jobs_dir) if n.startswith("render_") and n != job_id), reverse=True)
+    except OSError:
+        return None
+    want = _norm(output_path)
+    for name in names:
+        d = os.path.join(jobs_dir, name)
+        try:
+            with open(os.path.join(d, "edl.json"), "r", encoding="utf-8") as f:
+                edl = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(edl, dict):
+            continue
+        for out in edl.get("outputs") or []:
+            if not isinstance(out, dict) or _norm(str(out.get("output_path") or "")) != want:
+                continue
+            if isinstance(out.get("segment_keys"), list):
+                return d, out
+    return None
+
+
+def diff_segments(prev_keys: list[str], keys: list[str]) -> tuple[dict[int, int], list[tuple[int, int]]]:
+    """
+    Align the new segment keys with the previous render's.
+
+    Returns ({new index: previous index} for unchanged segments, [(start, end)] new-index ranges that
+    must be re-rendered). Inserting or deleting a line only shifts the segments after it, which still match.
+    """
+    sm = difflib.SequenceMatcher(None, list(prev_keys), list(keys), autojunk=False)
+    same: dict[int, int] = {}
+    changed: list[tuple[int, int]] = []
+    for tag, a0, a1, b0, b1 in sm.get_opcodes():
+        if tag == "equal":
+            for k in range(b1 - b0):
+                same[b0 + k] = a0 + k
+        elif b1 > b0:
+            changed.append((b0, b1))
+    return same, changed
+
+
+def reuse_segment_file(src: str, dst: str) -> bool:
+    """Hard-link (else copy) a previous render's segment into place; False when it is gone."""
+    if _norm(src) == _norm(dst):
+        return os.path.isfile(dst)
+    if os.path.isfile(dst):
+        return True
+    if not os.path.isfile(src):
+        return False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".part"
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import math
+import os
+import queue
+import threading
+
+from app.core.ffmpeg import run_cmd
+
+
+class HlsPreview:
+    """
+    Growing HLS (EVENT) playlist of a render in progress: <job_dir>/preview/index.m3u8.
+
+    Rendered segments are published strictly in timeline order: each one is remuxed (video stream copy)
+    with its slice of the narration audio into preview/seg_NNNNN.ts, timestamps offset to its timeline
+    position, then appended to the playlist. Publishing runs on its own thread and never fails the
+    render: on error the preview stops with a warning.
+    """
+
+    def __init__(
+        self,
+        ffmpeg: str,
+        job_dir: str,
+        *,
+        voice_audio_path: str,
+        durations: list[float],
+        log,
+        cancel_evt=None,
+    ) -> None:
+        self.ffmpeg = ffmpeg
+        self.dir = os.path.join(job_dir, "preview")
+        self.playlist = os.path.join(self.dir, "index.m3u8")
+        self.voice_audio_path = voice_audio_path
+        self.durations = [max(0.001, float(d)) for d in durations]
+        self.log = log
+        self.cancel_evt = cancel_evt
+        # EVENT playlists must not change TARGETDURATION: fix it from the longest segment up front.
+        self.target = max(1, math.ceil(max(self.durations, default=1.0)))
+        self._entries: list[str] = []
+        self._next = 0
+        self._failed = False
+        self._q: "queue.Queue[tuple[int, str, float] | None]" = queue.Queue()
+        os.makedirs(self.dir, exist_ok=True)
+        self._write(ended=False)
+        self._thread = threading.Thread(target=self._loop, name="hls-preview", daemon=True)
+        self._thread.start()
+
+    def publish(self, i: int, seg_ts: str, t_offset: float) -> None:
+        """Queue segment `i` (call in timeline order, each index once)."""
+        if not self._failed:
+            self._q.put((int(i), seg_ts, float(t_offset)))
+
+    def finish(self, *, ended: bool = True) -> None:
+        """Drain the queue and close the playlist (#EXT-X-ENDLIST when `ended`)."""
+        self._q.put(None)
+        self._thread.join()
+        if not self._failed:
+            self._write(ended=ended)
+
+    def _write(self, *, ended: bool) -> None:
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{self.target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            *self._entries,
+        ]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        tmp = self.playlist + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.playlist)
+
+    def _loop(self) -> None:
+        while True:
+            job = self._q.get()
+            if job is None:
+                return
+            if self._failed:
+                continue
+            i, seg_ts, t_offset = job
+            try:
+                self._publish_one(i, seg_ts, t_offset)
+            except Exception as e:
+                self._failed = True
+                if self.cancel_evt is None or not self.cancel_evt.is_set():
+                    self.log(f"WARNING: HLS preview stopped: {e}")
+
+    def _publish_one(self, i: int, seg_ts: str, t_offset: float) -> None:
+        if i != self._next:
+            raise RuntimeError(f"preview segment out of order: {i} (expected {self._next})")
+        dur = self.durations[i]
+        name = f"seg_{i:05d}.ts"
+        out = os.path.join(self.dir, name)
+        tmp = out + ".part"
+        run_cmd(
+            [
+                self.ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-y",
+                "-i",
+                seg_ts,
+                "-ss",
+                f"{t_offset:.3f}",
+                "-t",
+                f"{dur:.3f}",
+                "-i",
+                self.voice_audio_path,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-c:v",
+                "copy",
+                "-c:a",
+                "aac",
+                "-b:a",
+                "128k",
+                "-t",
+                f"{dur:.3f}",
+                # Continuous timestamps across playlist entries.
+                "-output_ts_offset",
+                f"{t_offset:.3f}",
+                "-f",
+                "mpegts",
+                tmp,
+            ],
+            cancel_evt=self.cancel_evt,
+        )
+        os.replace(tmp, out)
+        self._entries += [f"#EXTINF:{dur:.3f},", name]
+        self._next = i + 1
+        self._write(ended=False)
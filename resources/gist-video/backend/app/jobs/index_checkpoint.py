@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+
+from app.core.util import atomic_write_json
+
+
+# Rows kept in a shard: slicing geometry + extracted frames. Caption text lives in frame_captions.json
+# and is re-applied on resume, so a shard stays valid across caption model changes.
+_ROW_KEYS = ("clip_id", "source_path", "start", "end", "shot_id", "shot_start", "shot_end", "frames")
+
+
+def video_signature(video_path: str, params: dict) -> str:
+    """Stable id of (source file identity, slicing/extraction params); a shard is reused only when it matches."""
+    try:
+        st = os.stat(video_path)
+        ident = [os.path.abspath(video_path), int(st.st_size), int(st.st_mtime_ns)]
+    except OSError:
+        ident = [os.path.abspath(video_path), 0, 0]
+    raw = json.dumps({"video": ident, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class IndexCheckpointStore:
+    """
+    Per-video index checkpoint shards in index/checkpoints/:
+      vNNNN.json        {"signature", "status": "partial" | "done", "slices": [...], "updated_at"}
+      vNNNN.rows.jsonl  one row per clip whose frames were fully extracted, in order (append-only)
+
+    `slices` are the clip windows of the video (so a resumed run skips proxy/probe/scene detection).
+    A row is appended as soon as its clip is done, so a restart resumes from the last completed clip;
+    a torn last line (crash mid-write) is ignored.
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        self.dir = os.path.join(index_dir, "checkpoints")
+
+    def _path(self, vkey: str) -> str:
+        return os.path.join(self.dir, f"{vkey}.json")
+
+    def _rows_path(self, vkey: str) -> str:
+        return os.path.join(self.dir, f"{vkey}.rows.jsonl")
+
+    def _read_rows(self, vkey: str) -> list[dict]:
+        rows: list[dict] = []
+        try:
+            with open(self._rows_path(vkey), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        break
+                    if not isinstance(r, dict):
+                        break
+                    rows.append(r)
+        except OSError:
+            pass
+        return rows
+
+    def load(self, vkey: str, signature: str) -> dict | None:
+        try:
+            with open(self._path(vkey), "r", encoding="utf-8") as f:
+                ck = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(ck, dict) or str(ck.get("signature") or "") != signature:
+            return None
+        if not isinstance(ck.get("slices"), list):
+            return None
+        ck["rows"] = self._read_rows(vkey)
+        return ck
+
+    def _write_header(self, vkey: str, signature: str, *, status: str, slices: list[dict]) -> None:
+        atomic_write_json(
+            self._path(vkey),
+            {"signature": signature, "status": status, "slices": slices, "updated_at": time.time()},
+        )
+
+    def begin(self, vkey: str, signature: str, *, slices: list[dict], rows: list[dict]) -> None:
+        """Start (or resume) a video: rewrite its rows file to exactly `rows`, mark it partial."""
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._rows_path(vkey)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            for r in rows:
+                f.write(json.dumps({k: r[k] for k in _ROW_KEYS if k in r}, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+        self._write_header(vkey, signature, status="partial", slices=slices)
+
+    def append_row(self, vkey: str, row: dict) -> None:
+        """Persist one completed clip (flushed to the OS before returning)."""
+        with open(self._rows_path(vkey), "a", encoding="utf-8", newline="\n") as f:
+            f.write(json.dumps({k: row[k] for k in _ROW_KEYS if k in row}, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def finish(self, vkey: str, signature: str, *, slices: list[dict]) -> None:
+        self._write_header(vkey, signature, status="done", slices=slices)
+
+    def prune(self, keep_vkeys: set[str]) -> None:
+        """Drop shards of videos no longer in the project (by position key)."""
+        try:
+            names = os.listdir(self.dir)
+        except OSError:
+            return
+        for name in names:
+            if (name.endswith(".json") or name.endswith(".rows.jsonl")) and name.split(".", 1)[0] not in keep_vkeys:
+                try:
+                    os.remove(os.path.join(self.dir, name))
+                except OSError:
+                    pass
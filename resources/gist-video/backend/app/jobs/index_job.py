@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import json
 import os
 import re
 import time
@@ -9,10 +11,20 @@ from dataclasses import dataclass
 import numpy as np
 
 from app.core.ffmpeg import find_ffmpeg, run_cmd
+from app.core.media_engine import DecodedFrame, FFmpegCliEngine, MediaEngine, get_media_engine
 from app.core.project_store import ProjectStore
 from app.core.settings import load_settings
 from app.core.util import atomic_write_json, check_cancel, pct, wait_if_paused
-from app.embeddings.provider import get_embedding_provider
+from app.embeddings.provider import get_embedding_provider, get_image_embedding_provider
+from app.jobs.index_checkpoint import IndexCheckpointStore, video_signature
+from app.jobs.index_snapshot import clear_snapshots, publish_snapshot
+from app.jobs.mezzanine import schedule_mezzanine
+from app.jobs.render_proxy import RenderProxyCache
+from app.jobs.repeat_detect import find_repeats, proxy_fingerprints, subtract_ranges
+from app.vision.caption_store import CaptionVersionStore, GlobalCaptionCache, file_digest
+from app.vision.caption_text import BLOCK_FLAGS, flags_from_caps, merge_caps
+from app.vision.payload_cache import configure_payload_cache
+from app.vision.phash import ClipHashIndex, FrameHashStore, dhash_gray
 from app.vision.provider import get_caption_provider
 
 
@@ -25,7 +37,7 @@ class IndexJobRequest:
     frames_per_clip: int = 3
     fixed_clip_sec_fallback: float = 4.0
     # Slicing overrides (None = use settings.json defaults).
-    slice_mode: str | None = None  # "scene" | "fixed"
+    slice_mode: str | None = None  # "scene" | "fixed" | "keyframe" (fast preview)
     scene_threshold: float | None = None
     scene_fps: float | None = None
     min_clip_sec: float | None = None
@@ -42,13 +54,56 @@ class IndexJobRequest:
     # Filter overrides (None = use settings.json defaults).
     skip_head_sec: int | None = None
     skip_tail_sec: int | None = None
+    # Drop openings/endings/recaps repeated across episodes (None = vision.repeat_skip_enable).
+    skip_repeats: bool | None = None
     caption_flush_every: int = 10
+    # Caption refresh after a cache_key change (None = settings.json default):
+    # "full" re-captions everything; "on_demand" keeps older-version captions as provisional text.
+    caption_refresh: str | None = None
+    # Clips to (re-)caption first regardless of provisional captions (e.g. shortlisted by a render).
+    recaption_clip_ids: tuple[str, ...] | None = None
+    # "full" | "lazy" (None = vision.caption_mode). Lazy leaves most clips caption_pending for render time.
+    caption_mode: str | None = None
+    # "analysis" | "keyframes" | "full" (None = vision.proxy_mode).
+    proxy_mode: str | None = None
+
+
+def _proxy_path(vcache: str, *, mode: str, fps: float) -> str:
+    """
+    Proxy file for a proxy mode. A legacy full-rate proxy.mp4, when present, serves every mode.
+    Analysis proxies are keyed by their frame rate so raising scene_fps rebuilds them.
+    """
+    full = os.path.join(vcache, "proxy.mp4")
+    if mode == "full" or os.path.isfile(full):
+        return full
+    if mode == "keyframes":
+        return os.path.join(vcache, "proxy_key.mp4")
+    return os.path.join(vcache, f"proxy_{float(fps):g}fps.mp4")
+
 
+def _ensure_proxy(ffmpeg: str, src: str, dst: str, *, proxy_height: int, log, mode: str = "full", fps: float = 0.0) -> None:
+    """
+    Build the silent low-res proxy used by scene detection and fingerprinting.
 
-def _ensure_proxy(ffmpeg: str, src: str, dst: str, *, proxy_height: int, log) -> None:
+    - full: every frame (legacy).
+    - analysis: the decoder skips non-reference frames and only `fps` frames/s are kept and encoded.
+    - keyframes: non-key packets are discarded at the demuxer and skipped by the decoder
+      (cuts snap to source keyframes; fastest on long-GOP sources).
+    """
     if os.path.isfile(dst):
         return
     os.makedirs(os.path.dirname(dst), exist_ok=True)
+    in_opts: list[str] = []
+    vf = f"scale=-2:{proxy_height}"
+    out_opts: list[str] = []
+    if mode == "keyframes":
+        in_opts = ["-discard", "nokey", "-skip_frame", "nokey"]
+        out_opts = ["-vsync", "vfr", "-crf", "30"]
+    elif mode == "analysis":
+        in_opts = ["-skip_frame", "nonref"]
+        vf = f"fps={max(0.5, float(fps)):.3f},{vf}"
+        out_opts = ["-crf", "30"]
+    tmp = dst + ".part.mp4"
     run_cmd(
         [
             ffmpeg,
@@ -56,19 +111,25 @@ def _ensure_proxy(ffmpeg: str, src: str, dst: str, *, proxy_height: int, log) ->
             "-loglevel",
             "error",
             "-y",
+            *in_opts,
             "-i",
             src,
             "-vf",
-            f"scale=-2:{proxy_height}",
+            vf,
             "-an",
+            "-sn",
+            "-dn",
             "-c:v",
             "libx264",
             "-preset",
             "ultrafast",
-            dst,
+            *out_opts,
+            tmp,
         ],
         log_fn=log,
     )
+    # Publish only complete proxies (an interrupted encode would otherwise be reused).
+    os.replace(tmp, dst)
 
 
 def _probe_duration(ffprobe: str, path: str) -> float:
@@ -105,6 +166,60 @@ def _fixed_slices(duration: float, *, clip_sec: float) -> list[tuple[float, floa
     return out
 
 
+def _keyframe_times(ffprobe: str, src: str) -> list[float]:
+    """Keyframe timestamps of the first video stream, from packet flags (demux only, no decode)."""
+    import subprocess
+
+    p = subprocess.run(
+        [
+            ffprobe,
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            src,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if p.returncode != 0:
+        raise RuntimeError(_decode_process_output(p.stderr).strip() or f"ffprobe packets failed ({p.returncode})")
+    out: set[float] = set()
+    for line in _decode_process_output(p.stdout).splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or "K" not in parts[1]:
+            continue
+        try:
+            out.add(round(float(parts[0]), 3))
+        except ValueError:
+            continue
+    return sorted(out)
+
+
+def _keyframe_slices(kts: list[float], duration: float, *, target_sec: float, max_sec: float) -> list[tuple[float, float]]:
+    """
+    Group consecutive keyframe intervals into ~target_sec slices (fast preview mode).
+    Intervals longer than max_sec (long GOPs) are split evenly.
+    """
+    pts = sorted({0.0, *[t for t in kts if 0.0 < t < duration - 0.05], float(duration)})
+    out: list[tuple[float, float]] = []
+    a = pts[0]
+    for b, nxt in zip(pts[1:], pts[2:] + [None]):
+        if nxt is not None and (b - a) < target_sec and (nxt - a) <= max_sec:
+            continue
+        n = max(1, int(-(-(b - a) // max(0.5, max_sec))))
+        step = (b - a) / n
+        for k in range(n):
+            if step >= 0.5:
+                out.append((round(a + k * step, 3), round(a + (k + 1) * step, 3)))
+        a = b
+    return out
+
+
 def _decode_process_output(b: bytes) -> str:
     if not b:
         return ""
@@ -122,7 +237,7 @@ _PTS_TIME_RE = re.compile(r"pts_time:([0-9]+(?:\\.[0-9]+)?)")
 def _scene_cut_times(ffmpeg: str, proxy_path: str, *, threshold: float, fps: float, log) -> list[float]:
     """
     Run ffmpeg scene detection on the proxy video and return cut times (seconds).
-    This is intentionally run on proxy.mp4 (low-res, silent) to stay friendly on low-end CPUs.
+    This is intentionally run on the analysis proxy (low-res, low-fps, silent) to stay friendly on low-end CPUs.
     """
     import subprocess
 
@@ -345,49 +460,61 @@ def _pick_frame_times(start: float, end: float, n: int) -> list[float]:
     return [start + span * (k / (n + 1)) for k in range(1, n + 1)]
 
 
-def _extract_frame(ffmpeg: str, src: str, t: float, out_jpg: str, *, log) -> None:
-    if os.path.isfile(out_jpg):
-        return
-    os.makedirs(os.path.dirname(out_jpg), exist_ok=True)
-    run_cmd(
-        [
-            ffmpeg,
-            "-hide_banner",
-            "-loglevel",
-            "error",
-            "-y",
-            "-ss",
-            f"{t:.3f}",
-            "-i",
-            src,
-            "-vf",
-            "scale=640:-2",
-            # Avoid "image sequence pattern" warnings when writing a single JPG.
-            "-update",
-            "1",
-            "-frames:v",
-            "1",
-            "-q:v",
-            "4",
-            out_jpg,
-        ],
-        log_fn=log,
-    )
-
-
-def _load_caption_cache(path: str) -> dict[str, str]:
-    if not os.path.isfile(path):
-        return {}
+def _clip_image_vectors(clips_meta: list[dict], index_dir: str, img_emb, *, log, cancel_evt) -> np.ndarray:
+    """
+    One image vector per clip: mean of its frame vectors (re-normalized). Rows of the previous
+    clip_image_vectors.npy are reused for clips whose frame list is unchanged (same model, files not newer).
+    """
+    npy_path = os.path.join(index_dir, "clip_image_vectors.npy")
+    model_id = str(getattr(img_emb, "model_id", "") or "")
+    prev: dict[tuple[str, ...], np.ndarray] = {}
     try:
-        import json
-
-        with open(path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-        if isinstance(raw, dict):
-            return {str(k): str(v) for k, v in raw.items()}
+        with open(os.path.join(index_dir, "clips.json"), "r", encoding="utf-8") as f:
+            old = json.load(f)
+        old_img = (old.get("embedding") or {}).get("image") or {}
+        if str(old_img.get("model_id") or "") == model_id and os.path.isfile(npy_path):
+            old_vecs = np.load(npy_path)
+            mtime = os.path.getmtime(npy_path)
+            for i, c in enumerate(old.get("clips") or []):
+                frames = tuple(str(p) for p in (c.get("frames") or []))
+                if i < old_vecs.shape[0] and frames and all(os.path.getmtime(p) <= mtime for p in frames if os.path.isfile(p)):
+                    prev[frames] = old_vecs[i]
     except Exception:
-        pass
-    return {}
+        prev = {}
+
+    rows: list[np.ndarray | None] = []
+    todo: list[int] = []
+    for ci, c in enumerate(clips_meta):
+        row = prev.get(tuple(str(p) for p in (c.get("frames") or [])))
+        rows.append(row)
+        if row is None:
+            todo.append(ci)
+    log(f"Image embedding: {len(clips_meta) - len(todo)} clips reused, {len(todo)} to embed ({type(img_emb).__name__})")
+
+    # Embed in chunks so cancel stays responsive on long projects.
+    chunk = 64
+    for k in range(0, len(todo), chunk):
+        check_cancel(cancel_evt)
+        idxs = todo[k : k + chunk]
+        paths: list[str] = []
+        spans: list[tuple[int, int]] = []
+        for ci in idxs:
+            fs = [p for p in (clips_meta[ci].get("frames") or []) if os.path.isfile(p)]
+            spans.append((len(paths), len(paths) + len(fs)))
+            paths.extend(fs)
+        vecs = img_emb.embed_images(paths) if paths else np.zeros((0, 0), dtype=np.float32)
+        for ci, (a, b) in zip(idxs, spans):
+            if b > a and vecs.ndim == 2 and vecs.shape[1] > 0:
+                m = vecs[a:b].mean(axis=0)
+                n = float(np.linalg.norm(m))
+                rows[ci] = (m / n if n > 1e-8 else m).astype(np.float32)
+
+    dim = max((int(r.shape[0]) for r in rows if r is not None), default=0)
+    out = np.zeros((len(clips_meta), dim), dtype=np.float32)
+    for ci, r in enumerate(rows):
+        if r is not None and int(r.shape[0]) == dim:
+            out[ci] = r
+    return out
 
 
 @dataclass
@@ -406,6 +533,934 @@ class _PendingCaptionBatch:
     mode: str = "frames"  # "frames" | "clips"
 
 
+def _is_missing_caption(v: str | None) -> bool:
+    if v is None:
+        return True
+    v2 = (v or "").strip()
+    if not v2:
+        return True
+    return v2.startswith("__FAILED__")
+
+
+@dataclass(frozen=True)
+class _SliceParams:
+    """Slicing/extraction parameters of one index run (request overrides applied over settings)."""
+
+    mode: str  # "scene" | "fixed" | "keyframe"
+    scene_threshold: float
+    scene_fps: float
+    min_clip_sec: float
+    target_clip_sec: float
+    max_clip_sec: float
+    fixed_clip_sec: float
+    frames_per_clip: int
+    skip_head: int
+    skip_tail: int
+    proxy_height: int
+    proxy_mode: str  # "full" | "analysis" | "keyframes"
+
+    @property
+    def proxy_fps(self) -> float:
+        # Analysis proxies only carry what scene scan (scene_fps) and fingerprinting (1 fps) sample.
+        return round(max(1.0, self.scene_fps), 3)
+
+    @property
+    def frames_sub(self) -> str:
+        # Fast preview slicing: keyframes only, frames kept apart so a later scene run never reuses them by name.
+        return "frames_kf" if self.mode == "keyframe" else "frames"
+
+    def signature(self) -> dict:
+        """Checkpoint params: a video's shard is reused only while these (and its repeats) are unchanged."""
+        return {
+            "slice_mode": self.mode,
+            "scene_threshold": self.scene_threshold,
+            "scene_fps": self.scene_fps,
+            "clip_sec": [self.min_clip_sec, self.target_clip_sec, self.max_clip_sec],
+            "fixed_clip_sec": self.fixed_clip_sec,
+            "frames_per_clip": self.frames_per_clip,
+            "skip": [self.skip_head, self.skip_tail],
+            "proxy_height": self.proxy_height,
+            "proxy_mode": self.proxy_mode,
+        }
+
+
+def _slice_params(req: IndexJobRequest, st) -> _SliceParams:
+    proxy_mode = str(req.proxy_mode or getattr(st, "proxy_mode", "analysis") or "analysis").strip().lower()
+    if proxy_mode not in ("full", "analysis", "keyframes"):
+        proxy_mode = "analysis"
+    skip_head = int(req.skip_head_sec) if req.skip_head_sec is not None else int(getattr(st, "skip_head_sec", 60) or 0)
+    skip_tail = int(req.skip_tail_sec) if req.skip_tail_sec is not None else int(getattr(st, "skip_tail_sec", 60) or 0)
+    return _SliceParams(
+        mode=str((req.slice_mode if req.slice_mode is not None else st.slice_mode) or "scene").strip().lower(),
+        scene_threshold=float(req.scene_threshold if req.scene_threshold is not None else st.scene_threshold),
+        scene_fps=float(req.scene_fps if req.scene_fps is not None else st.scene_fps),
+        min_clip_sec=float(req.min_clip_sec if req.min_clip_sec is not None else st.clip_min_sec),
+        target_clip_sec=float(req.target_clip_sec if req.target_clip_sec is not None else st.clip_target_sec),
+        max_clip_sec=float(req.max_clip_sec if req.max_clip_sec is not None else st.clip_max_sec),
+        fixed_clip_sec=float(req.fixed_clip_sec_fallback),
+        frames_per_clip=int(req.frames_per_clip),
+        skip_head=max(0, skip_head),
+        skip_tail=max(0, skip_tail),
+        proxy_height=int(req.proxy_height),
+        proxy_mode=proxy_mode,
+    )
+
+
+def _caption_concurrency(req: IndexJobRequest, st, cap) -> tuple[int, int, int]:
+    """(workers, in_flight, endpoints): the concurrency clamp scales with the relay endpoint pool (each has its own cap)."""
+    cap_workers = int(req.caption_workers if req.caption_workers is not None else st.caption_workers)
+    cap_in_flight = int(req.caption_in_flight if req.caption_in_flight is not None else st.caption_in_flight)
+    n_endpoints = 1
+    try:
+        fn = getattr(cap, "endpoint_count", None)
+        n_endpoints = max(1, int(fn() or 1)) if callable(fn) else 1
+    except Exception:
+        n_endpoints = 1
+    if n_endpoints > 1:
+        capacity = int(getattr(cap, "endpoint_capacity", lambda: 0)() or 0)
+        if req.caption_workers is None:
+            cap_workers = max(cap_workers, capacity)
+        if req.caption_in_flight is None:
+            cap_in_flight = max(cap_in_flight, 2 * capacity)
+    cap_workers = max(1, min(8 * n_endpoints, cap_workers))
+    cap_in_flight = max(1, min(32 * n_endpoints, cap_in_flight))
+    return cap_workers, cap_in_flight, n_endpoints
+
+
+def _source_duration(ffprobe: str, video_path: str, proxy: str) -> float:
+    try:
+        return _probe_duration(ffprobe, video_path)
+    except Exception:
+        if not proxy:
+            raise
+        return _probe_duration(ffprobe, proxy)
+
+
+def _detect_repeats(
+    bins,
+    videos: list[str],
+    sp: _SliceParams,
+    st,
+    *,
+    cache_dir: str,
+    index_dir: str,
+    progress,
+    log,
+    pause_evt,
+    cancel_evt,
+) -> dict[int, list[tuple[float, float, str]]]:
+    """
+    Cross-episode repeats (OP/ED/recaps) per 1-based video number: a cheap local fingerprint pass over the
+    proxies so they never get extracted/captioned. Writes index/repeats.json; on failure nothing is skipped.
+    """
+    total = len(videos)
+    repeat_ranges: dict[int, list[tuple[float, float, str]]] = {}
+    try:
+        fingerprints: list[np.ndarray] = []
+        durations: list[float] = []
+        for vi, video_path in enumerate(videos, start=1):
+            wait_if_paused(pause_evt, cancel_evt)
+            check_cancel(cancel_evt)
+            progress(0, f"重复片段检测：指纹 {vi}/{total}…")
+            proxy = _proxy_path(os.path.join(cache_dir, f"v{vi:04d}"), mode=sp.proxy_mode, fps=sp.proxy_fps)
+            _ensure_proxy(bins.ffmpeg, video_path, proxy, proxy_height=sp.proxy_height, log=log, mode=sp.proxy_mode, fps=sp.proxy_fps)
+            fingerprints.append(proxy_fingerprints(bins.ffmpeg, proxy))
+            durations.append(_source_duration(bins.ffprobe, video_path, proxy))
+        found = find_repeats(
+            fingerprints,
+            durations,
+            min_sec=float(getattr(st, "repeat_min_sec", 20.0)),
+            max_hamming=int(getattr(st, "repeat_max_hamming", 6)),
+            edge_sec=float(getattr(st, "repeat_edge_sec", 360.0)),
+        )
+        report: dict[str, list[dict]] = {}
+        for vi, ranges in enumerate(found, start=1):
+            if not ranges:
+                continue
+            repeat_ranges[vi] = ranges
+            report[videos[vi - 1]] = [{"start": a, "end": b, "kind": k} for a, b, k in ranges]
+            desc = ", ".join(f"{k} {a:.0f}-{b:.0f}s" for a, b, k in ranges)
+            log(f"[{vi}/{total}] 跳过重复片段: {desc}")
+        atomic_write_json(os.path.join(index_dir, "repeats.json"), report)
+        skipped = sum(b - a for rs in repeat_ranges.values() for a, b, _k in rs)
+        log(f"Repeat detection: {len(repeat_ranges)}/{total} videos, {skipped:.0f}s excluded before captioning")
+    except Exception as e:
+        check_cancel(cancel_evt)
+        log(f"WARNING: 重复片段检测失败（忽略，继续索引）：{e}")
+        return {}
+    return repeat_ranges
+
+
+def _trim_slices(shots: list[tuple[float, float]], dur: float, sp: _SliceParams, repeats: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    if sp.skip_head or sp.skip_tail:
+        shots = _clamp_slices(shots, start=float(sp.skip_head), end=max(0.0, float(dur) - float(sp.skip_tail)))
+    if repeats:
+        shots = subtract_ranges(shots, repeats)
+    return shots
+
+
+def _plain_clips(shots: list[tuple[float, float]]) -> list[dict]:
+    return [{"start": float(s), "end": float(e), "shot_id": i, "shot_start": float(s), "shot_end": float(e)} for i, (s, e) in enumerate(shots)]
+
+
+def _slice_video(bins, video_path: str, proxy: str, sp: _SliceParams, *, repeats: list[tuple[float, float]], stage, log) -> list[dict]:
+    """
+    Clip windows of one video (scene cuts, keyframes or fixed windows), minus skip_head/skip_tail and
+    detected repeats. `stage(msg)` reports the current step.
+    """
+    is_scene = sp.mode == "scene"
+    kts: list[float] = []
+    if is_scene:
+        # Fixed slicing only needs the duration, which comes from the source.
+        stage("生成代理视频…")
+        _ensure_proxy(bins.ffmpeg, video_path, proxy, proxy_height=sp.proxy_height, log=log, mode=sp.proxy_mode, fps=sp.proxy_fps)
+
+    stage("分析时长/切片…")
+    dur = _source_duration(bins.ffprobe, video_path, proxy if is_scene else "")
+    if is_scene:
+        try:
+            shots = _scene_raw_slices(bins.ffmpeg, proxy, dur, threshold=sp.scene_threshold, fps=sp.scene_fps, log=log)
+        except Exception as e:
+            log(f"WARNING: 场景识别切片失败，回退固定切片。原因: {e}")
+            shots = _fixed_slices(dur, clip_sec=sp.fixed_clip_sec)
+    elif sp.mode == "keyframe":
+        try:
+            kts = _keyframe_times(bins.ffprobe, video_path)
+            shots = _keyframe_slices(kts, dur, target_sec=sp.target_clip_sec, max_sec=sp.max_clip_sec)
+            log(f"Keyframe scan: keyframes={len(kts)}, slices={len(shots)}")
+        except Exception as e:
+            log(f"WARNING: 关键帧读取失败，回退固定切片。原因: {e}")
+            shots = _fixed_slices(dur, clip_sec=sp.fixed_clip_sec)
+    else:
+        shots = _fixed_slices(dur, clip_sec=sp.fixed_clip_sec)
+    shots = _trim_slices(shots, dur, sp, repeats)
+
+    # Build index clips INSIDE each shot so index granularity is still ~3-6s but never crosses a real cut.
+    if is_scene:
+        clips = _window_clips_from_shots(shots, min_sec=sp.min_clip_sec, target_sec=sp.target_clip_sec, max_sec=sp.max_clip_sec)
+    else:
+        clips = _plain_clips(shots)
+    if kts:
+        # Fast preview: frames are taken at the keyframes inside each slice (cheapest seeks).
+        for c in clips:
+            c["keyframes"] = [t for t in kts if float(c["start"]) <= t < float(c["end"])]
+
+    if not clips:
+        log("WARNING: 切片结果为空，回退固定切片。")
+        clips = _plain_clips(_trim_slices(_fixed_slices(dur, clip_sec=sp.fixed_clip_sec), dur, sp, repeats))
+    return clips
+
+
+def _clip_frame_times(cinfo: dict, frames_per_clip: int) -> tuple[list[float], bool]:
+    """Frame timestamps of a clip, and whether they are keyframes (fast preview slices carry theirs)."""
+    kf = [float(t) for t in (cinfo.get("keyframes") or [])]
+    if kf:
+        n = min(len(kf), max(1, int(frames_per_clip)))
+        return [kf[(2 * k + 1) * len(kf) // (2 * n)] for k in range(n)], True
+    return _pick_frame_times(float(cinfo["start"]), float(cinfo["end"]), frames_per_clip), False
+
+
+def _open_checkpoint(
+    ckpts: IndexCheckpointStore,
+    ck: dict | None,
+    vkey: str,
+    vsig: str,
+    *,
+    clips: list[dict],
+    done_rows: list[dict],
+    frames_dir: str,
+    frames_per_clip: int,
+) -> None:
+    """Ready a video's shard for appending rows; a finished shard is left untouched."""
+    if ck and ck.get("status") == "done":
+        return
+    if ck:
+        # The clip in progress when the last run stopped may have a half-written frame.
+        for fi in range(int(frames_per_clip)):
+            try:
+                os.remove(os.path.join(frames_dir, f"clip_{len(done_rows):05d}_f{fi}.jpg"))
+            except OSError:
+                pass
+    # Also compacts a resumed rows file (drops a torn last line) before appending to it.
+    ckpts.begin(vkey, vsig, slices=clips, rows=done_rows)
+
+
+def _checkpointed_frames(row: dict | None, nframes: int) -> list[str]:
+    """Frames of a checkpointed clip when all of them are still on disk, else []."""
+    if row is not None and len(row.get("frames") or []) == nframes and all(os.path.isfile(p) for p in row["frames"]):
+        return [str(p) for p in row["frames"]]
+    return []
+
+
+def _new_clip_meta(vkey: str, si: int, video_path: str, cinfo: dict, frame_paths: list[str]) -> dict:
+    s = float(cinfo["start"])
+    e = float(cinfo["end"])
+    return {
+        "clip_id": f"{vkey}_c{si:05d}",
+        "source_path": video_path,
+        "start": s,
+        "end": e,
+        "shot_id": int(cinfo.get("shot_id", si)),
+        "shot_start": float(cinfo.get("shot_start", s)),
+        "shot_end": float(cinfo.get("shot_end", e)),
+        "frames": frame_paths,
+        "captions": ["" for _ in frame_paths],
+        "text": "",
+        "flags": [],
+        "blocked": False,
+        "caption_stale": False,
+        "caption_pending": False,
+    }
+
+
+def _draft_proxy_cache(cache_dir: str) -> tuple[RenderProxyCache | None, int]:
+    """
+    Opt-in (render.draft_proxy_at_index): draft render proxy cache (16:9 draft height, output fps) that
+    finished videos are queued into, so the first draft render doesn't decode full-res sources.
+    """
+    rst = load_settings().render
+    height = max(90, int(getattr(rst, "draft_height", 360) or 360))
+    if not bool(getattr(rst, "draft_proxy_at_index", False)):
+        return None, height
+    cache = RenderProxyCache(
+        os.path.join(cache_dir, "render_proxies"),
+        quota_bytes=int(getattr(rst, "draft_proxy_cache_mb", 0) or 0) << 20,
+        fps=max(10, min(60, int(getattr(rst, "output_fps", 25) or 25))),
+    )
+    return cache, height
+
+
+class _FrameExtractor:
+    """Extracts frames with the configured media engine; falls back to the ffmpeg CLI for the rest of the job if it fails."""
+
+    def __init__(self, engine: MediaEngine, ffmpeg: str, *, log, cancel_evt) -> None:
+        self.engine = engine
+        self._ffmpeg = ffmpeg
+        self._log = log
+        self._cancel_evt = cancel_evt
+
+    def extract(self, video_path: str, t: float, out_jpg: str, *, keyframe: bool) -> DecodedFrame:
+        try:
+            return self.engine.extract_frames(video_path, [t], [out_jpg], keyframe=keyframe, log=self._log)[0]
+        except Exception as e:
+            if isinstance(self.engine, FFmpegCliEngine):
+                raise
+            check_cancel(self._cancel_evt)
+            self._log(f"WARNING: {self.engine.name} 解码失败，改用 ffmpeg 命令行抽帧：{e}")
+            self.engine.close()
+            self.engine = FFmpegCliEngine(self._ffmpeg)
+            return self.engine.extract_frames(video_path, [t], [out_jpg], keyframe=keyframe, log=self._log)[0]
+
+    def close(self) -> None:
+        self.engine.close()
+
+
+class _PreviewFrames:
+    """
+    Keyframe previews record (time, frame key) per video in index/preview_frames.json; later scene/fixed
+    runs reuse those captions for frames at (nearly) the same timestamp instead of asking the relay again.
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        self.path = os.path.join(index_dir, "preview_frames.json")
+        self.videos: dict[str, list[list]] = {}
+        self.reused = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if isinstance(raw, dict) and isinstance(raw.get("videos"), dict):
+                self.videos = {str(k): sorted(v) for k, v in raw["videos"].items() if isinstance(v, list)}
+        except (OSError, ValueError):
+            self.videos = {}
+
+    def caption(self, captions: dict[str, str], video_path: str, t: float, *, lo: float, hi: float, tol: float) -> str | None:
+        items = self.videos.get(video_path)
+        if not items:
+            return None
+        i = bisect_left(items, [t])
+        best: tuple[float, str] | None = None
+        for j in (i - 1, i):
+            if 0 <= j < len(items):
+                pt, pk = float(items[j][0]), str(items[j][1])
+                if lo <= pt <= hi and abs(pt - t) <= tol and (best is None or abs(pt - t) < best[0]):
+                    best = (abs(pt - t), pk)
+        if best is None:
+            return None
+        c = captions.get(best[1])
+        return None if _is_missing_caption(c) else str(c)
+
+    def save(self, video_path: str, items: list[list]) -> None:
+        self.videos[video_path] = sorted(items)
+        atomic_write_json(self.path, {"version": 1, "videos": self.videos})
+
+
+class _SnapshotPublisher:
+    """
+    Partial index snapshots every `every` finished videos, so renders can start while indexing continues.
+    Off when a complete earlier index exists (it stays the render source until this run replaces it).
+    """
+
+    def __init__(self, index_dir: str, emb, *, every: int, log, cancel_evt) -> None:
+        self.index_dir = index_dir
+        self.every = 0 if os.path.isfile(os.path.join(index_dir, "clips.json")) else max(0, int(every))
+        self._emb = emb
+        self._vecs: dict[str, np.ndarray] = {}
+        self._log = log
+        self._cancel_evt = cancel_evt
+
+    def due(self, videos_done: int, videos_total: int) -> bool:
+        return self.every > 0 and videos_done < videos_total and videos_done % self.every == 0
+
+    def publish(self, clips_meta: list[dict], clip_texts: list[str], waiting: set[int], *, videos_done: int, videos_total: int) -> None:
+        # Skip clips still waiting for a caption response (their text would be empty).
+        rows = [i for i in range(len(clips_meta)) if i not in waiting]
+        todo = list(dict.fromkeys(clip_texts[i] for i in rows if clip_texts[i] not in self._vecs))
+        try:
+            if todo:
+                for t, v in zip(todo, self._emb.embed_texts(todo)):
+                    self._vecs[t] = v
+            vecs = np.stack([self._vecs[clip_texts[i]] for i in rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+            publish_snapshot(
+                self.index_dir,
+                [clips_meta[i] for i in rows],
+                vecs,
+                {
+                    "type": type(self._emb).__name__,
+                    "dim": int(vecs.shape[1]) if vecs.ndim == 2 else 0,
+                    "model_id": getattr(self._emb, "model_id", None),
+                },
+                videos_done=videos_done,
+                videos_total=videos_total,
+            )
+            self._log(f"Index snapshot: {len(rows)} clips from {videos_done}/{videos_total} videos ({len(waiting)} awaiting captions)")
+        except Exception as e:
+            check_cancel(self._cancel_evt)
+            self._log(f"WARNING: 发布索引快照失败（忽略）：{e}")
+
+
+class _CaptionPipeline:
+    """
+    Frame captions of one index run. Each clip first tries to reuse a caption (active version store,
+    cross-project cache, keyframe preview, older caption version, near-duplicate clip) or is left for
+    lazy on-demand captioning; the rest are batched into relay requests kept in flight while frames are
+    extracted, with a sequential make-up pass for failed ones.
+
+    Clip captions/text are written into the shared `clips_meta` / `clip_texts` lists as they arrive.
+    """
+
+    def __init__(
+        self,
+        req: IndexJobRequest,
+        st,
+        cap,
+        *,
+        cap_is_null: bool,
+        has_image_emb: bool,
+        cache_dir: str,
+        index_dir: str,
+        ffmpeg: str,
+        preview: _PreviewFrames,
+        clips_meta: list[dict],
+        clip_texts: list[str],
+        workers: int,
+        in_flight: int,
+        log,
+    ) -> None:
+        self.cap = cap
+        self.cap_is_null = cap_is_null
+        self.cache_dir = cache_dir
+        self.preview = preview
+        self.clips_meta = clips_meta
+        self.clip_texts = clip_texts
+        self.in_flight = in_flight
+        self.flush_every = int(req.caption_flush_every)
+        self._ffmpeg = ffmpeg
+        self._log = log
+
+        # If caption backend/prompt changes, we should refresh captions (otherwise quality improvements won't apply).
+        cap_key = ""
+        try:
+            fn = getattr(cap, "cache_key", None)
+            cap_key = str(fn() if callable(fn) else "").strip()
+        except Exception:
+            cap_key = ""
+        self.cap_key = cap_key or type(cap).__name__
+        # Captions are kept per cache_key version, so switching back to an earlier model/hint is instant.
+        vstore = CaptionVersionStore(index_dir, keep=int(getattr(st, "caption_cache_versions", 3) or 3))
+        self.captions_path = vstore.captions_path
+        self.captions = vstore.activate(self.cap_key, log=log, legacy_refresh=not cap_is_null)
+        self.dirty = 0
+        caption_refresh = str(req.caption_refresh or getattr(st, "caption_refresh", "full") or "full").strip().lower()
+        self.recaption_ids = set(req.recaption_clip_ids or ())
+        self.stale_captions: dict[str, str] = {}
+        if caption_refresh == "on_demand" and not cap_is_null:
+            self.stale_captions = vstore.stale_captions(self.cap_key)
+            if self.stale_captions:
+                log(f"Caption refresh=on_demand: {len(self.stale_captions)} frames keep older-version captions until re-captioned")
+        self.stale_used = 0
+
+        # Lazy mode: clips without a reusable caption are captioned on demand by renders.
+        caption_mode = str(req.caption_mode or getattr(st, "caption_mode", "full") or "full").strip().lower()
+        self.lazy = caption_mode == "lazy" and not cap_is_null
+        self.lazy_pending: list[int] = []
+        if self.lazy and not has_image_emb:
+            # Pending clips are matched by their frame vectors until captioned; without them they'd be invisible.
+            log("WARNING: caption_mode=lazy needs a local image embedding model; captioning all clips now.")
+            self.lazy = False
+        elif self.lazy:
+            log("Caption mode=lazy: clips without a cached or near-duplicate caption are matched by frame vectors and captioned on demand at render time")
+
+        # Cross-project cache: the same frame bytes under the same provider cache_key never get captioned twice.
+        self.gcache: GlobalCaptionCache | None = None
+        if (not cap_is_null) and bool(getattr(st, "caption_global_cache", True)):
+            try:
+                self.gcache = GlobalCaptionCache.default(max_entries=int(getattr(st, "caption_global_cache_max_entries", 50000) or 50000))
+                log(f"Global caption cache: {len(self.gcache)} entries")
+            except Exception as e:
+                log(f"WARNING: 全局图生文缓存不可用（忽略）：{e}")
+                self.gcache = None
+        self.gcache_hits = 0
+        self._digests: dict[str, str] = {}
+
+        # Perceptual dedup: near-identical clips (static shots, recaps, OP/ED) reuse one caption.
+        self.phashes: FrameHashStore | None = None
+        if (not cap_is_null) and bool(getattr(st, "caption_dedup_enable", True)):
+            self.phashes = FrameHashStore(os.path.join(index_dir, "frame_phash.json"))
+        self.dedup_max_ham = max(0, min(64, int(getattr(st, "caption_dedup_max_hamming", 4))))
+        self.dedup_index = ClipHashIndex()
+        self.clip_keys: dict[int, list[str]] = {}
+        self.dup_followers: dict[int, list[int]] = {}
+        self.dedup_clips = 0
+
+        # Batch multiple clips' frames into one Vision request to reduce per-request overhead.
+        batch_clips = int(req.caption_batch_clips) if req.caption_batch_clips is not None else int(getattr(st, "caption_batch_clips", 1) or 1)
+        batch_max_images = int(req.caption_batch_max_images) if req.caption_batch_max_images is not None else int(getattr(st, "caption_batch_max_images", 0) or 0)
+        self.batch_clips = max(1, min(20, batch_clips))
+        self.batch_max_images = max(0, min(120, batch_max_images))
+        if (not cap_is_null) and self.batch_clips > 1:
+            if self.batch_max_images > 0:
+                log(f"Caption batching: clips_per_request={self.batch_clips}, max_images={self.batch_max_images}")
+            else:
+                log(f"Caption batching: clips_per_request={self.batch_clips}")
+        self._batch_items: list[_PendingCaption] = []
+        self._batch_imgs: list[str] = []
+        self._batch_keys: list[str] = []
+        # Base64 payloads are prepared right after extraction, not on the caption worker threads.
+        self.payloads = (
+            configure_payload_cache(max(0, int(getattr(st, "caption_payload_cache_mb", 256) or 0)) * 1024 * 1024)
+            if not cap_is_null
+            else None
+        )
+
+        self.pending: dict[Future, _PendingCaptionBatch] = {}
+        self.failed: list[_PendingCaption] = []
+        self.errors = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _mark_failed(self, key: str) -> None:
+        # Persist failure state so future "update index" runs can retry these frames.
+        # Keep it as a string for backward compatibility with existing cache files.
+        cur = self.captions.get(key)
+        n = 0
+        if isinstance(cur, str) and cur.startswith("__FAILED__"):
+            try:
+                n = int(cur.split(":", 1)[1])
+            except Exception:
+                n = 0
+        self.captions[key] = f"__FAILED__:{n+1}"
+
+    def _frame_digest(self, key: str) -> str:
+        d = self._digests.get(key)
+        if d is None:
+            try:
+                d = file_digest(os.path.join(self.cache_dir, key.replace("/", os.sep)))
+            except OSError:
+                d = ""
+            self._digests[key] = d
+        return d
+
+    def _remember(self, key: str) -> None:
+        if self.gcache is not None:
+            self.gcache.put(self.cap_key, self._frame_digest(key), self.captions.get(key) or "")
+
+    def flush(self, force: bool = False) -> None:
+        if self.dirty <= 0 and not force:
+            return
+        atomic_write_json(self.captions_path, self.captions)
+        self.dirty = 0
+        if self.phashes is not None:
+            self.phashes.flush()
+        # The global cache file is shared and larger; write it less often.
+        if self.gcache is not None and self.gcache.dirty >= 200:
+            self.gcache.flush()
+
+    def _apply_clip_caps(self, clip_idx: int, clip_caps: list[str], *, stale: bool = False) -> None:
+        clip_text = merge_caps(clip_caps)
+        c = self.clips_meta[clip_idx]
+        c["captions"] = clip_caps
+        c["text"] = clip_text
+        flags = sorted(flags_from_caps(clip_caps))
+        c["flags"] = flags
+        c["blocked"] = any(x in BLOCK_FLAGS for x in flags)
+        c["caption_stale"] = bool(stale)
+        self.clip_texts[clip_idx] = clip_text
+
+    def _clip_phashes(self, rel_keys: list[str], frame_paths: list[str]) -> list[int] | None:
+        if self.phashes is None:
+            return None
+        out: list[int] = []
+        for k, p in zip(rel_keys, frame_paths):
+            h = self.phashes.get(k, p, ffmpeg=self._ffmpeg)
+            if h is None:
+                return None
+            out.append(h)
+        return out
+
+    def _fill_followers(self, ref_idx: int) -> None:
+        # Copy the reference clip's captions (frame by frame) to its near-duplicates.
+        ref_keys = self.clip_keys.get(ref_idx) or []
+        for fi in self.dup_followers.pop(ref_idx, []):
+            for rk, fk in zip(ref_keys, self.clip_keys.get(fi) or []):
+                c = self.captions.get(rk)
+                if _is_missing_caption(c):
+                    self._mark_failed(fk)
+                else:
+                    self.captions[fk] = str(c)
+                self.dirty += 1
+            self._apply_clip_caps(fi, [self.captions.get(k, "") for k in self.clip_keys.get(fi) or []])
+
+    def put_frame(self, out_jpg: str, fr: DecodedFrame) -> None:
+        """Keep what the decoder already produced: JPEG bytes for the payload cache, gray thumb for the pHash."""
+        if fr.jpeg is not None and self.payloads is not None:
+            self.payloads.put_bytes(out_jpg, fr.jpeg)
+        if fr.gray is not None and self.phashes is not None:
+            self.phashes.put(os.path.relpath(out_jpg, self.cache_dir).replace("\\", "/"), out_jpg, dhash_gray(fr.gray))
+
+    def resolve(
+        self,
+        clip_idx: int,
+        rel_keys: list[str],
+        frame_paths: list[str],
+        *,
+        video_path: str,
+        frame_ts: list[float],
+        keyframe_run: bool,
+    ) -> list[tuple[str, str]]:
+        """
+        Settle a new clip's captions from everything reusable; returns the (key, path) frames that still
+        need the relay (empty when the clip is done, deferred to a duplicate, or left pending).
+        """
+        captions = self.captions
+        missing = [(k, p) for k, p in zip(rel_keys, frame_paths) if _is_missing_caption(captions.get(k))]
+        if self.cap_is_null:
+            return []
+
+        if missing and self.gcache is not None:
+            for k, _p in missing:
+                hit = self.gcache.get(self.cap_key, self._frame_digest(k))
+                if hit:
+                    captions[k] = hit
+                    self.dirty += 1
+                    self.gcache_hits += 1
+            missing = [(k, p) for k, p in missing if _is_missing_caption(captions.get(k))]
+
+        c = self.clips_meta[clip_idx]
+        s, e = float(c["start"]), float(c["end"])
+        if missing and not keyframe_run and video_path in self.preview.videos:
+            ts_by_key = dict(zip(rel_keys, frame_ts))
+            tol = max(0.25, (e - s) / (len(frame_ts) + 1) / 2.0)
+            for k, _p in missing:
+                hit = self.preview.caption(captions, video_path, float(ts_by_key.get(k, s)), lo=s, hi=e, tol=tol)
+                if hit:
+                    captions[k] = hit
+                    self.dirty += 1
+                    self.preview.reused += 1
+            missing = [(k, p) for k, p in missing if _is_missing_caption(captions.get(k))]
+
+        # On-demand refresh: keep older-version captions as provisional text unless this clip was asked for.
+        clip_id = c["clip_id"]
+        if missing and self.stale_captions and clip_id not in self.recaption_ids:
+            if all(k in self.stale_captions for k, _p in missing):
+                self._apply_clip_caps(
+                    clip_idx,
+                    [self.stale_captions[k] if _is_missing_caption(captions.get(k)) else captions[k] for k in rel_keys],
+                    stale=True,
+                )
+                self.stale_used += 1
+                return []
+
+        hashes = self._clip_phashes(rel_keys, frame_paths)
+        if missing and hashes is not None:
+            ref_idx = self.dedup_index.find(hashes, self.dedup_max_ham)
+            if ref_idx is not None:
+                self.clip_keys[clip_idx] = rel_keys
+                c["caption_dup_of"] = self.clips_meta[ref_idx]["clip_id"]
+                self.dup_followers.setdefault(ref_idx, []).append(clip_idx)
+                self.dedup_clips += 1
+                # Reference already captioned: fill now; otherwise when its request returns.
+                if not any(_is_missing_caption(captions.get(k)) for k in self.clip_keys.get(ref_idx) or []):
+                    self._fill_followers(ref_idx)
+                return []
+        if self.lazy and missing and clip_id not in self.recaption_ids:
+            c["caption_pending"] = True
+            self.lazy_pending.append(clip_idx)
+            return []
+        if hashes is not None:
+            self.clip_keys[clip_idx] = rel_keys
+            self.dedup_index.add(clip_idx, hashes)
+        if not missing:
+            self._apply_clip_caps(clip_idx, [captions.get(k, "") for k in rel_keys])
+        return missing
+
+    def enqueue(self, clip_idx: int, rel_keys: list[str], frame_paths: list[str], missing: list[tuple[str, str]]) -> None:
+        """Queue a clip's missing frames into the current clip batch (sent once it is full)."""
+        if self.payloads is not None:
+            self.payloads.warm(frame_paths)
+        # For clip-batching providers, we prefer sending all frames for this clip (multi-frame context),
+        # and write the same caption back to all frame keys.
+        self._batch_items.append(_PendingCaption(clip_idx=clip_idx, rel_keys=rel_keys, keys=list(rel_keys), img_paths=list(frame_paths)))
+        self._batch_imgs.extend(p for _k, p in missing)
+        self._batch_keys.extend(k for k, _p in missing)
+        self.submit_batch(force=False)
+
+    def submit_batch(self, *, force: bool) -> None:
+        if self.cap_is_null:
+            self._batch_items, self._batch_imgs, self._batch_keys = [], [], []
+            return
+        if not self._batch_items:
+            return
+
+        # Decide whether we should flush now.
+        fn_groups = getattr(self.cap, "caption_image_groups", None)
+        use_groups = callable(fn_groups)
+        total_imgs = (
+            sum(len(it.img_paths or []) or len(it.rel_keys) for it in self._batch_items) if use_groups else len(self._batch_imgs)
+        )
+        if (not force) and (len(self._batch_items) < self.batch_clips) and (
+            self.batch_max_images <= 0 or total_imgs < self.batch_max_images
+        ):
+            return
+
+        self.wait_for_slot()
+        # Prefer true "clip batching" if provider supports it: one caption per clip using multi-frame context.
+        if use_groups:
+            groups = []
+            for it in self._batch_items:
+                if it.img_paths:
+                    groups.append(list(it.img_paths))
+                else:
+                    groups.append([os.path.join(self.cache_dir, k.replace("/", os.sep)) for k in it.rel_keys])
+            fut = self._executor.submit(fn_groups, groups)
+            self.pending[fut] = _PendingCaptionBatch(items=list(self._batch_items), keys=[], mode="clips")
+        else:
+            fut = self._executor.submit(self.cap.caption_image_paths, list(self._batch_imgs))
+            self.pending[fut] = _PendingCaptionBatch(items=list(self._batch_items), keys=list(self._batch_keys), mode="frames")
+        self._batch_items, self._batch_imgs, self._batch_keys = [], [], []
+
+    def wait_for_slot(self) -> None:
+        while len(self.pending) >= self.in_flight:
+            self.drain(block=True)
+
+    def drain(self, *, block: bool) -> None:
+        if not self.pending:
+            return
+        done, _ = wait(list(self.pending.keys()), timeout=None if block else 0.1, return_when=FIRST_COMPLETED)
+        for fut in done:
+            info = self.pending.pop(fut)
+            try:
+                caps = fut.result()
+            except Exception as e:
+                self.errors += 1
+                self._log(f"WARNING: 图生文失败（稍后自动补跑）：{e}")
+                fail_keys = list(info.keys) if info.keys else [k for it in info.items for k in it.rel_keys]
+                for k in fail_keys:
+                    self._mark_failed(k)
+                    self.dirty += 1
+                # Defer filling clip text until we retry later.
+                self.failed.extend(info.items)
+                if self.dirty >= self.flush_every:
+                    self.flush(force=True)
+                continue
+
+            if info.mode == "clips":
+                if len(caps) != len(info.items):
+                    raise RuntimeError("Caption backend returned unexpected clip batch size.")
+                # Use the same clip-level caption for all frames in that clip.
+                for it, c in zip(info.items, caps):
+                    cap_text = (c or "").strip()
+                    for k in it.rel_keys:
+                        self.captions[k] = cap_text
+                        self.dirty += 1
+                        self._remember(k)
+            else:
+                if len(caps) != len(info.keys):
+                    raise RuntimeError("Caption backend returned unexpected batch size.")
+                for k, c in zip(info.keys, caps):
+                    self.captions[k] = (c or "").strip()
+                    self.dirty += 1
+                    self._remember(k)
+
+            for it in info.items:
+                self._apply_clip_caps(it.clip_idx, [self.captions.get(k, "") for k in it.rel_keys])
+                self._fill_followers(it.clip_idx)
+
+            if self.dirty >= self.flush_every:
+                self.flush(force=True)
+
+    def drain_all(self, pause_evt, cancel_evt) -> None:
+        self.submit_batch(force=True)
+        while self.pending:
+            wait_if_paused(pause_evt, cancel_evt)
+            check_cancel(cancel_evt)
+            self.drain(block=True)
+
+    def waiting_clips(self) -> set[int]:
+        """Clips (and their near-duplicates) whose caption request is still in flight."""
+        waiting: set[int] = set()
+        for info in self.pending.values():
+            for it in info.items:
+                waiting.add(it.clip_idx)
+                waiting.update(self.dup_followers.get(it.clip_idx) or [])
+        return waiting
+
+    def retry_failed(self, progress, pause_evt, cancel_evt) -> None:
+        """Make-up pass: retry failed clips after all frames are extracted."""
+        if self.cap_is_null or not self.failed:
+            return
+        progress(92, f"补跑图生文：{len(self.failed)} 个切片…")
+        self._log(f"补跑图生文：{len(self.failed)} 个切片（失败后自动补跑）")
+        # Retry sequentially to reduce stress on the relay.
+        for i, info in enumerate(list(self.failed), start=1):
+            wait_if_paused(pause_evt, cancel_evt)
+            check_cancel(cancel_evt)
+
+            # Recompute which frames are still missing for this clip.
+            still = [k for k in info.rel_keys if _is_missing_caption(self.captions.get(k))]
+            if not still:
+                self._fill_followers(info.clip_idx)
+                continue
+            # Best effort: request only missing frames for this clip.
+            imgs = [os.path.join(self.cache_dir, k.replace("/", os.sep)) for k in still]
+            progress(92, f"补跑图生文 {i}/{len(self.failed)}（{len(imgs)}帧）…")
+            try:
+                caps = self.cap.caption_image_paths(imgs)
+                if len(caps) != len(imgs):
+                    raise RuntimeError("Caption backend returned unexpected batch size.")
+                for k, c in zip(still, caps):
+                    self.captions[k] = (c or "").strip()
+                    self.dirty += 1
+                    self._remember(k)
+            except Exception as e:
+                # Keep failed markers; will be retried on next "update index".
+                self.errors += 1
+                self._log(f"WARNING: 补跑图生文仍失败（保留失败标记，后续可再次更新索引重试）：{e}")
+            # Update clip text after each retry.
+            self._apply_clip_caps(info.clip_idx, [self.captions.get(k, "") for k in info.rel_keys])
+            self._fill_followers(info.clip_idx)
+
+            if self.dirty >= self.flush_every:
+                self.flush(force=True)
+
+    def finish(self, *, frames_per_clip: int, n_endpoints: int) -> None:
+        """Settle leftover duplicates, persist the caches and log what was reused."""
+        # Followers whose reference never got a caption keep failure markers (retried on next update).
+        for ref_idx in list(self.dup_followers.keys()):
+            self._fill_followers(ref_idx)
+        log = self._log
+        if self.lazy_pending:
+            log(
+                f"Caption mode=lazy: {len(self.lazy_pending)} clips pending (frame vectors only); "
+                "renders caption shortlisted clips on demand"
+            )
+        if self.preview.reused:
+            log(f"Preview reuse: {self.preview.reused} frames took captions from the keyframe preview index")
+        if self.dedup_clips:
+            saved_req = -(-self.dedup_clips // max(1, self.batch_clips))
+            log(
+                f"Perceptual dedup: {self.dedup_clips} clips ({self.dedup_clips * int(frames_per_clip)} frames) reused captions "
+                f"of near-identical clips (max_hamming={self.dedup_max_ham}); saved ~{saved_req} relay requests"
+            )
+
+        self.flush(force=True)
+        if self.gcache is not None:
+            self.gcache.flush()
+            if self.gcache_hits:
+                log(f"Global caption cache: reused {self.gcache_hits} frame captions (skipped relay requests)")
+        try:
+            fn = getattr(self.cap, "stats", None)
+            cap_stats = fn() if callable(fn) else {}
+            if cap_stats:
+                log("Caption relay stats: " + ", ".join(f"{k}={v}" for k, v in cap_stats.items()))
+            fn = getattr(self.cap, "endpoint_stats", None)
+            if n_endpoints > 1 and callable(fn):
+                for ep in fn():
+                    log(
+                        f"  endpoint {ep['endpoint']}: ok={ep['ok']}, errors={ep['errors']}, "
+                        f"ewma={ep['ewma_ms']}ms{', OPEN' if ep['open'] else ''}"
+                    )
+        except Exception:
+            pass
+        if self.stale_used:
+            log(f"Caption refresh=on_demand: {self.stale_used} clips use older-version captions (re-caption them via recaption_clip_ids)")
+
+    def remaining_failed(self) -> int:
+        return sum(1 for v in self.captions.values() if isinstance(v, str) and v.startswith("__FAILED__"))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.cap.close()
+
+
+def _write_index(index_dir: str, clips_meta: list[dict], clip_texts: list[str], emb, img_emb, *, progress, log, cancel_evt) -> str:
+    """Embed clip texts (and frames), then write clip_vectors.npy, clip_image_vectors.npy and clips.json."""
+    progress(95, "向量化文本（Embedding）…")
+    log("Embedding clip texts...")
+    try:
+        vecs = emb.embed_texts(clip_texts)
+    except Exception as e:
+        # Fast fallback so users can still preview end-to-end without heavyweight deps.
+        log(f"WARNING: 向量化失败，将回退到轻量本地向量（local_hash）。原因：{e}")
+        from app.embeddings.provider import LocalHashEmbeddingProvider
+
+        emb = LocalHashEmbeddingProvider()
+        vecs = emb.embed_texts(clip_texts)
+    npy_path = os.path.join(index_dir, "clip_vectors.npy")
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    np.save(npy_path, vecs)
+
+    emb_info: dict = {
+        "type": type(emb).__name__,
+        "dim": int(vecs.shape[1]) if vecs.ndim == 2 else 0,
+        "model_id": getattr(emb, "model_id", None),
+    }
+    img_npy = os.path.join(index_dir, "clip_image_vectors.npy")
+    if img_emb is not None:
+        progress(97, "向量化画面（图文向量）…")
+        try:
+            img_vecs = _clip_image_vectors(clips_meta, index_dir, img_emb, log=log, cancel_evt=cancel_evt)
+            np.save(img_npy, img_vecs)
+            emb_info["image"] = {
+                "type": type(img_emb).__name__,
+                "dim": int(img_vecs.shape[1]) if img_vecs.ndim == 2 else 0,
+                "model_id": getattr(img_emb, "model_id", None),
+                "file": "clip_image_vectors.npy",
+            }
+        except Exception as e:
+            check_cancel(cancel_evt)
+            log(f"WARNING: 画面向量化失败（仅使用文本向量匹配）：{e}")
+
+    meta_path = os.path.join(index_dir, "clips.json")
+    atomic_write_json(
+        meta_path,
+        {
+            "created_at": time.time(),
+            "clips": clips_meta,
+            "embedding": emb_info,
+        },
+    )
+    return meta_path
+
+
 def run_index_job(req: IndexJobRequest, progress, log, pause_evt, cancel_evt) -> None:
     store = ProjectStore.default()
     meta = store.get_project_meta(req.project_id)
@@ -420,8 +1475,11 @@ def run_index_job(req: IndexJobRequest, progress, log, pause_evt, cancel_evt) ->
     bins = find_ffmpeg()
     emb = get_embedding_provider()
     cap = get_caption_provider()
+    img_emb = get_image_embedding_provider(ffmpeg=bins.ffmpeg)
     log(f"Embedding backend: {type(emb).__name__}")
     log(f"Caption backend: {type(cap).__name__}")
+    if img_emb is not None:
+        log(f"Image embedding backend: {type(img_emb).__name__} ({getattr(img_emb, 'model_id', '')})")
     if project_hint:
         # Gemini prompt can use this to identify characters/entities more reliably (single-work projects).
         try:
@@ -433,7 +1491,9 @@ def run_index_job(req: IndexJobRequest, progress, log, pause_evt, cancel_evt) ->
             pass
 
     cap_is_null = type(cap).__name__.lower().startswith("null")
-    if cap_is_null:
+    if cap_is_null and img_emb is not None:
+        log("Caption backend is null：离线索引，仅使用本地图文向量（画面向量）进行匹配。")
+    elif cap_is_null:
         log(
             "WARNING: caption backend is null；clip_text 将为空，匹配质量会很差。"
             "请到 UI 的『图生文设置』选择模型，并确保主程序 Provider 已配置 apiHost/apiKey。"
@@ -451,464 +1511,159 @@ def run_index_job(req: IndexJobRequest, progress, log, pause_evt, cancel_evt) ->
     except Exception:
         pass
 
-    cap_workers = int(req.caption_workers if req.caption_workers is not None else st.caption_workers)
-    cap_in_flight = int(req.caption_in_flight if req.caption_in_flight is not None else st.caption_in_flight)
-    slice_mode = (req.slice_mode if req.slice_mode is not None else st.slice_mode) or "scene"
-    scene_threshold = float(req.scene_threshold if req.scene_threshold is not None else st.scene_threshold)
-    scene_fps = float(req.scene_fps if req.scene_fps is not None else st.scene_fps)
-    min_clip_sec = float(req.min_clip_sec if req.min_clip_sec is not None else st.clip_min_sec)
-    target_clip_sec = float(req.target_clip_sec if req.target_clip_sec is not None else st.clip_target_sec)
-    max_clip_sec = float(req.max_clip_sec if req.max_clip_sec is not None else st.clip_max_sec)
-    cap_workers = max(1, min(8, cap_workers))
-    cap_in_flight = max(1, min(32, cap_in_flight))
-    log(f"Caption concurrency: workers={cap_workers}, in_flight={cap_in_flight}")
-    skip_head = int(req.skip_head_sec) if req.skip_head_sec is not None else int(getattr(st, "skip_head_sec", 60) or 0)
-    skip_tail = int(req.skip_tail_sec) if req.skip_tail_sec is not None else int(getattr(st, "skip_tail_sec", 60) or 0)
-    skip_head = max(0, skip_head)
-    skip_tail = max(0, skip_tail)
-    log(f"片头/片尾过滤: skip_head={skip_head}s, skip_tail={skip_tail}s")
+    cap_workers, cap_in_flight, n_endpoints = _caption_concurrency(req, st, cap)
+    log(f"Caption concurrency: workers={cap_workers}, in_flight={cap_in_flight}, endpoints={n_endpoints}")
+    sp = _slice_params(req, st)
+    log(f"片头/片尾过滤: skip_head={sp.skip_head}s, skip_tail={sp.skip_tail}s")
 
     cache_dir = store.project_cache_dir(req.project_id)
     index_dir = os.path.join(cache_dir, "index")
     os.makedirs(index_dir, exist_ok=True)
 
-    captions_path = os.path.join(index_dir, "frame_captions.json")
-    captions = _load_caption_cache(captions_path)
-    # If caption backend/prompt changes, we should refresh captions (otherwise quality improvements won't apply).
-    cap_key = ""
-    try:
-        fn = getattr(cap, "cache_key", None)
-        cap_key = str(fn() if callable(fn) else "").strip()
-    except Exception:
-        cap_key = ""
-    if not cap_key:
-        cap_key = type(cap).__name__
-    cap_meta_path = os.path.join(index_dir, "caption_cache_meta.json")
-    try:
-        import json
-
-        old_key = ""
-        meta_exists = os.path.isfile(cap_meta_path)
-        if meta_exists:
-            with open(cap_meta_path, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-            if isinstance(meta, dict):
-                old_key = str(meta.get("cache_key") or "").strip()
-        # First run after upgrade (no meta yet): force refresh so prompt improvements apply.
-        if (not meta_exists) and captions and (not cap_is_null):
-            log("Caption cache metadata missing; re-captioning all frames to apply current prompt/model...")
-            captions = {}
-        if old_key and old_key != cap_key:
-            log(f"Caption prompt/model changed ({old_key} -> {cap_key}). Re-captioning all frames...")
-            captions = {}
-    except Exception:
-        pass
-    atomic_write_json(cap_meta_path, {"cache_key": cap_key, "updated_at": time.time()})
-    captions_dirty = 0
-
-    clips_meta: list[dict] = []
-    clip_texts: list[str] = []
-
-    pending: dict[object, object] = {}
-    failed: list[_PendingCaption] = []
-    caption_errors = 0
-
-    def _is_missing_caption(v: str | None) -> bool:
-        if v is None:
-            return True
-        v2 = (v or "").strip()
-        if not v2:
-            return True
-        return v2.startswith("__FAILED__")
-
-    def _mark_failed(key: str) -> None:
-        # Persist failure state so future "update index" runs can retry these frames.
-        # Keep it as a string for backward compatibility with existing cache files.
-        cur = captions.get(key)
-        n = 0
-        if isinstance(cur, str) and cur.startswith("__FAILED__"):
-            try:
-                n = int(cur.split(":", 1)[1])
-            except Exception:
-                n = 0
-        captions[key] = f"__FAILED__:{n+1}"
-
-    def _flush_captions_if_needed(force: bool = False) -> None:
-        nonlocal captions_dirty
-        if captions_dirty <= 0 and not force:
-            return
-        atomic_write_json(captions_path, captions)
-        captions_dirty = 0
-
-    def _merge_caps(clip_caps: list[str]) -> str:
-        uniq: list[str] = []
-        seen: set[str] = set()
-        for c in clip_caps:
-            c2 = (c or "").strip()
-            if " FLAGS:" in c2:
-                c2 = c2.split(" FLAGS:", 1)[0].strip()
-            if not c2 or c2 in seen:
-                continue
-            seen.add(c2)
-            uniq.append(c2)
-        return " ; ".join(uniq)
-
-    def _flags_from_caps(clip_caps: list[str]) -> set[str]:
-        flags: set[str] = set()
-        for c in clip_caps:
-            s = (c or "").strip()
-            if " FLAGS:" not in s:
-                continue
-            _, f = s.split(" FLAGS:", 1)
-            for part in f.split(","):
-                p = part.strip().lower()
-                if p:
-                    flags.add(p)
-        return flags
-
-    def _drain_some(executor: ThreadPoolExecutor, *, block: bool) -> None:
-        nonlocal captions_dirty
-        nonlocal caption_errors
-        if not pending:
-            return
-        timeout = None if block else 0.1
-        done, _ = wait(list(pending.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
-        for fut in done:
-            info = pending.pop(fut)
-            items = info.items if isinstance(info, _PendingCaptionBatch) else [info]
-            keys = info.keys if isinstance(info, _PendingCaptionBatch) else info.keys
-            mode = info.mode if isinstance(info, _PendingCaptionBatch) else "frames"
-            try:
-                caps = fut.result()
-            except Exception as e:
-                caption_errors += 1
-                log(f"WARNING: 图生文失败（稍后自动补跑）：{e}")
-                fail_keys = list(keys) if keys else [k for it in items for k in it.rel_keys]
-                for k in fail_keys:
-                    _mark_failed(k)
-                    captions_dirty += 1
-                # Defer filling clip text until we retry later.
-                for it in items:
-                    failed.append(it)
-                if captions_dirty >= int(req.caption_flush_every):
-                    _flush_captions_if_needed(force=True)
-                continue
-
-            if mode == "clips":
-                if len(caps) != len(items):
-                    raise RuntimeError("Caption backend returned unexpected clip batch size.")
-                # Use the same clip-level caption for all frames in that clip.
-                for it, c in zip(items, caps):
-                    cap_text = (c or "").strip()
-                    for k in it.rel_keys:
-                        captions[k] = cap_text
-                        captions_dirty += 1
-            else:
-                if len(caps) != len(keys):
-                    raise RuntimeError("Caption backend returned unexpected batch size.")
-                for k, c in zip(keys, caps):
-                    captions[k] = (c or "").strip()
-                    captions_dirty += 1
-
-            for it in items:
-                clip_caps = [captions.get(k, "") for k in it.rel_keys]
-                clip_text = _merge_caps(clip_caps)
-                clips_meta[it.clip_idx]["captions"] = clip_caps
-                clips_meta[it.clip_idx]["text"] = clip_text
-                flags = sorted(_flags_from_caps(clip_caps))
-                clips_meta[it.clip_idx]["flags"] = flags
-                clips_meta[it.clip_idx]["blocked"] = any(x in {"ad", "intro", "outro", "credit"} for x in flags)
-                clip_texts[it.clip_idx] = clip_text
-
-            if captions_dirty >= int(req.caption_flush_every):
-                _flush_captions_if_needed(force=True)
-
     total = len(videos)
     if max_videos > 0 and len(videos_all) > len(videos):
         log(f"预览模式：本次只处理前 {len(videos)}/{len(videos_all)} 个视频（想处理全部请把N设为0）。")
-    executor: ThreadPoolExecutor | None = None
-    try:
-        executor = ThreadPoolExecutor(max_workers=cap_workers)
+    log(f"Proxy mode: {sp.proxy_mode}" + (f" ({sp.proxy_fps:g} fps)" if sp.proxy_mode == "analysis" else ""))
 
-        # Batch multiple clips' frames into one Vision request to reduce per-request overhead.
-        cap_batch_clips = int(req.caption_batch_clips) if req.caption_batch_clips is not None else int(getattr(st, "caption_batch_clips", 1) or 1)
-        cap_batch_max_images = int(req.caption_batch_max_images) if req.caption_batch_max_images is not None else int(getattr(st, "caption_batch_max_images", 0) or 0)
-        cap_batch_clips = max(1, min(20, cap_batch_clips))
-        cap_batch_max_images = max(0, min(120, cap_batch_max_images))
-        if (not cap_is_null) and cap_batch_clips > 1:
-            if cap_batch_max_images > 0:
-                log(f"Caption batching: clips_per_request={cap_batch_clips}, max_images={cap_batch_max_images}")
-            else:
-                log(f"Caption batching: clips_per_request={cap_batch_clips}")
-
-        batch_items: list[_PendingCaption] = []
-        batch_imgs: list[str] = []
-        batch_keys: list[str] = []
-
-        def _submit_caption_batch(*, force: bool) -> None:
-            nonlocal batch_items, batch_imgs, batch_keys
-            if cap_is_null:
-                batch_items, batch_imgs, batch_keys = [], [], []
-                return
-            if not batch_items:
-                return
-
-            # Decide whether we should flush now.
-            fn_groups = getattr(cap, "caption_image_groups", None)
-            use_groups = callable(fn_groups)
-            total_imgs = (
-                sum(len(it.img_paths or []) or len(it.rel_keys) for it in batch_items) if use_groups else len(batch_imgs)
-            )
-            if (not force) and (len(batch_items) < cap_batch_clips) and (
-                cap_batch_max_images <= 0 or total_imgs < cap_batch_max_images
-            ):
-                return
-
-            while len(pending) >= cap_in_flight:
-                _drain_some(executor, block=True)
-
-            # Prefer true "clip batching" if provider supports it: one caption per clip using multi-frame context.
-            if use_groups:
-                groups = []
-                for it in batch_items:
-                    if it.img_paths:
-                        groups.append(list(it.img_paths))
-                    else:
-                        groups.append([os.path.join(cache_dir, k.replace("/", os.sep)) for k in it.rel_keys])
-                fut = executor.submit(fn_groups, groups)
-                pending[fut] = _PendingCaptionBatch(items=list(batch_items), keys=[], mode="clips")
-            else:
-                fut = executor.submit(cap.caption_image_paths, list(batch_imgs))
-                pending[fut] = _PendingCaptionBatch(items=list(batch_items), keys=list(batch_keys), mode="frames")
-            batch_items, batch_imgs, batch_keys = [], [], []
+    repeat_ranges: dict[int, list[tuple[float, float, str]]] = {}
+    skip_repeats = bool(req.skip_repeats) if req.skip_repeats is not None else bool(getattr(st, "repeat_skip_enable", False))
+    if skip_repeats and total >= 2:
+        repeat_ranges = _detect_repeats(
+            bins, videos, sp, st, cache_dir=cache_dir, index_dir=index_dir, progress=progress, log=log, pause_evt=pause_evt, cancel_evt=cancel_evt
+        )
 
+    # Per-video checkpoints: completed videos skip slicing/extraction, an interrupted one resumes mid-way.
+    ckpts = IndexCheckpointStore(index_dir)
+    if not req.videos_override and max_videos <= 0:
+        ckpts.prune({f"v{vi:04d}" for vi in range(1, total + 1)})
+    draft_proxies, draft_proxy_h = _draft_proxy_cache(cache_dir)
+    snapshots = _SnapshotPublisher(
+        index_dir, emb, every=int(getattr(st, "index_snapshot_every", 1)), log=log, cancel_evt=cancel_evt
+    )
+    preview = _PreviewFrames(index_dir)
+    clips_meta: list[dict] = []
+    clip_texts: list[str] = []
+    captioner = _CaptionPipeline(
+        req,
+        st,
+        cap,
+        cap_is_null=cap_is_null,
+        has_image_emb=img_emb is not None,
+        cache_dir=cache_dir,
+        index_dir=index_dir,
+        ffmpeg=bins.ffmpeg,
+        preview=preview,
+        clips_meta=clips_meta,
+        clip_texts=clip_texts,
+        workers=cap_workers,
+        in_flight=cap_in_flight,
+        log=log,
+    )
+    extractor = _FrameExtractor(
+        get_media_engine(str(getattr(st, "media_engine", "auto") or "auto"), ffmpeg=bins.ffmpeg, log=log),
+        bins.ffmpeg,
+        log=log,
+        cancel_evt=cancel_evt,
+    )
+    log(f"Media engine: {extractor.engine.name}")
+    nfr = int(req.frames_per_clip)
+    try:
         for vi, video_path in enumerate(videos, start=1):
             wait_if_paused(pause_evt, cancel_evt)
             check_cancel(cancel_evt)
+            vbase = (vi - 1) / max(1, total)
 
             # Emit a stage update before long-running steps so UI doesn't look "stuck".
-            progress(int(((vi - 1) / max(1, total)) * 100), f"视频 {vi}/{total}：准备中…")
+            progress(int(vbase * 100), f"视频 {vi}/{total}：准备中…")
             log(f"[{vi}/{total}] Video: {video_path}")
             vkey = f"v{vi:04d}"
             vcache = os.path.join(cache_dir, vkey)
-            proxy = os.path.join(vcache, "proxy.mp4")
-            progress(int(((vi - 1) / max(1, total)) * 100), f"视频 {vi}/{total}：生成代理视频…")
-            _ensure_proxy(bins.ffmpeg, video_path, proxy, proxy_height=req.proxy_height, log=log)
-
-            progress(int(((vi - 1) / max(1, total)) * 100), f"视频 {vi}/{total}：分析时长/切片…")
-            dur = _probe_duration(bins.ffprobe, proxy)
-            if str(slice_mode).strip().lower() == "scene":
-                try:
-                    shots = _scene_raw_slices(
-                        bins.ffmpeg,
-                        proxy,
-                        dur,
-                        threshold=scene_threshold,
-                        fps=scene_fps,
-                        log=log,
-                    )
-                except Exception as e:
-                    log(f"WARNING: 场景识别切片失败，回退固定切片。原因: {e}")
-                    shots = _fixed_slices(dur, clip_sec=req.fixed_clip_sec_fallback)
+            frames_dir = os.path.join(vcache, sp.frames_sub)
+            proxy = _proxy_path(vcache, mode=sp.proxy_mode, fps=sp.proxy_fps)
+            vsig = video_signature(video_path, dict(sp.signature(), repeats=repeat_ranges.get(vi) or []))
+            ck = ckpts.load(vkey, vsig)
+            done_rows: list[dict] = list(ck["rows"]) if ck else []
+            if ck:
+                clips = [dict(c) for c in ck["slices"]]
+                state = "已完成" if ck.get("status") == "done" else f"续跑（已完成 {len(done_rows)}/{len(clips)} 个切片）"
+                log(f"[{vi}/{total}] 检查点：{state}，跳过代理视频/切片")
             else:
-                shots = _fixed_slices(dur, clip_sec=req.fixed_clip_sec_fallback)
-
-            if skip_head or skip_tail:
-                cutoff_end = max(0.0, float(dur) - float(skip_tail))
-                shots = _clamp_slices(shots, start=float(skip_head), end=float(cutoff_end))
-
-            # Build index clips INSIDE each shot so index granularity is still ~3-6s but never crosses a real cut.
-            if str(slice_mode).strip().lower() == "scene":
-                clips = _window_clips_from_shots(
-                    shots,
-                    min_sec=min_clip_sec,
-                    target_sec=target_clip_sec,
-                    max_sec=max_clip_sec,
+                clips = _slice_video(
+                    bins,
+                    video_path,
+                    proxy,
+                    sp,
+                    repeats=[(a, b) for a, b, _k in repeat_ranges.get(vi) or []],
+                    stage=lambda msg: progress(int(vbase * 100), f"视频 {vi}/{total}：{msg}"),
+                    log=log,
                 )
-            else:
-                clips = [{"start": float(s), "end": float(e), "shot_id": i, "shot_start": float(s), "shot_end": float(e)} for i, (s, e) in enumerate(shots)]
-
-            if not clips:
-                log("WARNING: 切片结果为空，回退固定切片。")
-                shots2 = _fixed_slices(dur, clip_sec=req.fixed_clip_sec_fallback)
-                if skip_head or skip_tail:
-                    cutoff_end = max(0.0, float(dur) - float(skip_tail))
-                    shots2 = _clamp_slices(shots2, start=float(skip_head), end=float(cutoff_end))
-                clips = [{"start": float(s), "end": float(e), "shot_id": i, "shot_start": float(s), "shot_end": float(e)} for i, (s, e) in enumerate(shots2)]
+            _open_checkpoint(ckpts, ck, vkey, vsig, clips=clips, done_rows=done_rows, frames_dir=frames_dir, frames_per_clip=nfr)
+            vpreview: list[list] = []
 
             nslices = max(1, len(clips))
             log(
-                f"[{vi}/{total}] 切片数: {len(clips)}（mode={slice_mode}, index_clip目标{min_clip_sec:.1f}-{max_clip_sec:.1f}s），每片抽帧: {req.frames_per_clip}，总帧数: {len(clips) * req.frames_per_clip}"
+                f"[{vi}/{total}] 切片数: {len(clips)}（mode={sp.mode}, index_clip目标{sp.min_clip_sec:.1f}-{sp.max_clip_sec:.1f}s），每片抽帧: {nfr}，总帧数: {len(clips) * nfr}"
             )
-
-            frames_dir = os.path.join(vcache, "frames")
             for si, cinfo in enumerate(clips):
                 wait_if_paused(pause_evt, cancel_evt)
                 check_cancel(cancel_evt)
+                # Keep caption requests flowing in parallel; also drain opportunistically while extracting.
+                captioner.wait_for_slot()
+                captioner.drain(block=False)
 
-                # Keep caption requests flowing in parallel.
-                while len(pending) >= cap_in_flight:
-                    _drain_some(executor, block=True)
-
-                # Also drain opportunistically to update cache while extracting.
-                _drain_some(executor, block=False)
+                overall = vbase + (si / nslices) / max(1, total)
+                progress(int(overall * 100), f"视频 {vi}/{total}：抽帧 {si+1}/{len(clips)}…（并发图生文: {len(captioner.pending)}）")
 
-                overall = ((vi - 1) / max(1, total)) + ((si / nslices) / max(1, total))
-                progress(int(overall * 100), f"视频 {vi}/{total}：抽帧 {si+1}/{len(clips)}…（并发图生文: {len(pending)}）")
-
-                s = float(cinfo["start"])
-                e = float(cinfo["end"])
-                frame_ts = _pick_frame_times(s, e, req.frames_per_clip)
-                frame_paths: list[str] = []
-                for fi, t in enumerate(frame_ts):
-                    overall_f = ((vi - 1) / max(1, total)) + (
-                        ((si + (fi / max(1, req.frames_per_clip))) / nslices) / max(1, total)
-                    )
+                frame_ts, keyframe = _clip_frame_times(cinfo, nfr)
+                frame_paths = _checkpointed_frames(done_rows[si] if si < len(done_rows) else None, len(frame_ts))
+                for fi, t in enumerate(frame_ts if not frame_paths else []):
+                    overall_f = vbase + ((si + (fi / max(1, nfr))) / nslices) / max(1, total)
                     progress(
                         int(overall_f * 100),
-                        f"视频 {vi}/{total}：抽帧 {si+1}/{len(clips)}（{fi+1}/{req.frames_per_clip}）…（并发图生文: {len(pending)}）",
+                        f"视频 {vi}/{total}：抽帧 {si+1}/{len(clips)}（{fi+1}/{nfr}）…（并发图生文: {len(captioner.pending)}）",
                     )
                     out_jpg = os.path.join(frames_dir, f"clip_{si:05d}_f{fi}.jpg")
-                    _extract_frame(bins.ffmpeg, video_path, t, out_jpg, log=log)
+                    captioner.put_frame(out_jpg, extractor.extract(video_path, t, out_jpg, keyframe=keyframe))
                     frame_paths.append(out_jpg)
 
                 rel_keys = [os.path.relpath(p, cache_dir).replace("\\", "/") for p in frame_paths]
-                missing = [(k, p) for k, p in zip(rel_keys, frame_paths) if _is_missing_caption(captions.get(k))]
-
                 # Reserve slot now; fill later when caption returns.
                 clip_idx = len(clips_meta)
-                clips_meta.append(
-                    {
-                        "clip_id": f"{vkey}_c{si:05d}",
-                        "source_path": video_path,
-                        "start": float(s),
-                        "end": float(e),
-                        "shot_id": int(cinfo.get("shot_id", si)),
-                        "shot_start": float(cinfo.get("shot_start", s)),
-                        "shot_end": float(cinfo.get("shot_end", e)),
-                        "frames": frame_paths,
-                        "captions": ["" for _ in rel_keys],
-                        "text": "",
-                        "flags": [],
-                        "blocked": False,
-                    }
-                )
+                clips_meta.append(_new_clip_meta(vkey, si, video_path, cinfo, frame_paths))
                 clip_texts.append("")
+                if sp.mode == "keyframe":
+                    vpreview.extend([float(t), k] for t, k in zip(frame_ts, rel_keys))
+                if si >= len(done_rows):
+                    ckpts.append_row(vkey, clips_meta[clip_idx])
 
-                if cap_is_null:
-                    continue
-
+                missing = captioner.resolve(
+                    clip_idx, rel_keys, frame_paths, video_path=video_path, frame_ts=frame_ts, keyframe_run=sp.mode == "keyframe"
+                )
                 if missing:
-                    keys = [k for k, _ in missing]
-                    imgs = [p for _, p in missing]
-                    # Queue into a clip-batch to reduce per-request overhead.
-                    progress(int(overall * 100), f"视频 {vi}/{total}：排队图生文 {si+1}/{len(clips)}（{len(imgs)}帧）…（并发: {len(pending)}）")
-                    # For clip-batching providers, we prefer sending all frames for this clip (multi-frame context),
-                    # and write the same caption back to all frame keys.
-                    batch_items.append(
-                        _PendingCaption(clip_idx=clip_idx, rel_keys=rel_keys, keys=list(rel_keys), img_paths=list(frame_paths))
-                    )
-                    batch_imgs.extend(imgs)
-                    batch_keys.extend(keys)
-                    _submit_caption_batch(force=False)
-                else:
-                    clip_caps = [captions.get(k, "") for k in rel_keys]
-                    clip_text = _merge_caps(clip_caps)
-                    clips_meta[clip_idx]["captions"] = clip_caps
-                    clips_meta[clip_idx]["text"] = clip_text
-                    flags = sorted(_flags_from_caps(clip_caps))
-                    clips_meta[clip_idx]["flags"] = flags
-                    clips_meta[clip_idx]["blocked"] = any(x in {"ad", "intro", "outro", "credit"} for x in flags)
-                    clip_texts[clip_idx] = clip_text
+                    progress(int(overall * 100), f"视频 {vi}/{total}：排队图生文 {si+1}/{len(clips)}（{len(missing)}帧）…（并发: {len(captioner.pending)}）")
+                    captioner.enqueue(clip_idx, rel_keys, frame_paths, missing)
 
             # Flush any remaining queued caption batch for this video.
-            _submit_caption_batch(force=True)
-            progress(pct(vi, total), f"视频 {vi}/{total}：完成（并发图生文: {len(pending)}）")
-
-        # Drain remaining caption tasks.
-        if executor is not None:
-            _submit_caption_batch(force=True)
-            while pending:
-                wait_if_paused(pause_evt, cancel_evt)
-                check_cancel(cancel_evt)
-                _drain_some(executor, block=True)
-
-        # Make-up pass: retry failed clips after we've finished extracting frames.
-        if (not cap_is_null) and failed:
-            progress(92, f"补跑图生文：{len(failed)} 个切片…")
-            log(f"补跑图生文：{len(failed)} 个切片（失败后自动补跑）")
-            # Retry sequentially to reduce stress on the relay.
-            for i, info in enumerate(list(failed), start=1):
-                wait_if_paused(pause_evt, cancel_evt)
-                check_cancel(cancel_evt)
-
-                # Recompute which frames are still missing for this clip.
-                still = [k for k in info.rel_keys if _is_missing_caption(captions.get(k))]
-                if not still:
-                    continue
-                # Best effort: request only missing frames for this clip.
-                imgs = [os.path.join(cache_dir, k.replace("/", os.sep)) for k in still]
-                progress(92, f"补跑图生文 {i}/{len(failed)}（{len(imgs)}帧）…")
-                try:
-                    caps = cap.caption_image_paths(imgs)
-                    if len(caps) != len(imgs):
-                        raise RuntimeError("Caption backend returned unexpected batch size.")
-                    for k, c in zip(still, caps):
-                        captions[k] = (c or "").strip()
-                        captions_dirty += 1
-                except Exception as e:
-                    # Keep failed markers; will be retried on next "update index".
-                    caption_errors += 1
-                    log(f"WARNING: 补跑图生文仍失败（保留失败标记，后续可再次更新索引重试）：{e}")
-                # Update clip text after each retry.
-                clip_caps = [captions.get(k, "") for k in info.rel_keys]
-                clip_text = _merge_caps(clip_caps)
-                clips_meta[info.clip_idx]["captions"] = clip_caps
-                clips_meta[info.clip_idx]["text"] = clip_text
-                flags = sorted(_flags_from_caps(clip_caps))
-                clips_meta[info.clip_idx]["flags"] = flags
-                clips_meta[info.clip_idx]["blocked"] = any(x in {"ad", "intro", "outro", "credit"} for x in flags)
-                clip_texts[info.clip_idx] = clip_text
-
-                if captions_dirty >= int(req.caption_flush_every):
-                    _flush_captions_if_needed(force=True)
-
-        _flush_captions_if_needed(force=True)
+            captioner.submit_batch(force=True)
+            ckpts.finish(vkey, vsig, slices=clips)
+            if draft_proxies is not None and draft_proxies.lookup(video_path, height=draft_proxy_h) is None:
+                schedule_mezzanine(draft_proxies, bins.ffmpeg, video_path, height=draft_proxy_h, log=log)
+            if sp.mode == "keyframe":
+                preview.save(video_path, vpreview)
+            if snapshots.due(vi, total):
+                snapshots.publish(clips_meta, clip_texts, captioner.waiting_clips(), videos_done=vi, videos_total=total)
+            progress(pct(vi, total), f"视频 {vi}/{total}：完成（并发图生文: {len(captioner.pending)}）")
+
+        captioner.drain_all(pause_evt, cancel_evt)
+        captioner.retry_failed(progress, pause_evt, cancel_evt)
+        captioner.finish(frames_per_clip=nfr, n_endpoints=n_endpoints)
     finally:
-        if executor is not None:
-            executor.shutdown(wait=True, cancel_futures=True)
-
-    progress(95, "向量化文本（Embedding）…")
-    log("Embedding clip texts...")
-    try:
-        vecs = emb.embed_texts(clip_texts)
-    except Exception as e:
-        # Fast fallback so users can still preview end-to-end without heavyweight deps.
-        log(f"WARNING: 向量化失败，将回退到轻量本地向量（local_hash）。原因：{e}")
-        from app.embeddings.provider import LocalHashEmbeddingProvider
-
-        emb = LocalHashEmbeddingProvider()
-        vecs = emb.embed_texts(clip_texts)
-    npy_path = os.path.join(index_dir, "clip_vectors.npy")
-    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
-    np.save(npy_path, vecs)
+        extractor.close()
+        captioner.close()
 
-    meta_path = os.path.join(index_dir, "clips.json")
-    atomic_write_json(
-        meta_path,
-        {
-            "created_at": time.time(),
-            "clips": clips_meta,
-            "embedding": {
-                "type": type(emb).__name__,
-                "dim": int(vecs.shape[1]) if vecs.ndim == 2 else 0,
-                "model_id": getattr(emb, "model_id", None),
-            },
-        },
-    )
+    meta_path = _write_index(index_dir, clips_meta, clip_texts, emb, img_emb, progress=progress, log=log, cancel_evt=cancel_evt)
+    clear_snapshots(index_dir)
     log(f"Index ready: {meta_path}")
-    if caption_errors:
-        # Count remaining failed frame captions.
-        remaining_failed = sum(1 for v in captions.values() if isinstance(v, str) and v.startswith("__FAILED__"))
-        log(f"WARNING: 图生文失败次数：{caption_errors}，仍失败帧数：{remaining_failed}（索引仍可用，但匹配效果会变差）")
+    if captioner.errors:
+        log(f"WARNING: 图生文失败次数：{captioner.errors}，仍失败帧数：{captioner.remaining_failed()}（索引仍可用，但匹配效果会变差）")
     progress(100, "Index complete")
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from app.core.util import atomic_write_json
+
+
+def _pointer_path(index_dir: str) -> str:
+    return os.path.join(index_dir, "snapshot.json")
+
+
+def publish_snapshot(
+    index_dir: str,
+    clips: list[dict],
+    vecs: np.ndarray,
+    embedding: dict,
+    *,
+    videos_done: int,
+    videos_total: int,
+    keep: int = 2,
+) -> str:
+    """
+    Publish a partial index (clip rows + vectors) while the index job is still running.
+
+    Files go into a fresh index/snapshots/<seq>/ dir first; index/snapshot.json is then swapped
+    atomically to point at it, so readers never see a half-written snapshot. The newest `keep`
+    snapshot dirs are retained (a render may still be reading the previous one).
+    """
+    root = os.path.join(index_dir, "snapshots")
+    os.makedirs(root, exist_ok=True)
+    seq = 1 + max((int(n) for n in os.listdir(root) if n.isdigit()), default=0)
+    name = f"{seq:06d}"
+    d = os.path.join(root, name)
+    os.makedirs(d, exist_ok=True)
+    np.save(os.path.join(d, "clip_vectors.npy"), vecs)
+    info = {"seq": seq, "videos_done": int(videos_done), "videos_total": int(videos_total), "created_at": time.time()}
+    atomic_write_json(
+        os.path.join(d, "clips.json"),
+        {"created_at": info["created_at"], "clips": clips, "embedding": embedding, "snapshot": info},
+    )
+    atomic_write_json(_pointer_path(index_dir), dict(info, dir=f"snapshots/{name}"))
+
+    for old in sorted((n for n in os.listdir(root) if n.isdigit()), reverse=True)[max(1, int(keep)) :]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return d
+
+
+def latest_snapshot(index_dir: str) -> tuple[str, str] | None:
+    """(clips.json, clip_vectors.npy) of the published snapshot, or None."""
+    try:
+        with open(_pointer_path(index_dir), "r", encoding="utf-8") as f:
+            ptr = json.load(f)
+    except (OSError, ValueError):
+        return None
+    d = os.path.join(index_dir, str(ptr.get("dir") or "").replace("/", os.sep)) if isinstance(ptr, dict) else ""
+    clips_json = os.path.join(d, "clips.json")
+    vecs_npy = os.path.join(d, "clip_vectors.npy")
+    if not d or not os.path.isfile(clips_json) or not os.path.isfile(vecs_npy):
+        return None
+    return clips_json, vecs_npy
+
+
+def clear_snapshots(index_dir: str) -> None:
+    """Drop snapshots once the full index is written (it supersedes them)."""
+    try:
+        os.remove(_pointer_path(index_dir))
+    except OSError:
+        pass
+    shutil.rmtree(os.path.join(index_dir, "snapshots"), ignore_errors=True)
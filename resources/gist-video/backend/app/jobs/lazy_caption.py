@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.project_store import ProjectStore
+from app.core.settings import load_settings
+from app.core.util import atomic_write_json, check_cancel
+from app.vision.caption_store import CaptionVersionStore, GlobalCaptionCache, file_digest
+from app.vision.caption_text import BLOCK_FLAGS, flags_from_caps, merge_caps
+from app.vision.payload_cache import configure_payload_cache
+from app.vision.provider import get_caption_provider
+
+
+# One on-demand captioning pass per project at a time: each pass rewrites clips.json and clip_vectors.npy.
+_project_locks: dict[str, threading.Lock] = {}
+_project_locks_guard = threading.Lock()
+
+
+def needs_caption(c: dict) -> bool:
+    return bool(c.get("caption_pending")) or bool(c.get("caption_stale"))
+
+
+def _project_lock(project_id: str) -> threading.Lock:
+    with _project_locks_guard:
+        return _project_locks.setdefault(project_id, threading.Lock())
+
+
+def _atomic_save_npy(path: str, arr: np.ndarray) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def caption_clips_on_demand(
+    store: ProjectStore,
+    project_id: str,
+    clip_ids: list[str],
+    *,
+    emb,
+    log,
+    cancel_evt=None,
+) -> int:
+    """
+    Caption lazily-indexed (caption_pending) or provisional (caption_stale) clips right now and write
+    the results back into the caption store, clips.json and clip_vectors.npy (rows re-embedded with `emb`).
+    Returns the number of clips updated. Concurrent calls for the same project run one after another
+    (a later call re-reads the index, so clips captioned meanwhile are skipped).
+    """
+    with _project_lock(project_id):
+        return _caption_clips_on_demand(store, project_id, clip_ids, emb=emb, log=log, cancel_evt=cancel_evt)
+
+
+def _caption_clips_on_demand(
+    store: ProjectStore,
+    project_id: str,
+    clip_ids: list[str],
+    *,
+    emb,
+    log,
+    cancel_evt,
+) -> int:
+    cap = get_caption_provider()
+    if type(cap).__name__.lower().startswith("null") or not clip_ids:
+        return 0
+    st = load_settings().vision
+    configure_payload_cache(max(0, int(getattr(st, "caption_payload_cache_mb", 256) or 0)) * 1024 * 1024)
+    meta = store.get_project_meta(project_id)
+    hint = str(meta.get("series_hint") or meta.get("ip_hint") or meta.get("name") or "").strip()
+    fn = getattr(cap, "set_project_hint", None)
+    if hint and callable(fn):
+        fn(hint)
+    fn = getattr(cap, "cache_key", None)
+    cap_key = str(fn() if callable(fn) else "").strip() or type(cap).__name__
+
+    cache_dir = store.project_cache_dir(project_id)
+    index_dir = os.path.join(cache_dir, "index")
+    vstore = CaptionVersionStore(index_dir, keep=int(getattr(st, "caption_cache_versions", 3) or 3))
+    if vstore.active_key() != cap_key:
+        log("WARNING: 图生文模型/提示词已变更，按需图生文已跳过（请先更新索引）。")
+        return 0
+
+    clips_json = os.path.join(index_dir, "clips.json")
+    vecs_npy = os.path.join(index_dir, "clip_vectors.npy")
+    with open(clips_json, "r", encoding="utf-8") as f:
+        index_meta = json.load(f)
+    clips: list[dict] = index_meta["clips"]
+    vecs = np.load(vecs_npy)
+    by_id = {str(c.get("clip_id") or ""): i for i, c in enumerate(clips)}
+    todo = [by_id[cid] for cid in dict.fromkeys(clip_ids) if cid in by_id and needs_caption(clips[by_id[cid]])]
+    if not todo:
+        return 0
+
+    groups: list[list[str]] = []
+    for ci in todo:
+        groups.append([p for p in (clips[ci].get("frames") or []) if os.path.isfile(p)])
+    batch = max(1, min(20, int(getattr(st, "caption_batch_clips", 1) or 1)))
+    workers = max(1, min(8, int(getattr(st, "caption_workers", 2) or 2)))
+    log(f"按需图生文：{len(todo)} 个候选切片（batch={batch}, workers={workers}）")
+
+    fn_groups = getattr(cap, "caption_image_groups", None)
+
+    def _caption(chunk: list[list[str]]) -> list[list[str]]:
+        # One caption per clip (written to all its frames), or per frame for providers without groups.
+        if callable(fn_groups):
+            return [[c] * len(g) for c, g in zip(fn_groups(chunk), chunk)]
+        return [cap.caption_image_paths(g) for g in chunk]
+
+    chunks = [list(range(i, min(len(todo), i + batch))) for i in range(0, len(todo), batch)]
+    results: dict[int, list[str]] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futs = [(idxs, ex.submit(_caption, [groups[i] for i in idxs])) for idxs in chunks]
+            for idxs, fut in futs:
+                if cancel_evt is not None:
+                    check_cancel(cancel_evt)
+                try:
+                    for i, caps in zip(idxs, fut.result()):
+                        results[i] = [str(c or "").strip() for c in caps]
+                except Exception as e:
+                    log(f"WARNING: 按需图生文失败（保留临时文本）：{e}")
+    finally:
+        cap.close()
+
+    if not results:
+        return 0
+
+    captions = vstore.load_active()
+    gcache: GlobalCaptionCache | None = None
+    if bool(getattr(st, "caption_global_cache", True)):
+        try:
+            gcache = GlobalCaptionCache.default(max_entries=int(getattr(st, "caption_global_cache_max_entries", 50000) or 50000))
+        except Exception:
+            gcache = None
+
+    updated: list[int] = []
+    for i, caps in results.items():
+        ci = todo[i]
+        c = clips[ci]
+        frames = groups[i]
+        if not caps or len(caps) != len(frames) or not any(caps):
+            continue
+        for p, txt in zip(frames, caps):
+            k = os.path.relpath(p, cache_dir).replace("\\", "/")
+            captions[k] = txt
+            if gcache is not None:
+                try:
+                    gcache.put(cap_key, file_digest(p), txt)
+                except OSError:
+                    pass
+        flags = sorted(flags_from_caps(caps))
+        c["captions"] = caps
+        c["text"] = merge_caps(caps)
+        c["flags"] = flags
+        c["blocked"] = any(x in BLOCK_FLAGS for x in flags)
+        c["caption_pending"] = False
+        c["caption_stale"] = False
+        updated.append(ci)
+
+    if not updated:
+        return 0
+    new_vecs = emb.embed_texts([str(clips[ci]["text"]) for ci in updated])
+    if vecs.ndim == 2 and new_vecs.ndim == 2 and new_vecs.shape[1] == vecs.shape[1]:
+        vecs[updated, :] = new_vecs
+    else:
+        log("WARNING: 向量维度不一致，按需图生文结果仅写入文本（请重建索引）。")
+
+    atomic_write_json(vstore.captions_path, captions)
+    if gcache is not None:
+        gcache.flush()
+    _atomic_save_npy(vecs_npy, vecs)
+    atomic_write_json(clips_json, index_meta)
+    log(f"按需图生文完成：{len(updated)}/{len(todo)} 个切片已写回索引")
+    return len(updated)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from app.core.ffmpeg import run_cmd
+from app.core.util import atomic_write_json
+from app.jobs.segment_cache import source_fingerprint
+
+
+# Short GOP without B-frames: an input seek decodes at most `_GOP - 1` extra frames.
+_GOP = 12
+
+
+class MezzanineCache:
+    """
+    Seek-friendly intermediates of frequently used sources (project cache/mezzanine/).
+
+    Long-GOP camera/web sources make every segment seek decode seconds of frames before the in point.
+    Sources used by at least `min_uses` render jobs are transcoded in the background to a short-GOP,
+    near-lossless H.264 file at render resolution; later renders read segments from it.
+
+    usage.json: {fingerprint id: {"source", "uses", "segments", "last_used"}}; files are
+    <id>_<height>p.mp4, evicted LRU by mtime (touched on use) beyond `quota_bytes`.
+    """
+
+    label = "Mezzanine"
+
+    def __init__(self, root: str, *, quota_bytes: int, min_uses: int) -> None:
+        self.root = root
+        self.quota_bytes = max(0, int(quota_bytes))
+        self.min_uses = max(1, int(min_uses))
+        self._usage_path = os.path.join(root, "usage.json")
+
+    @staticmethod
+    def _source_id(src: str) -> str:
+        return hashlib.sha1(json.dumps(source_fingerprint(src)).encode("utf-8")).hexdigest()[:16]
+
+    def path(self, src: str, *, height: int) -> str:
+        return os.path.join(self.root, f"{self._source_id(src)}_{int(height)}p.mp4")
+
+    def _read_usage(self) -> dict:
+        try:
+            with open(self._usage_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            return raw if isinstance(raw, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def record_usage(self, seg_counts: dict[str, int]) -> list[str]:
+        """Count one render job's use of each source; returns the sources that are now hot."""
+        os.makedirs(self.root, exist_ok=True)
+        usage = self._read_usage()
+        now = time.time()
+        hot: list[str] = []
+        for src, n in seg_counts.items():
+            sid = self._source_id(src)
+            ent = usage.get(sid) if isinstance(usage.get(sid), dict) else {}
+            ent = {
+                "source": src,
+                "uses": int(ent.get("uses", 0) or 0) + 1,
+                "segments": int(ent.get("segments", 0) or 0) + int(n),
+                "last_used": now,
+            }
+            usage[sid] = ent
+            if ent["uses"] >= self.min_uses:
+                hot.append(src)
+        # Forget sources not used for 90 days.
+        usage = {k: v for k, v in usage.items() if isinstance(v, dict) and now - float(v.get("last_used", 0) or 0) < 90 * 86400}
+        atomic_write_json(self._usage_path, usage)
+        return hot
+
+    def lookup(self, src: str, *, height: int) -> str | None:
+        """Ready mezzanine for `src` (touched for LRU), or None."""
+        p = self.path(src, height=height)
+        if not os.path.isfile(p):
+            return None
+        try:
+            os.utime(p, None)
+        except OSError:
+            pass
+        return p
+
+    def build(self, ffmpeg: str, src: str, *, height: int, log=None) -> str:
+        dst = self.path(src, height=height)
+        if os.path.isfile(dst):
+            return dst
+        os.makedirs(self.root, exist_ok=True)
+        tmp = dst + ".part.mp4"
+        run_cmd(
+            [
+                ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-y",
+                "-i",
+                src,
+                "-map",
+                "0:v:0",
+                # Same frames/timestamps as the source (segment in points map 1:1); never upscale.
+                "-vf",
+                f"scale=-2:'min(ih,{int(height)})'",
+                "-vsync",
+                "passthrough",
+                "-an",
+                "-sn",
+                "-dn",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "16",
+                "-g",
+                str(_GOP),
+                "-bf",
+                "0",
+                "-pix_fmt",
+                "yuv420p",
+                tmp,
+            ],
+            log_fn=log,
+        )
+        os.replace(tmp, dst)
+        self.evict(keep={dst}, log=log)
+        return dst
+
+    def evict(self, *, keep: set[str] | None = None, log=None) -> None:
+        if self.quota_bytes <= 0:
+            return
+        keep = {os.path.abspath(p) for p in (keep or set())}
+        ents: list[tuple[float, int, str]] = []
+        total = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for n in names:
+            if not n.endswith(".mp4") or n.endswith(".part.mp4"):
+                continue
+            p = os.path.join(self.root, n)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            total += int(st.st_size)
+            if os.path.abspath(p) not in keep:
+                ents.append((float(st.st_mtime), int(st.st_size), p))
+        ents.sort()
+        for _, size, p in ents:
+            if total <= self.quota_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+            if log:
+                log(f"{self.label} cache: evicted {os.path.basename(p)}")
+
+
+# One background builder per process (mezzanines and draft proxies): transcodes are heavy, never run them concurrently.
+_build_q: "queue.Queue[tuple[MezzanineCache, str, str, int, object]]" = queue.Queue()
+_queued: set[str] = set()
+_queued_lock = threading.Lock()
+_builder: threading.Thread | None = None
+
+
+def _builder_loop() -> None:
+    while True:
+        cache, ffmpeg, src, height, log = _build_q.get()
+        dst = cache.path(src, height=height)
+        try:
+            cache.build(ffmpeg, src, height=height, log=log)
+            if log:
+                log(f"{cache.label} ready: {os.path.basename(src)} -> {os.path.basename(dst)}")
+        except Exception as e:
+            if log:
+                log(f"WARNING: {cache.label.lower()} transcode failed ({os.path.basename(src)}): {e}")
+        finally:
+            with _queued_lock:
+                _queued.discard(dst)
+
+
+def schedule_mezzanine(cache: MezzanineCache, ffmpeg: str, src: str, *, height: int, log=None) -> bool:
+    """Queue a background transcode (deduplicated); False when it is ready or already queued."""
+    global _builder
+    dst = cache.path(src, height=height)
+    if os.path.isfile(dst):
+        return False
+    with _queued_lock:
+        if dst in _queued:
+            return False
+        _queued.add(dst)
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_builder_loop, name="mezzanine-builder", daemon=True)
+            _builder.start()
+    _build_q.put((cache, ffmpeg, src, int(height), log))
+    return True
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from app.core.settings import load_settings
+from app.core.util import check_cancel
+from app.jobs.render_job import RenderBatchContext, RenderJobRequest, _render_workers, run_render_job
+
+
+@dataclass(frozen=True)
+class BatchRenderJobRequest:
+    project_id: str
+    # One render per item (script/audio/meta/output); all items must target `project_id`.
+    items: tuple[RenderJobRequest, ...]
+    # Avoid shots already used by earlier videos of the batch (falls back to reuse when nothing else fits).
+    cross_video_dedup: bool = True
+    # Renders in flight at once (matching is still one script at a time); 0 = auto.
+    max_parallel: int = 0
+
+
+def run_batch_render_job(req: BatchRenderJobRequest, progress, log, pause_evt, cancel_evt) -> None:
+    """
+    Render several scripts against one project in a single job.
+
+    The index, the embedding sessions and the query-vector memo are loaded once and shared; scripts are
+    matched in order against one candidate pool (with cross-video dedup), and the segment encodes of all
+    outputs are scheduled on one worker pool. A failed item doesn't stop the others.
+    """
+    items = list(req.items)
+    if not items:
+        raise RuntimeError("Batch render: no items.")
+    for it in items:
+        if it.project_id != req.project_id:
+            raise RuntimeError(f"Batch render: item project {it.project_id} != {req.project_id}")
+    outs = [os.path.normcase(os.path.abspath(it.output_path)) for it in items]
+    if len(set(outs)) != len(outs):
+        raise RuntimeError("Batch render: output paths must be unique.")
+
+    st = load_settings()
+    workers = _render_workers(int(getattr(st.render, "render_workers", 0) or 0), 1 << 20)
+    n = len(items)
+    parallel = int(req.max_parallel or 0)
+    if parallel <= 0:
+        # Enough renders in flight to keep the shared pool busy while the next script is matched.
+        parallel = 3
+    parallel = max(1, min(parallel, n))
+    log(f"Batch render: {n} item(s), {parallel} in flight, {workers} segment worker(s)")
+
+    ctx = RenderBatchContext(req.project_id, workers=workers, cross_video_dedup=bool(req.cross_video_dedup))
+    pcts = [0] * n
+    lock = threading.Lock()
+    failed: list[tuple[int, str]] = []
+
+    def _run_item(k: int) -> None:
+        tag = f"[{k + 1}/{n}] "
+
+        def _progress(pct: int, stage: str) -> None:
+            with lock:
+                pcts[k] = int(pct)
+                total = sum(pcts) // n
+            progress(total, tag + str(stage or ""))
+
+        def _log(msg: str) -> None:
+            log(tag + str(msg or ""))
+
+        try:
+            check_cancel(cancel_evt)
+            run_render_job(items[k], _progress, _log, pause_evt, cancel_evt, batch=ctx, batch_index=k)
+        except Exception as e:
+            if cancel_evt.is_set() or str(e).strip().lower() == "cancelled":
+                raise
+            _log(f"FAILED: {e}")
+            with lock:
+                failed.append((k, str(e)))
+        finally:
+            # Later items must not wait on a script that never reached (or finished) matching.
+            ctx.done_matching(k)
+            with lock:
+                pcts[k] = 100
+            progress(sum(pcts) // n, tag + "done")
+
+    try:
+        # FIFO submission: item k only waits (matching turn) on items that were started before it.
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="render-batch") as ex:
+            futs = [ex.submit(_run_item, k) for k in range(n)]
+            for f in futs:
+                f.result()
+    finally:
+        ctx.close()
+
+    if failed:
+        msg = "; ".join(f"#{k + 1} {items[k].output_path}: {err}" for k, err in failed[:5])
+        raise RuntimeError(f"Batch render: {len(failed)}/{n} item(s) failed: {msg}")
+    progress(100, "Batch render complete")
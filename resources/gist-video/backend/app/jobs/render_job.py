@@ -3,7 +3,9 @@ from __future__ import annotations
 import json
 import os
 import re
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 
 import numpy as np
@@ -15,9 +17,33 @@ from app.core.settings import load_settings
 from app.core.util import atomic_write_json, check_cancel, wait_if_paused
 from app.embeddings.local_hash_embed import cosine_sim_matrix
 from app.embeddings.provider import LocalHashEmbeddingProvider, get_embedding_provider
+from app.jobs.edl_diff import diff_segments, find_previous_render, reuse_segment_file
+from app.jobs.hls_preview import HlsPreview
+from app.jobs.index_snapshot import latest_snapshot
+from app.jobs.lazy_caption import caption_clips_on_demand, needs_caption
+from app.jobs.mezzanine import MezzanineCache, schedule_mezzanine
+from app.jobs.render_proxy import RenderProxyCache
+from app.jobs.segment_cache import SegmentCache, ass_window_digest, source_fingerprint
 from app.subtitles.ass import write_simple_ass
 
 
+@dataclass(frozen=True)
+class OutputProfile:
+    output_path: str
+    output_width: int
+    output_height: int
+    # Used in file names and logs (default "<w>x<h>").
+    name: str = ""
+
+    @property
+    def width(self) -> int:
+        return int(self.output_width)
+
+    @property
+    def height(self) -> int:
+        return int(self.output_height)
+
+
 @dataclass(frozen=True)
 class RenderJobRequest:
     project_id: str
@@ -37,26 +63,70 @@ class RenderJobRequest:
     # Optional emphasis phrases for "花字" (comma-separated in UI; inline markup also supported).
     emphasis_phrases: tuple[str, ...] = ()
     emphasis_enable: bool = True
-
-
-def _load_index(store: ProjectStore, project_id: str) -> tuple[list[dict], np.ndarray, dict]:
+    # "final" | "draft" (low-res proxies, no look filters; for reviewing cut choices).
+    quality: str = "final"
+    # Extra outputs of the same narration/EDL (e.g. 9:16 next to 16:9), rendered from the same decode
+    # of every segment. The main output (output_path/output_width/output_height) is always the first.
+    output_profiles: tuple[OutputProfile, ...] = ()
+    # Publish finished segments (with narration audio) into a growing HLS playlist: <job_dir>/preview/.
+    preview_hls: bool = False
+
+
+def _resolve_output_profiles(req: RenderJobRequest) -> list[OutputProfile]:
+    out = [OutputProfile(req.output_path, int(req.output_width), int(req.output_height))]
+    seen = {os.path.normcase(os.path.abspath(req.output_path))}
+    for p in req.output_profiles:
+        k = os.path.normcase(os.path.abspath(p.output_path))
+        if k in seen:
+            raise RuntimeError(f"Duplicate output path in output profiles: {p.output_path}")
+        seen.add(k)
+        out.append(p)
+    names = [p.name or f"{p.width}x{p.height}" for p in out]
+    if len(set(names)) != len(names):
+        raise RuntimeError(f"Output profile names must be unique: {names}")
+    return out
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", str(name or "")).strip("_") or "out"
+
+
+def _load_index(store: ProjectStore, project_id: str) -> tuple[list[dict], np.ndarray, np.ndarray | None, dict]:
     cache_dir = store.project_cache_dir(project_id)
     index_dir = os.path.join(cache_dir, "index")
     clips_json = os.path.join(index_dir, "clips.json")
     vecs_npy = os.path.join(index_dir, "clip_vectors.npy")
     if not os.path.isfile(clips_json) or not os.path.isfile(vecs_npy):
-        raise RuntimeError("Index not found. Build the project index first.")
+        # Index job still running: use its latest published snapshot (completed videos only).
+        snap = latest_snapshot(index_dir)
+        if snap is None:
+            raise RuntimeError("Index not found. Build the project index first.")
+        clips_json, vecs_npy = snap
+        index_dir = os.path.dirname(clips_json)
     with open(clips_json, "r", encoding="utf-8") as f:
         meta = json.load(f)
     clips = meta["clips"]
     vecs = np.load(vecs_npy)
     emb_meta = meta.get("embedding", {}) if isinstance(meta, dict) else {}
-    return clips, vecs, emb_meta
-
-
-def _filter_blocked(clips: list[dict], vecs: np.ndarray, log) -> tuple[list[dict], np.ndarray]:
+    if isinstance(meta.get("snapshot"), dict):
+        emb_meta = dict(emb_meta, snapshot=meta["snapshot"])
+    # Optional frame image vectors (local image-text model); only used when rows line up with clips.
+    img_vecs = None
+    img_meta = emb_meta.get("image") if isinstance(emb_meta, dict) else None
+    if isinstance(img_meta, dict):
+        img_npy = os.path.join(index_dir, str(img_meta.get("file") or "clip_image_vectors.npy"))
+        if os.path.isfile(img_npy):
+            img_vecs = np.load(img_npy)
+            if img_vecs.ndim != 2 or int(img_vecs.shape[0]) != len(clips) or int(img_vecs.shape[1]) <= 0:
+                img_vecs = None
+    return clips, vecs, img_vecs, emb_meta
+
+
+def _filter_blocked(
+    clips: list[dict], vecs: np.ndarray, img_vecs: np.ndarray | None, log
+) -> tuple[list[dict], np.ndarray, np.ndarray | None]:
     if vecs.ndim != 2 or len(clips) != int(vecs.shape[0]):
-        return clips, vecs
+        return clips, vecs, img_vecs
     keep_idx = []
     blocked = 0
     for i, c in enumerate(clips):
@@ -68,7 +138,36 @@ def _filter_blocked(clips: list[dict], vecs: np.ndarray, log) -> tuple[list[dict
         log(f"过滤广告/片头片尾/版权切片：{blocked} 个")
     if not keep_idx:
         raise RuntimeError("所有切片都被过滤掉了（请把API设置里的跳过片头/片尾调小，或关闭过滤）。")
-    return [clips[i] for i in keep_idx], vecs[keep_idx, :]
+    return [clips[i] for i in keep_idx], vecs[keep_idx, :], (img_vecs[keep_idx, :] if img_vecs is not None else None)
+
+
+def _image_query_provider(emb_meta: dict, *, log):
+    """Text side of the index's image-text model (one per render/batch: loading the ONNX sessions is slow)."""
+    img_meta = emb_meta.get("image") if isinstance(emb_meta, dict) else None
+    if not isinstance(img_meta, dict):
+        return None
+    try:
+        from app.embeddings.onnx_clip import OnnxClipEmbeddingProvider
+
+        return _QueryEmbedder(OnnxClipEmbeddingProvider(model_id=str(img_meta.get("model_id") or "")))
+    except Exception as e:
+        log(f"WARNING: 图文向量模型不可用，仅使用文本向量匹配：{e}")
+        return None
+
+
+def _image_sims(queries: list[str], img_vecs: np.ndarray | None, *, log, provider) -> np.ndarray | None:
+    """Narration-to-frame similarity via the index's image-text model (None when unavailable)."""
+    if img_vecs is None or provider is None:
+        return None
+    try:
+        q = provider.embed_texts(queries)
+    except Exception as e:
+        log(f"WARNING: 图文向量模型不可用，仅使用文本向量匹配：{e}")
+        return None
+    if q.ndim != 2 or q.shape[1] != img_vecs.shape[1]:
+        log(f"WARNING: 图文向量维度不一致（{getattr(q, 'shape', None)} vs {img_vecs.shape}），已忽略画面向量。")
+        return None
+    return cosine_sim_matrix(q, img_vecs)
 
 
 def _provider_for_index(emb_meta: dict, *, fallback_dim: int) -> object:
@@ -92,6 +191,94 @@ def _provider_for_index(emb_meta: dict, *, fallback_dim: int) -> object:
     return get_embedding_provider()
 
 
+class _QueryEmbedder:
+    """
+    Memoizing `embed_texts` wrapper: each distinct query is embedded once per provider
+    (re-matching after lazy captioning, and every script of a batch render, reuse the vectors).
+    """
+
+    def __init__(self, provider) -> None:
+        self._provider = provider
+        self._memo: dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        with self._lock:
+            miss = [t for t in dict.fromkeys(texts) if t not in self._memo]
+            if miss:
+                vecs = np.asarray(self._provider.embed_texts(miss), dtype=np.float32)
+                if vecs.ndim != 2 or vecs.shape[0] != len(miss):
+                    return vecs
+                for t, v in zip(miss, vecs):
+                    self._memo[t] = v
+            if not texts:
+                return np.zeros((0, 0), dtype=np.float32)
+            return np.stack([self._memo[t] for t in texts])
+
+
+class RenderBatchContext:
+    """
+    State shared by the renders of one batch job (app.jobs.render_batch_job): the loaded index, the
+    embedding sessions and their query memo, the shots already used by earlier scripts (cross-video
+    dedup), and one segment worker pool. Matching runs one script at a time, in batch order.
+    """
+
+    def __init__(self, project_id: str, *, workers: int, cross_video_dedup: bool = True) -> None:
+        self.project_id = project_id
+        self.workers = max(1, int(workers))
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render-seg")
+        self.cross_video_dedup = bool(cross_video_dedup)
+        self.used_shots: set[str] = set()
+        self._index: tuple | None = None
+        self._emb: _QueryEmbedder | None = None
+        self._image_emb: _QueryEmbedder | None = None
+        self._image_emb_loaded = False
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._turn = 0
+        self._matched: set[int] = set()
+
+    def index(self, store: ProjectStore, log, *, reload: bool = False) -> tuple:
+        with self._lock:
+            if self._index is None or reload:
+                clips, vecs, img_vecs, emb_meta = _load_index(store, self.project_id)
+                clips, vecs, img_vecs = _filter_blocked(clips, vecs, img_vecs, log)
+                self._index = (clips, vecs, img_vecs, emb_meta)
+            return self._index
+
+    def embedder(self, emb_meta: dict, clip_vecs: np.ndarray) -> _QueryEmbedder:
+        with self._lock:
+            if self._emb is None:
+                self._emb = _QueryEmbedder(
+                    _provider_for_index(emb_meta, fallback_dim=int(clip_vecs.shape[1]) if clip_vecs.ndim == 2 else 512)
+                )
+            return self._emb
+
+    def image_embedder(self, emb_meta: dict, log) -> _QueryEmbedder | None:
+        with self._lock:
+            if not self._image_emb_loaded:
+                self._image_emb = _image_query_provider(emb_meta, log=log)
+                self._image_emb_loaded = True
+            return self._image_emb
+
+    def wait_turn(self, k: int, cancel_evt) -> None:
+        """Block until every earlier script of the batch has been matched (or failed)."""
+        with self._cond:
+            while self._turn < k:
+                check_cancel(cancel_evt)
+                self._cond.wait(timeout=0.2)
+
+    def done_matching(self, k: int) -> None:
+        with self._cond:
+            self._matched.add(int(k))
+            while self._turn in self._matched:
+                self._turn += 1
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
 def _split_script(text: str) -> list[str]:
     """
     Split script into narration units. Hard rule: only split on:
@@ -854,6 +1041,10 @@ def _pick_visual_segments_edgetts(
     keyword_boost: float,
     subtitle_heavy_penalty: float,
     min_same_source_gap_sec: float = 0.8,
+    image_sims: np.ndarray | None = None,
+    image_weight: float = 0.0,
+    emb=None,
+    avoid_shots: set[str] | None = None,
     log,
 ) -> list[dict]:
     """
@@ -862,6 +1053,7 @@ def _pick_visual_segments_edgetts(
     - Each unit maps to exactly ONE continuous video segment (no internal cuts).
     - Never cross real shot boundaries (user rejects natural cuts inside a narration unit).
     - If the best-matching shot is too short, pick a longer shot even if similarity is lower.
+    - `avoid_shots` (shot keys used by other videos of a batch) are skipped like dedup hits.
     """
     if not unit_texts:
         return []
@@ -873,7 +1065,8 @@ def _pick_visual_segments_edgetts(
     if not unit_times or len(unit_times) != len(unit_texts):
         raise RuntimeError("unit_times length mismatch.")
 
-    emb = _provider_for_index(emb_meta, fallback_dim=int(clip_vecs.shape[1]) if clip_vecs.ndim == 2 else 512)
+    if emb is None:
+        emb = _provider_for_index(emb_meta, fallback_dim=int(clip_vecs.shape[1]) if clip_vecs.ndim == 2 else 512)
     unit_vecs = emb.embed_texts(unit_queries)
     if unit_vecs.ndim != 2 or clip_vecs.ndim != 2 or unit_vecs.shape[1] != clip_vecs.shape[1]:
         raise RuntimeError(
@@ -881,6 +1074,16 @@ def _pick_visual_segments_edgetts(
         )
 
     sims = cosine_sim_matrix(unit_vecs, clip_vecs)
+    if image_sims is not None and float(image_weight) > 0.0 and image_sims.shape == sims.shape:
+        # Lazy-index clips without text have meaningless text vectors: give them each line's median text
+        # score, so only their frame similarity decides.
+        no_text = [i for i, c in enumerate(clips) if needs_caption(c) and not str(c.get("text") or "").strip()]
+        if no_text and len(no_text) < sims.shape[1]:
+            has_text = np.ones((sims.shape[1],), dtype=bool)
+            has_text[no_text] = False
+            sims[:, no_text] = np.median(sims[:, has_text], axis=1, keepdims=True)
+        # Fuse caption-text and frame-image similarity (same clip order).
+        sims = sims + float(image_weight) * image_sims
     shot_map, _shot_ids_by_source = _build_shot_index(clips)
     if not shot_map:
         raise RuntimeError("Index clips missing shot_id/shot_start/shot_end. Please rebuild index with scene slicing.")
@@ -947,6 +1150,8 @@ def _pick_visual_segments_edgetts(
             last = used.get(_shot_key(src, sid))
             if last is not None and (out_t - last) < float(dedup_window_sec):
                 continue
+            if avoid_shots and _shot_key(src, sid) in avoid_shots:
+                continue
             cand.append((int(hit), float(sc), float(shot_len), src, int(sid), int(ci)))
 
         # Fallback A: ignore dedup, still require shot_len >= target.
@@ -1065,6 +1270,51 @@ def _pick_visual_segments_edgetts(
     return segments
 
 
+def _lazy_shortlist(
+    unit_queries: list[str],
+    clips: list[dict],
+    clip_vecs: np.ndarray,
+    emb_meta: dict,
+    segments: list[dict],
+    *,
+    topk: int,
+    emb=None,
+    image_sims: np.ndarray | None = None,
+) -> list[str]:
+    """
+    Clip ids worth captioning now (lazy index): the picked anchors' shots first, then each line's
+    top-K caption_pending/caption_stale clips, ranked by text similarity for clips that have (stale)
+    text and by frame similarity (`image_sims`) for those that don't.
+    """
+    out: list[str] = []
+    anchors = {str(s.get("anchor_clip_id") or "") for s in segments}
+    anchor_shots = {(str(c.get("source_path") or ""), int(c.get("shot_id", -1))) for c in clips if str(c.get("clip_id") or "") in anchors}
+    for c in clips:
+        if needs_caption(c) and (str(c.get("source_path") or ""), int(c.get("shot_id", -1))) in anchor_shots:
+            out.append(str(c.get("clip_id") or ""))
+
+    if emb is None:
+        emb = _provider_for_index(emb_meta, fallback_dim=int(clip_vecs.shape[1]) if clip_vecs.ndim == 2 else 512)
+    q = emb.embed_texts(unit_queries)
+    if q.ndim != 2 or clip_vecs.ndim != 2 or q.shape[1] != clip_vecs.shape[1]:
+        return [x for x in dict.fromkeys(out) if x]
+    sims = cosine_sim_matrix(q, clip_vecs)
+    with_text = [i for i, c in enumerate(clips) if needs_caption(c) and str(c.get("text") or "").strip()]
+    without = [i for i, c in enumerate(clips) if needs_caption(c) and not str(c.get("text") or "").strip()]
+    ranked = [(sims, with_text)]
+    if image_sims is not None and image_sims.shape == sims.shape:
+        ranked.append((image_sims, without))
+    for mat, cols in ranked:
+        if not cols:
+            continue
+        k = max(1, min(int(topk), len(cols)))
+        sub = mat[:, cols]
+        for row in sub:
+            for j in np.argpartition(-row, k - 1)[:k].tolist():
+                out.append(str(clips[cols[int(j)]].get("clip_id") or ""))
+    return [x for x in dict.fromkeys(out) if x]
+
+
 def _ffmpeg_escape_path(p: str) -> str:
     # For subtitles filter; keep it simple for Windows paths.
     return p.replace("\\", "/").replace(":", "\\:")
@@ -1074,6 +1324,79 @@ def _ffmpeg_escape_drawtext(s: str) -> str:
     return s.replace("\\", "\\\\").replace(":", "\\:").replace("'", "\\'")
 
 
+# Bump when the segment filter graph / encoder args change (invalidates the segment cache).
+_SEGMENT_FILTER_VERSION = 1
+
+
+def _segment_vf(
+    *,
+    out_fps: int,
+    out_w: int,
+    out_h: int,
+    subtitles_ass: str = "",
+    t_offset: float = 0.0,
+    draft: bool = False,
+    fill: bool | None = None,
+    tag: str = "",
+) -> str:
+    """
+    Per-segment video filter chain (input: decoded source frames from the segment's in point).
+    `tag` suffixes the internal pad labels so several chains can share one filter_complex.
+    """
+    blur_h = "ih*0.22"
+    blur_y = "ih*0.78"
+    # NOTE: `overlay` doesn't have `ih/iw` vars; use main_h/main_w there.
+    overlay_y = "main_h*0.78"
+    if fill is None:
+        fill = int(out_w) == 1080 and int(out_h) == 1920
+    if fill:
+        scale = f"scale={int(out_w)}:{int(out_h)}:force_original_aspect_ratio=increase,crop={int(out_w)}:{int(out_h)}"
+    else:
+        # Preserve full frame (no crop) and pad to target; keeps output truly 16:9.
+        scale = (
+            f"scale={int(out_w)}:{int(out_h)}:force_original_aspect_ratio=decrease,"
+            f"pad={int(out_w)}:{int(out_h)}:(ow-iw)/2:(oh-ih)/2:color=black"
+        )
+
+    if draft:
+        vf = f"{scale},fps={out_fps},setsar=1,setpts=PTS-STARTPTS"
+    else:
+        vf = (
+            f"split=2[vbase{tag}][vblur{tag}];"
+            f"[vblur{tag}]crop=w=iw:h={blur_h}:x=0:y={blur_y},boxblur=10:1[vb{tag}];"
+            f"[vbase{tag}][vb{tag}]overlay=x=0:y={overlay_y},"
+            "unsharp=5:5:0.4,eq=saturation=1.03:contrast=1.02,"
+            f"{scale},fps={out_fps},setsar=1,setpts=PTS-STARTPTS"
+        )
+    if subtitles_ass:
+        vf += (
+            f",setpts=PTS+{float(t_offset):.6f}/TB,"
+            f"subtitles='{_ffmpeg_escape_path(subtitles_ass)}',setpts=PTS-STARTPTS"
+        )
+    return vf
+
+
+def _segment_encode_args(*, draft: bool, threads: int) -> list[str]:
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-crf",
+        "30" if draft else "23",
+        "-pix_fmt",
+        "yuv420p",
+        *(["-threads", str(int(threads))] if int(threads) > 0 else []),
+        "-f",
+        "mpegts",
+    ]
+
+
+def _clamp_out_fps(out_fps: int) -> int:
+    out_fps = int(out_fps) if int(out_fps) > 0 else 25
+    return max(10, min(60, out_fps))
+
+
 def _render_segment(
     ffmpeg: str,
     *,
@@ -1085,36 +1408,37 @@ def _render_segment(
     out_h: int,
     out_ts: str,
     log,
+    threads: int = 0,
+    cancel_evt=None,
+    subtitles_ass: str = "",
+    t_offset: float = 0.0,
+    draft: bool = False,
+    fill: bool | None = None,
 ) -> None:
+    """
+    With `subtitles_ass`, the subtitles are burned here: frames are shifted to the segment's position
+    on the output timeline (`t_offset`) for libass, then rebased to 0 for concat.
+    `draft` skips the blur/sharpen/color chain and encodes at a lower quality; `fill` (crop to fill
+    instead of pad) defaults to the 1080x1920 vertical layout.
+    """
     if os.path.isfile(out_ts):
         return
     os.makedirs(os.path.dirname(out_ts), exist_ok=True)
 
-    out_fps = int(out_fps) if int(out_fps) > 0 else 25
-    out_fps = max(10, min(60, out_fps))
+    out_fps = _clamp_out_fps(out_fps)
     nframes = int(nframes)
     if nframes <= 0:
         raise RuntimeError(f"Invalid nframes: {nframes}")
-
-    blur_h = "ih*0.22"
-    blur_y = "ih*0.78"
-    # NOTE: `overlay` doesn't have `ih/iw` vars; use main_h/main_w there.
-    overlay_y = "main_h*0.78"
-    if int(out_w) == 1080 and int(out_h) == 1920:
-        scale = "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920"
-    else:
-        # Preserve full frame (no crop) and pad to target; keeps output truly 16:9.
-        scale = (
-            f"scale={int(out_w)}:{int(out_h)}:force_original_aspect_ratio=decrease,"
-            f"pad={int(out_w)}:{int(out_h)}:(ow-iw)/2:(oh-ih)/2:color=black"
-        )
-
-    vf = (
-        "split=2[vbase][vblur];"
-        f"[vblur]crop=w=iw:h={blur_h}:x=0:y={blur_y},boxblur=10:1[vb];"
-        f"[vbase][vb]overlay=x=0:y={overlay_y},"
-        "unsharp=5:5:0.4,eq=saturation=1.03:contrast=1.02,"
-        f"{scale},fps={out_fps},setsar=1,setpts=PTS-STARTPTS"
+    tmp_ts = out_ts + ".part"
+
+    vf = _segment_vf(
+        out_fps=out_fps,
+        out_w=out_w,
+        out_h=out_h,
+        subtitles_ass=subtitles_ass,
+        t_offset=t_offset,
+        draft=draft,
+        fill=fill,
     )
 
     run_cmd(
@@ -1131,33 +1455,232 @@ def _render_segment(
             vf,
             "-frames:v",
             str(int(nframes)),
-            "-c:v",
-            "libx264",
-            "-preset",
-            "ultrafast",
-            "-crf",
-            "23",
-            "-pix_fmt",
-            "yuv420p",
-            "-f",
-            "mpegts",
-            out_ts,
+            *_segment_encode_args(draft=draft, threads=threads),
+            tmp_ts,
+        ],
+        log_fn=log,
+        cancel_evt=cancel_evt,
+    )
+    # Only complete segments get the final name (a killed encode must not be reused).
+    os.replace(tmp_ts, out_ts)
+
+
+def _render_segment_group(
+    ffmpeg: str,
+    *,
+    src: str,
+    parts: list[dict],
+    outputs: list[dict],
+    out_fps: int,
+    log,
+    threads: int = 0,
+    cancel_evt=None,
+    draft: bool = False,
+) -> None:
+    """
+    Render several segments of one source, for one or more output profiles, in a single ffmpeg run:
+    one open + one seek (to the earliest in point); the decoded frames are split per segment, trimmed
+    to its own in point, split again per profile and go through the regular segment chain into their
+    own outputs. `-frames:v` per output keeps every segment exactly `nframes` long, as in `_render_segment`.
+
+    parts: [{"in": float, "nframes": int, "t_offset": float, "out_ts": [path per output]}]
+    outputs: [{"out_w": int, "out_h": int, "fill": bool, "subtitles_ass": str}]
+    """
+    work: list[tuple[dict, list[int]]] = []
+    for p in parts:
+        need = [o for o in range(len(outputs)) if not os.path.isfile(p["out_ts"][o])]
+        if need:
+            work.append((p, need))
+    if not work:
+        return
+    if len(work) == 1 and len(work[0][1]) == 1:
+        p, (o,) = work[0]
+        _render_segment(
+            ffmpeg,
+            src=src,
+            in_t=float(p["in"]),
+            nframes=int(p["nframes"]),
+            out_fps=out_fps,
+            out_w=int(outputs[o]["out_w"]),
+            out_h=int(outputs[o]["out_h"]),
+            out_ts=p["out_ts"][o],
+            log=log,
+            threads=threads,
+            cancel_evt=cancel_evt,
+            subtitles_ass=str(outputs[o].get("subtitles_ass") or ""),
+            t_offset=float(p.get("t_offset", 0.0)),
+            draft=draft,
+            fill=outputs[o].get("fill"),
+        )
+        return
+
+    out_fps = _clamp_out_fps(out_fps)
+    base = min(float(p["in"]) for p, _ in work)
+    n = len(work)
+    graph = ["[0:v]null[s0]" if n == 1 else f"[0:v]split={n}" + "".join(f"[s{k}]" for k in range(n))]
+    outs: list[str] = []
+    tmps: list[tuple[str, str]] = []
+    for k, (p, need) in enumerate(work):
+        nframes = int(p["nframes"])
+        if nframes <= 0:
+            raise RuntimeError(f"Invalid nframes: {nframes}")
+        t0 = float(p["in"]) - base
+        # End a little past the last needed frame so the branch stops pulling frames (and buffering in split).
+        t1 = t0 + (nframes + 2) / float(out_fps) + 0.5
+        trim = f"[s{k}]trim=start={t0:.6f}:end={t1:.6f},setpts=PTS-STARTPTS"
+        if len(need) == 1:
+            branches = [(need[0], f"{trim},")]
+        else:
+            graph.append(f"{trim},split={len(need)}" + "".join(f"[s{k}p{o}]" for o in need))
+            branches = [(o, f"[s{k}p{o}]") for o in need]
+        for o, head in branches:
+            out = outputs[o]
+            vf = _segment_vf(
+                out_fps=out_fps,
+                out_w=int(out["out_w"]),
+                out_h=int(out["out_h"]),
+                subtitles_ass=str(out.get("subtitles_ass") or ""),
+                t_offset=float(p.get("t_offset", 0.0)),
+                draft=draft,
+                fill=out.get("fill"),
+                tag=f"{k}p{o}",
+            )
+            graph.append(f"{head}{vf}[o{k}p{o}]")
+            out_ts = p["out_ts"][o]
+            os.makedirs(os.path.dirname(out_ts), exist_ok=True)
+            outs += [
+                "-map",
+                f"[o{k}p{o}]",
+                "-frames:v",
+                str(nframes),
+                *_segment_encode_args(draft=draft, threads=threads),
+                out_ts + ".part",
+            ]
+            tmps.append((out_ts + ".part", out_ts))
+
+    run_cmd(
+        [
+            ffmpeg,
+            "-y",
+            "-hide_banner",
+            "-ss",
+            f"{base:.3f}",
+            "-i",
+            src,
+            "-an",
+            "-filter_complex",
+            ";".join(graph),
+            *outs,
         ],
         log_fn=log,
+        cancel_evt=cancel_evt,
     )
+    for tmp, out_ts in tmps:
+        os.replace(tmp, out_ts)
 
 
-def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt) -> None:
+def _group_segments(
+    render_items: list[dict], todo: list[int], *, out_fps: int, max_group: int, max_gap_sec: float = 5.0
+) -> list[list[int]]:
+    """
+    Batch consecutive to-render segments of the same source whose in points are close enough that one
+    seek + continuous decode over their span costs less than separate seeks (gaps up to `max_gap_sec`).
+    """
+    groups: list[list[int]] = []
+    for i in todo:
+        it = render_items[i]
+        lo = float(it["in"])
+        hi = lo + int(it["nframes"]) / float(out_fps)
+        g = groups[-1] if groups else None
+        if g is not None and len(g) < max(1, int(max_group)) and g[-1] == i - 1:
+            first = render_items[g[0]]
+            if str(first["source"]) == str(it["source"]):
+                spans = [
+                    (float(render_items[j]["in"]), float(render_items[j]["in"]) + int(render_items[j]["nframes"]) / float(out_fps))
+                    for j in g
+                ] + [(lo, hi)]
+                span = max(b for _, b in spans) - min(a for a, _ in spans)
+                if span <= sum(b - a for a, b in spans) + float(max_gap_sec):
+                    g.append(i)
+                    continue
+        groups.append([i])
+    return groups
+
+
+def _render_workers(setting: int, nseg: int) -> int:
+    n = int(setting or 0)
+    if n <= 0:
+        # libx264 is itself multi-threaded; a few concurrent encodes fill the remaining cores.
+        n = max(1, min(8, (os.cpu_count() or 2) // 2))
+    return max(1, min(n, max(1, nseg)))
+
+
+def run_render_job(
+    req: RenderJobRequest,
+    progress,
+    log,
+    pause_evt,
+    cancel_evt,
+    *,
+    batch: RenderBatchContext | None = None,
+    batch_index: int = 0,
+    artifact=None,
+) -> None:
+    """
+    `artifact(dict)` (optional) is called when an output becomes available while the job runs
+    (currently the HLS preview: {"kind": "preview_hls", "dir", "playlist"}).
+    """
+    seg_caches: list[SegmentCache] = []
+    try:
+        _run_render_job(
+            req,
+            progress,
+            log,
+            pause_evt,
+            cancel_evt,
+            batch=batch,
+            batch_index=batch_index,
+            artifact=artifact,
+            seg_caches=seg_caches,
+        )
+    finally:
+        # Cached segments stay reserved through concat, and are released even when the render fails.
+        for c in seg_caches:
+            c.release()
+
+
+def _run_render_job(
+    req: RenderJobRequest,
+    progress,
+    log,
+    pause_evt,
+    cancel_evt,
+    *,
+    batch: RenderBatchContext | None,
+    batch_index: int,
+    artifact,
+    seg_caches: list[SegmentCache],
+) -> None:
     store = ProjectStore.default()
-    clips, clip_vecs, emb_meta = _load_index(store, req.project_id)
-    clips, clip_vecs = _filter_blocked(clips, clip_vecs, log)
+    if batch is not None:
+        clips, clip_vecs, img_vecs, emb_meta = batch.index(store, log)
+    else:
+        clips, clip_vecs, img_vecs, emb_meta = _load_index(store, req.project_id)
+        clips, clip_vecs, img_vecs = _filter_blocked(clips, clip_vecs, img_vecs, log)
+    snap = emb_meta.get("snapshot")
+    if isinstance(snap, dict):
+        log(
+            f"使用索引快照（索引仍在进行）：{snap.get('videos_done')}/{snap.get('videos_total')} 个视频，"
+            f"{len(clips)} 个切片"
+        )
 
     if not os.path.isfile(req.voice_audio_path):
         raise RuntimeError(f"Voice audio not found: {req.voice_audio_path}")
     if req.bgm_audio_path and not os.path.isfile(req.bgm_audio_path):
         raise RuntimeError(f"BGM not found: {req.bgm_audio_path}")
-    if os.path.isfile(req.output_path):
-        raise RuntimeError(f"Output already exists (refusing to overwrite): {req.output_path}")
+    for prof in _resolve_output_profiles(req):
+        if os.path.isfile(prof.output_path):
+            raise RuntimeError(f"Output already exists (refusing to overwrite): {prof.output_path}")
 
     bins = find_ffmpeg()
     out_dir = os.path.dirname(os.path.abspath(req.output_path))
@@ -1278,24 +1801,80 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
             q = q + "；关键词:" + " ".join(str(x) for x in hs[:6] if str(x).strip())
         unit_queries.append(q)
 
-    segments = _pick_visual_segments_edgetts(
-        unit_texts=script_lines,
-        unit_queries=unit_queries,
-        unit_hints=unit_hints,
-        unit_times=line_times,
-        clips=clips,
-        clip_vecs=clip_vecs,
-        emb_meta=emb_meta,
-        dedup_window_sec=req.dedup_window_sec,
-        keyword_boost=float(st.render.match_keyword_boost),
-        subtitle_heavy_penalty=float(getattr(st.render, "match_penalty_subtitle_heavy", 0.06) or 0.06),
-        log=log,
-    )
+    image_weight = float(getattr(st.render, "match_image_weight", 0.5) or 0.0)
+    avoid_shots: set[str] | None = None
+    if batch is not None:
+        # Scripts of a batch are matched in order, each avoiding the shots of the earlier ones.
+        batch.wait_turn(batch_index, cancel_evt)
+        if batch_index > 0:
+            clips, clip_vecs, img_vecs, emb_meta = batch.index(store, log)
+        avoid_shots = batch.used_shots if batch.cross_video_dedup else None
+
+    # Built once per render (or batch) and reused when lazy captioning triggers a second match.
+    image_emb = None
+    if image_weight > 0.0 and img_vecs is not None:
+        image_emb = batch.image_embedder(emb_meta, log) if batch is not None else _image_query_provider(emb_meta, log=log)
+
+    def _frame_sims() -> np.ndarray | None:
+        if image_weight <= 0.0:
+            return None
+        return _image_sims(script_lines, img_vecs, log=log, provider=image_emb)
+
+    def _match(image_sims: np.ndarray | None) -> list[dict]:
+        return _pick_visual_segments_edgetts(
+            unit_texts=script_lines,
+            unit_queries=unit_queries,
+            unit_hints=unit_hints,
+            unit_times=line_times,
+            clips=clips,
+            clip_vecs=clip_vecs,
+            emb_meta=emb_meta,
+            dedup_window_sec=req.dedup_window_sec,
+            keyword_boost=float(st.render.match_keyword_boost),
+            subtitle_heavy_penalty=float(getattr(st.render, "match_penalty_subtitle_heavy", 0.06) or 0.06),
+            image_sims=image_sims,
+            image_weight=image_weight,
+            emb=batch.embedder(emb_meta, clip_vecs) if batch is not None else None,
+            avoid_shots=avoid_shots,
+            log=log,
+        )
+
+    image_sims = _frame_sims()
+    segments = _match(image_sims)
+
+    # Lazy index: caption the shortlisted pending/stale clips now, write them back, then match again.
+    lazy_topk = int(getattr(st.render, "lazy_caption_topk", 8) or 0)
+    if lazy_topk > 0 and not isinstance(snap, dict) and any(needs_caption(c) for c in clips):
+        ids = _lazy_shortlist(
+            unit_queries,
+            clips,
+            clip_vecs,
+            emb_meta,
+            segments,
+            topk=lazy_topk,
+            emb=batch.embedder(emb_meta, clip_vecs) if batch is not None else None,
+            image_sims=image_sims,
+        )
+        if ids:
+            progress(15, f"按需图生文：{len(ids)} 个候选切片…")
+            emb = _provider_for_index(emb_meta, fallback_dim=int(clip_vecs.shape[1]) if clip_vecs.ndim == 2 else 512)
+            if caption_clips_on_demand(store, req.project_id, ids, emb=emb, log=log, cancel_evt=cancel_evt):
+                if batch is not None:
+                    clips, clip_vecs, img_vecs, emb_meta = batch.index(store, log, reload=True)
+                else:
+                    clips, clip_vecs, img_vecs, emb_meta = _load_index(store, req.project_id)
+                    clips, clip_vecs, img_vecs = _filter_blocked(clips, clip_vecs, img_vecs, log)
+                # Rows may have changed (newly blocked clips): recompute the frame similarities.
+                image_sims = _frame_sims()
+                segments = _match(image_sims)
+    if batch is not None:
+        batch.used_shots.update(f"{s['source']}#shot{int(s['shot_id'])}" for s in segments)
+        batch.done_matching(batch_index)
     log(f"Subtitle units: {len(script_lines)}, visual segments: {len(segments)} (edgetts)")
 
     jobs_dir = store.project_jobs_dir(req.project_id)
     os.makedirs(jobs_dir, exist_ok=True)
-    job_id = f"render_{int(time.time())}"
+    job_id = f"render_{int(time.time())}" + (f"_{batch_index:03d}" if batch is not None else "")
     job_dir = os.path.join(jobs_dir, job_id)
     os.makedirs(job_dir, exist_ok=True)
 
@@ -1305,6 +1884,7 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
         "created_at": time.time(),
         "timeline_mode": timeline_mode,
         "project_name": project_name,
+        "output_path": req.output_path,
         "lines": [
             {"i": i, "start": float(line_times[i][0]), "end": float(line_times[i][1]), "text": script_lines[i]}
             for i in range(min(len(script_lines), len(line_times)))
@@ -1314,7 +1894,6 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
     atomic_write_json(edl_path, edl)
 
     progress(30, "Generating subtitles...")
-    ass_path = os.path.join(job_dir, "subtitles.ass")
     events = []
     # Subtitles use the script text (your use-case: audio is generated from the script).
     for i in range(min(len(script_lines), len(line_times))):
@@ -1324,34 +1903,63 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
         if txt:
             events.append({"start": stt, "end": ent, "text": txt, "emphasis": []})
 
-    out_w = int(req.output_width)
-    out_h = int(req.output_height)
-    # Subtitle style (settings.json); default tuned for 16:9.
-    font_size = int(round(out_h * float(st.render.subtitles_font_size_vh) / 100.0))
-    margin_v = int(round(out_h * float(st.render.subtitles_margin_bottom_vh) / 100.0))
-    safe_lr = int(round(out_w * float(st.render.subtitles_safe_lr_vw) / 100.0))
-    # Hard rule for your workflow: 1-line subtitles; do NOT auto-wrap or ellipsis.
-    max_chars = 10_000
-    write_simple_ass(
-        ass_path,
-        events,
-        play_res_x=out_w,
-        play_res_y=out_h,
-        font_name=str(st.render.subtitles_font_name),
-        font_size=font_size,
-        margin_v=margin_v,
-        margin_l=safe_lr,
-        margin_r=safe_lr,
-        shadow_alpha=float(st.render.subtitles_shadow_alpha),
-        shadow_blur=float(st.render.subtitles_shadow_blur),
-        shadow_x=int(st.render.subtitles_shadow_x),
-        shadow_y=int(st.render.subtitles_shadow_y),
-        max_chars_per_line=max_chars,
-        max_lines=1,
-        emphasis_enable=emphasis_enable,
-        emphasis_max_per_line=int(st.render.emphasis_max_per_line),
-        emphasis_popup_sec=float(st.render.emphasis_popup_sec),
-    )
+    draft = str(req.quality or "final").strip().lower() == "draft"
+    profiles = _resolve_output_profiles(req)
+    outputs: list[dict] = []
+    for pi, prof in enumerate(profiles):
+        out_w = int(prof.width)
+        out_h = int(prof.height)
+        fill = out_w == 1080 and out_h == 1920
+        if draft:
+            # Same EDL and subtitle layout, scaled down (subtitle sizes follow out_h).
+            k = max(90, int(getattr(st.render, "draft_height", 360) or 360)) / float(min(out_w, out_h))
+            if k < 1.0:
+                out_w = max(2, int(round(out_w * k / 2)) * 2)
+                out_h = max(2, int(round(out_h * k / 2)) * 2)
+        name = prof.name or f"{int(prof.width)}x{int(prof.height)}"
+        ass_path = os.path.join(job_dir, "subtitles.ass" if pi == 0 else f"subtitles_{_safe_name(name)}.ass")
+        # Subtitle style (settings.json); default tuned for 16:9.
+        font_size = int(round(out_h * float(st.render.subtitles_font_size_vh) / 100.0))
+        margin_v = int(round(out_h * float(st.render.subtitles_margin_bottom_vh) / 100.0))
+        safe_lr = int(round(out_w * float(st.render.subtitles_safe_lr_vw) / 100.0))
+        # Hard rule for your workflow: 1-line subtitles; do NOT auto-wrap or ellipsis.
+        max_chars = 10_000
+        write_simple_ass(
+            ass_path,
+            events,
+            play_res_x=out_w,
+            play_res_y=out_h,
+            font_name=str(st.render.subtitles_font_name),
+            font_size=font_size,
+            margin_v=margin_v,
+            margin_l=safe_lr,
+            margin_r=safe_lr,
+            shadow_alpha=float(st.render.subtitles_shadow_alpha),
+            shadow_blur=float(st.render.subtitles_shadow_blur),
+            shadow_x=int(st.render.subtitles_shadow_x),
+            shadow_y=int(st.render.subtitles_shadow_y),
+            max_chars_per_line=max_chars,
+            max_lines=1,
+            emphasis_enable=emphasis_enable,
+            emphasis_max_per_line=int(st.render.emphasis_max_per_line),
+            emphasis_popup_sec=float(st.render.emphasis_popup_sec),
+        )
+        outputs.append(
+            {
+                "name": name,
+                "output_path": prof.output_path,
+                "out_w": out_w,
+                "out_h": out_h,
+                "fill": fill,
+                "ass_path": ass_path,
+            }
+        )
+    if draft:
+        log("Draft render: " + ", ".join(f"{o['out_w']}x{o['out_h']}" for o in outputs) + " from low-res proxies, look filters off")
+    if len(outputs) > 1:
+        log("Output profiles: " + ", ".join(f"{o['name']} ({o['out_w']}x{o['out_h']}) -> {o['output_path']}" for o in outputs))
+    # Sources are decoded at the largest profile height (a vertical crop needs the full height).
+    src_h = max(int(o["out_h"]) for o in outputs)
 
     wait_if_paused(pause_evt, cancel_evt)
     check_cancel(cancel_evt)
@@ -1359,7 +1967,6 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
 
     seg_dir = os.path.join(job_dir, "segments")
     os.makedirs(seg_dir, exist_ok=True)
-    seg_paths: list[str] = []
 
     # Render inputs: one visual segment per narration unit (no padding/no speed change).
     render_items = []
@@ -1378,82 +1985,330 @@ def run_render_job(req: RenderJobRequest, progress, log, pause_evt, cancel_evt)
         )
     nseg = len(render_items)
 
-    for i, item in enumerate(render_items):
-        wait_if_paused(pause_evt, cancel_evt)
-        check_cancel(cancel_evt)
+    for o, out in enumerate(outputs):
+        sub = "" if o == 0 else f"_{_safe_name(out['name'])}"
+        out["seg_paths"] = [os.path.join(seg_dir, f"seg_{i:05d}{sub}.ts") for i in range(nseg)]
+    workers = batch.workers if batch is not None else _render_workers(int(getattr(st.render, "render_workers", 0) or 0), nseg)
+    x264_threads = max(1, (os.cpu_count() or 2) // workers) if workers > 1 else 0
+    single_encode = bool(getattr(st.render, "single_encode", False))
+    # Output-timeline start of each segment (frame-exact: segments are cut by frame count).
+    seg_offsets: list[float] = []
+    acc = 0
+    for item in render_items:
+        seg_offsets.append(acc / float(out_fps))
+        acc += int(item["nframes"])
+    log(f"Rendering {nseg} segments with {workers} worker(s)" + (" (subtitles burned per segment)" if single_encode else ""))
+
+    # Draft sources: a cached draft proxy when one is tall enough. Missing proxies are queued for the
+    # background builder; this draft decodes the source (never waits on a transcode).
+    draft_src: dict[str, str] = {}
+    if draft and nseg > 0:
+        rp = RenderProxyCache(
+            os.path.join(store.project_cache_dir(req.project_id), "render_proxies"),
+            quota_bytes=int(getattr(st.render, "draft_proxy_cache_mb", 0) or 0) << 20,
+            fps=int(out_fps),
+        )
+        srcs = list(dict.fromkeys(str(item["source"]) for item in render_items))
+        queued = 0
+        for src in srcs:
+            p = rp.lookup(src, height=src_h)
+            if p:
+                draft_src[src] = p
+            elif schedule_mezzanine(rp, bins.ffmpeg, src, height=src_h, log=log):
+                queued += 1
+        log(
+            f"Draft proxies: {len(draft_src)}/{len(srcs)} source(s) ready"
+            + (f", {queued} queued for background build" if queued else "")
+        )
 
-        out_ts = os.path.join(seg_dir, f"seg_{i:05d}.ts")
-        _render_segment(
+    # Seek-friendly intermediates of frequently used sources (final renders only).
+    mezz_src: dict[str, str] = {}
+    mezz_min_uses = int(getattr(st.render, "mezzanine_min_uses", 0) or 0)
+    if mezz_min_uses > 0 and not draft and nseg > 0:
+        mz = MezzanineCache(
+            os.path.join(store.project_cache_dir(req.project_id), "mezzanine"),
+            quota_bytes=int(getattr(st.render, "mezzanine_cache_mb", 0) or 0) << 20,
+            min_uses=mezz_min_uses,
+        )
+        counts: dict[str, int] = {}
+        for item in render_items:
+            counts[str(item["source"])] = counts.get(str(item["source"]), 0) + 1
+        try:
+            hot = mz.record_usage(counts)
+            for src in counts:
+                ready = mz.lookup(src, height=src_h)
+                if ready:
+                    mezz_src[src] = ready
+            queued = [s for s in hot if s not in mezz_src and schedule_mezzanine(mz, bins.ffmpeg, s, height=src_h, log=log)]
+            log(f"Mezzanine: {len(mezz_src)}/{len(counts)} source(s) ready" + (f", {len(queued)} queued for background transcode" if queued else ""))
+        except Exception as e:
+            check_cancel(cancel_evt)
+            log(f"WARNING: mezzanine cache unavailable: {e}")
+
+    # Content key of every segment (what determines its encoded bytes).
+    # The decoded file (draft proxy / mezzanine / source) is part of the key: a segment decoded from a
+    # proxy is not the same bytes as one decoded from the original.
+    fps_of: dict[str, list] = {}
+    decode_of: dict[str, list] = {}
+    for out in outputs:
+        keys: list[str] = []
+        for i, item in enumerate(render_items):
+            src = str(item["source"])
+            if src not in fps_of:
+                fps_of[src] = source_fingerprint(src)
+                dsrc = draft_src.get(src, src) if draft else mezz_src.get(src, src)
+                decode_of[src] = [*source_fingerprint(dsrc), int(src_h) if dsrc != src else 0]
+            t0 = seg_offsets[i]
+            t1 = t0 + int(item["nframes"]) / float(out_fps)
+            keys.append(
+                SegmentCache.key(
+                    {
+                        "v": _SEGMENT_FILTER_VERSION,
+                        "src": fps_of[src],
+                        "decode": decode_of[src],
+                        "in": round(float(item["in"]), 3),
+                        "nframes": int(item["nframes"]),
+                        "fps": int(out_fps),
+                        "size": [int(out["out_w"]), int(out["out_h"])],
+                        "q": "draft" if draft else "final",
+                        "subs": ass_window_digest(out["ass_path"], t0, t1) if single_encode else "",
+                    }
+                )
+            )
+        out["seg_keys"] = keys
+
+    seg_cache: SegmentCache | None = None
+    cache_mb = int(getattr(st.render, "segment_cache_mb", 0) or 0)
+    if cache_mb > 0:
+        seg_cache = SegmentCache(
+            os.path.join(store.project_cache_dir(req.project_id), "render_segments"), quota_bytes=cache_mb << 20
+        )
+        seg_caches.append(seg_cache)
+        # Segments are rendered straight into the cache; concat reads them from there.
+        for out in outputs:
+            out["seg_paths"] = [seg_cache.lookup(k) for k in out["seg_keys"]]
+        log(f"Segment cache: {seg_cache.hits}/{nseg * len(outputs)} segment(s) reused")
+
+    # Incremental re-render: diff against the previous render of this project + output.
+    for out in outputs:
+        prev = find_previous_render(jobs_dir, job_id, out["output_path"])
+        if prev is None or nseg <= 0:
+            continue
+        prev_dir, prev_render = prev
+        seg_keys = out["seg_keys"]
+        seg_paths = out["seg_paths"]
+        prev_files = [str(x) for x in (prev_render.get("segment_files") or [])]
+        same, changed = diff_segments([str(x) for x in prev_render.get("segment_keys") or []], seg_keys)
+        reused = [i for i, j in same.items() if j < len(prev_files) and reuse_segment_file(prev_files[j], seg_paths[i])]
+        total_sec = acc / float(out_fps)
+        reused_sec = sum(int(render_items[i]["nframes"]) for i in reused) / float(out_fps)
+        ranges = ", ".join(
+            f"#{a}-{b - 1} ({seg_offsets[a]:.1f}s-{seg_offsets[b - 1] + int(render_items[b - 1]['nframes']) / out_fps:.1f}s)"
+            for a, b in changed[:10]
+        )
+        log(
+            (f"[{out['name']}] " if len(outputs) > 1 else "")
+            + f"EDL diff vs {os.path.basename(prev_dir)}: reused {len(reused)}/{nseg} segments, "
+            f"{reused_sec:.1f}s of {total_sec:.1f}s ({reused_sec / max(1e-6, total_sec) * 100:.0f}%)"
+            + (f"; changed: {ranges}" + (" ..." if len(changed) > 10 else "") if changed else "")
+        )
+    # Set on cancel or on the first failure: kills in-flight ffmpeg encodes and stops queued ones.
+    stop_evt = threading.Event()
+    # Work units: runs of same-source segments share one decode pass (all profiles at once). Identical
+    # segments (same cache paths) are rendered once; already present ones (cache / previous render) are skipped.
+    def _paths_of(i: int) -> tuple[str, ...]:
+        return tuple(out["seg_paths"][i] for out in outputs)
+
+    by_path: dict[tuple[str, ...], list[int]] = {}
+    for i in range(nseg):
+        by_path.setdefault(_paths_of(i), []).append(i)
+    todo = [idx[0] for ps, idx in by_path.items() if not all(os.path.isfile(p) for p in ps)]
+    todo.sort()
+    group_max = int(getattr(st.render, "segment_group_max", 1) or 1)
+    # Keep enough groups to occupy every worker.
+    group_max = max(1, min(group_max, -(-len(todo) // workers))) if todo else 1
+    groups = _group_segments(render_items, todo, out_fps=int(out_fps), max_group=group_max)
+    if len(groups) < len(todo):
+        log(f"Segment groups: {len(todo)} segment(s) to render in {len(groups)} ffmpeg run(s)")
+    seg_outputs = [
+        {
+            "out_w": out["out_w"],
+            "out_h": out["out_h"],
+            "fill": out["fill"],
+            "subtitles_ass": out["ass_path"] if single_encode else "",
+        }
+        for out in outputs
+    ]
+
+    def _render_group(g: list[int]) -> None:
+        wait_if_paused(pause_evt, stop_evt)
+        check_cancel(stop_evt)
+        src = str(render_items[g[0]]["source"])
+        src = draft_src.get(src, src) if draft else mezz_src.get(src, src)
+        _render_segment_group(
             bins.ffmpeg,
-            src=item["source"],
-            in_t=float(item["in"]),
-            nframes=int(item["nframes"]),
+            src=src,
+            parts=[
+                {
+                    "in": float(render_items[i]["in"]),
+                    "nframes": int(render_items[i]["nframes"]),
+                    "out_ts": list(_paths_of(i)),
+                    "t_offset": seg_offsets[i],
+                }
+                for i in g
+            ],
+            outputs=seg_outputs,
             out_fps=int(out_fps),
-            out_w=out_w,
-            out_h=out_h,
-            out_ts=out_ts,
             log=log,
+            threads=x264_threads,
+            cancel_evt=stop_evt,
+            draft=draft,
         )
-        seg_paths.append(out_ts)
-        progress(50 + int((i + 1) / max(1, nseg) * 30), f"Rendered segment {i+1}/{nseg}")
-
-    wait_if_paused(pause_evt, cancel_evt)
-    check_cancel(cancel_evt)
-    progress(82, "Concatenating...")
-
-    concat_list = os.path.join(job_dir, "concat.txt")
-    with open(concat_list, "w", encoding="utf-8") as f:
-        for p in seg_paths:
-            p2 = p.replace("\\", "/")
-            f.write("file '{}'\n".format(p2))
-
-    joined_ts = os.path.join(job_dir, "joined.ts")
-    run_cmd(
-        [bins.ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", concat_list, "-c", "copy", joined_ts],
-        log_fn=log,
-    )
 
-    wait_if_paused(pause_evt, cancel_evt)
-    check_cancel(cancel_evt)
-    progress(90, "Final mux (audio + subtitles)...")
+    preview: HlsPreview | None = None
+    if req.preview_hls and nseg > 0:
+        preview = HlsPreview(
+            bins.ffmpeg,
+            job_dir,
+            voice_audio_path=req.voice_audio_path,
+            durations=[int(it["nframes"]) / float(out_fps) for it in render_items],
+            log=log,
+            cancel_evt=stop_evt,
+        )
+        log(f"HLS preview: {preview.playlist}" + ("" if single_encode else " (no subtitles: single_encode is off)"))
+        if artifact is not None:
+            artifact({"kind": "preview_hls", "dir": preview.dir, "playlist": os.path.basename(preview.playlist)})
+
+    done = [all(os.path.isfile(p) for p in _paths_of(i)) for i in range(nseg)]
+    ndone = sum(done)
+    ordered = 0  # segments 0..ordered-1 are all finished (ready for concat)
+
+    def _advance_ordered() -> None:
+        nonlocal ordered
+        while ordered < nseg and done[ordered]:
+            if preview is not None:
+                preview.publish(ordered, outputs[0]["seg_paths"][ordered], seg_offsets[ordered])
+            ordered += 1
+
+    _advance_ordered()
+    # A batch shares one pool across all of its outputs; a single render owns its pool.
+    ex = batch.pool if batch is not None else ThreadPoolExecutor(max_workers=workers)
+    try:
+        futs = {ex.submit(_render_group, g): g for g in groups}
+        pending = set(futs)
+        try:
+            while pending:
+                if cancel_evt.is_set():
+                    stop_evt.set()
+                    check_cancel(cancel_evt)
+                finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    fut.result()
+                    for i in futs[fut]:
+                        for j in by_path[_paths_of(i)]:
+                            if not done[j]:
+                                done[j] = True
+                                ndone += 1
+                _advance_ordered()
+                if finished:
+                    progress(50 + int(ndone / max(1, nseg) * 30), f"Rendered segment {ndone}/{nseg} (in order: {ordered})")
+        except BaseException:
+            stop_evt.set()
+            for fut in pending:
+                fut.cancel()
+            # Our in-flight encodes stop quickly (stop_evt kills ffmpeg); don't leave them behind.
+            wait(pending)
+            raise
+    finally:
+        if batch is None:
+            ex.shutdown(wait=True)
+        if preview is not None:
+            preview.finish(ended=ordered >= nseg)
+
+    if seg_cache is not None:
+        seg_cache.evict(keep={k for out in outputs for k in out["seg_keys"]}, log=log)
+    # Lets the next render of each output diff against us.
+    edl["outputs"] = [
+        {
+            "name": out["name"],
+            "output_path": out["output_path"],
+            "width": out["out_w"],
+            "height": out["out_h"],
+            "segment_keys": out["seg_keys"],
+            "segment_files": out["seg_paths"],
+        }
+        for out in outputs
+    ]
+    atomic_write_json(edl_path, edl)
 
-    vf_final = (
-        "[0:v]setsar=1[v0];"
-        f"[v0]subtitles='{_ffmpeg_escape_path(ass_path)}'[vout]"
-    )
+    nout = len(outputs)
+    for o, out in enumerate(outputs):
+        tag = f" [{out['name']}]" if nout > 1 else ""
+        sub = "" if o == 0 else f"_{_safe_name(out['name'])}"
+        wait_if_paused(pause_evt, cancel_evt)
+        check_cancel(cancel_evt)
+        progress(82 + int(o / nout * 16), "Concatenating..." + tag)
+
+        concat_list = os.path.join(job_dir, f"concat{sub}.txt")
+        with open(concat_list, "w", encoding="utf-8") as f:
+            for p in out["seg_paths"]:
+                p2 = p.replace("\\", "/")
+                f.write("file '{}'\n".format(p2))
+
+        joined_ts = os.path.join(job_dir, f"joined{sub}.ts")
+        run_cmd(
+            [bins.ffmpeg, "-y", "-f", "concat", "-safe", "0", "-i", concat_list, "-c", "copy", joined_ts],
+            log_fn=log,
+        )
 
-    args = [bins.ffmpeg, "-y", "-i", joined_ts, "-i", req.voice_audio_path]
-    if req.bgm_audio_path:
-        args += ["-stream_loop", "-1", "-i", req.bgm_audio_path]
-
-    if req.bgm_audio_path:
-        bgm_vol = float(getattr(st.render, "bgm_volume", 0.12) or 0.12)
-        bgm_vol = max(0.0, min(1.0, bgm_vol))
-        af = (
-            "[1:a]aresample=44100[a1];"
-            f"[2:a]volume={bgm_vol:.3f},aresample=44100[a2];"
-            "[a1][a2]amix=inputs=2:duration=first:dropout_transition=2[aout]"
+        wait_if_paused(pause_evt, cancel_evt)
+        check_cancel(cancel_evt)
+        progress(
+            82 + int((o + 0.5) / nout * 16),
+            ("Final mux (audio)..." if single_encode else "Final mux (audio + subtitles)...") + tag,
         )
-        args += ["-filter_complex", vf_final + ";" + af, "-map", "[vout]", "-map", "[aout]"]
-    else:
-        args += ["-filter_complex", vf_final, "-map", "[vout]", "-map", "1:a"]
 
-    args += [
-        # Clamp final output to narration length (avoids accidental truncation of audio/video).
-        "-t",
-        f"{float(voice_dur):.3f}",
-        "-c:v",
-        "libx264",
-        "-preset",
-        "ultrafast",
-        "-crf",
-        "23",
-        "-c:a",
-        "aac",
-        "-b:a",
-        "192k",
-        req.output_path,
-    ]
-    run_cmd(args, log_fn=log)
+        if single_encode:
+            # Video already carries the subtitles: no filter, stream copy.
+            vf_final = ""
+            vmap = "0:v"
+        else:
+            vf_final = (
+                "[0:v]setsar=1[v0];"
+                f"[v0]subtitles='{_ffmpeg_escape_path(out['ass_path'])}'[vout]"
+            )
+            vmap = "[vout]"
+
+        args = [bins.ffmpeg, "-y", "-i", joined_ts, "-i", req.voice_audio_path]
+        if req.bgm_audio_path:
+            args += ["-stream_loop", "-1", "-i", req.bgm_audio_path]
+
+        if req.bgm_audio_path:
+            bgm_vol = float(getattr(st.render, "bgm_volume", 0.12) or 0.12)
+            bgm_vol = max(0.0, min(1.0, bgm_vol))
+            af = (
+                "[1:a]aresample=44100[a1];"
+                f"[2:a]volume={bgm_vol:.3f},aresample=44100[a2];"
+                "[a1][a2]amix=inputs=2:duration=first:dropout_transition=2[aout]"
+            )
+            args += ["-filter_complex", ";".join(x for x in (vf_final, af) if x), "-map", vmap, "-map", "[aout]"]
+        elif vf_final:
+            args += ["-filter_complex", vf_final, "-map", vmap, "-map", "1:a"]
+        else:
+            args += ["-map", vmap, "-map", "1:a"]
+
+        args += [
+            # Clamp final output to narration length (avoids accidental truncation of audio/video).
+            "-t",
+            f"{float(voice_dur):.3f}",
+            *(["-c:v", "copy"] if single_encode else ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"]),
+            "-c:a",
+            "aac",
+            "-b:a",
+            "192k",
+            out["output_path"],
+        ]
+        os.makedirs(os.path.dirname(os.path.abspath(out["output_path"])), exist_ok=True)
+        run_cmd(args, log_fn=log)
 
     progress(100, "Render complete")
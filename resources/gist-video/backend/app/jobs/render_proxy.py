@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+
+from app.core.ffmpeg import run_cmd
+from app.jobs.mezzanine import MezzanineCache
+
+
+class RenderProxyCache(MezzanineCache):
+    """
+    Draft-render proxies of sources (project cache/render_proxies/): output frame rate, at most
+    `height` lines, one keyframe per second so each segment's input seek stays cheap.
+
+    Built in the background only (schedule_mezzanine): queued by the first draft that misses one (that
+    draft decodes the source instead), or by the index job when render.draft_proxy_at_index is on. Files are <id>_<height>p_<fps>fps.mp4,
+    evicted LRU by mtime (touched on use) beyond `quota_bytes`.
+    """
+
+    label = "Draft proxy"
+
+    def __init__(self, root: str, *, quota_bytes: int, fps: int) -> None:
+        super().__init__(root, quota_bytes=quota_bytes, min_uses=1)
+        self.fps = int(fps)
+
+    def path(self, src: str, *, height: int) -> str:
+        return os.path.join(self.root, f"{self._source_id(src)}_{int(height)}p_{self.fps}fps.mp4")
+
+    def lookup(self, src: str, *, height: int) -> str | None:
+        """Smallest ready proxy at least `height` lines tall (touched for LRU), or None."""
+        sid = self._source_id(src)
+        suffix = f"p_{self.fps}fps.mp4"
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return None
+        best: tuple[int, str] | None = None
+        for n in names:
+            if not n.startswith(sid + "_") or not n.endswith(suffix):
+                continue
+            try:
+                h = int(n[len(sid) + 1 : -len(suffix)])
+            except ValueError:
+                continue
+            if h >= int(height) and (best is None or h < best[0]):
+                best = (h, n)
+        if best is None:
+            return None
+        p = os.path.join(self.root, best[1])
+        try:
+            os.utime(p, None)
+        except OSError:
+            pass
+        return p
+
+    def build(self, ffmpeg: str, src: str, *, height: int, log=None) -> str:
+        dst = self.path(src, height=height)
+        if os.path.isfile(dst):
+            return dst
+        os.makedirs(self.root, exist_ok=True)
+        tmp = dst + ".part.mp4"
+        run_cmd(
+            [
+                ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-y",
+                "-i",
+                src,
+                "-map",
+                "0:v:0",
+                "-vf",
+                f"fps={self.fps},scale=-2:'min(ih,{int(height)})'",
+                "-an",
+                "-sn",
+                "-dn",
+                "-c:v",
+                "libx264",
+                "-preset",
+                "ultrafast",
+                "-crf",
+                "26",
+                "-g",
+                str(self.fps),
+                tmp,
+            ],
+            log_fn=log,
+        )
+        os.replace(tmp, dst)
+        self.evict(keep={dst}, log=log)
+        return dst
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import os
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+from app.vision.phash import hamming
+
+
+def _dhash_rows(gray: np.ndarray) -> np.ndarray:
+    """(N, 8, 9) uint8 -> (N,) uint64 dHash."""
+    g = gray.astype(np.int16)
+    bits = (g[:, :, 1:] > g[:, :, :-1]).reshape(len(g), 64).astype(np.uint8)
+    return np.packbits(bits, axis=1).view(">u8").reshape(-1).astype(np.uint64)
+
+
+def proxy_fingerprints(ffmpeg: str, proxy_path: str, *, fps: float = 1.0) -> np.ndarray:
+    """
+    Per-second perceptual fingerprints of a proxy video (one 64-bit dHash per sampled frame).
+    Cached next to the proxy as fingerprint.npy (rebuilt when the proxy is newer).
+    """
+    cache = os.path.join(os.path.dirname(proxy_path), "fingerprint.npy")
+    try:
+        if os.path.getmtime(cache) >= os.path.getmtime(proxy_path):
+            return np.load(cache)
+    except OSError:
+        pass
+    p = subprocess.run(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            proxy_path,
+            "-vf",
+            f"fps={float(fps):.3f},scale=9:8:flags=area,format=gray",
+            "-an",
+            "-f",
+            "rawvideo",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if p.returncode != 0:
+        raise RuntimeError(f"fingerprint decode failed: {p.stderr[-300:].decode('utf-8', errors='replace')}")
+    n = len(p.stdout) // 72
+    fp = _dhash_rows(np.frombuffer(p.stdout[: n * 72], dtype=np.uint8).reshape(n, 8, 9)) if n else np.zeros(0, np.uint64)
+    np.save(cache, fp)
+    return fp
+
+
+def _informative(fp: np.ndarray) -> np.ndarray:
+    # Flat frames (black/white cards, fades) hash to ~0 bits and would match everything.
+    pop = hamming(fp, np.zeros_like(fp))
+    return (pop >= 8) & (pop <= 56)
+
+
+def _runs(ts: list[int], *, max_gap: int) -> list[tuple[int, int, int]]:
+    """Sorted second indices -> (first, last, hits) runs allowing small gaps."""
+    out: list[tuple[int, int, int]] = []
+    if not ts:
+        return out
+    a = b = ts[0]
+    hits = 1
+    for t in ts[1:]:
+        if t - b <= max_gap:
+            b = t
+            hits += 1
+            continue
+        out.append((a, b, hits))
+        a = b = t
+        hits = 1
+    out.append((a, b, hits))
+    return out
+
+
+def _merge_ranges(ranges: list[tuple[float, float, str]]) -> list[tuple[float, float, str]]:
+    out: list[tuple[float, float, str]] = []
+    for s, e, kind in sorted(ranges):
+        if out and s <= out[-1][1] + 1.0:
+            ps, pe, pk = out[-1]
+            out[-1] = (ps, max(pe, e), pk if pk == kind else "opening/ending+recap")
+        else:
+            out.append((s, e, kind))
+    return out
+
+
+def find_repeats(
+    fingerprints: list[np.ndarray],
+    durations: list[float],
+    *,
+    fps: float = 1.0,
+    min_sec: float = 20.0,
+    max_hamming: int = 6,
+    edge_sec: float = 360.0,
+    bands: int = 4,
+) -> list[list[tuple[float, float, str]]]:
+    """
+    Find segments repeated across episodes (videos in project order).
+
+    Candidate frame pairs come from LSH banding (hash split into `bands` 16-bit bands; any equal band
+    is a candidate), verified by full hamming distance. Matches are grouped per (video a, video b,
+    time offset); consecutive runs >= min_sec become repeats:
+      - near the head or tail of BOTH episodes -> opening/ending: excluded in both;
+      - otherwise -> recap: excluded only in the later episode.
+    Returns per-video excluded (start, end, kind) ranges in seconds.
+    """
+    nv = len(fingerprints)
+    out: list[list[tuple[float, float, str]]] = [[] for _ in range(nv)]
+    if nv < 2:
+        return out
+    fps = max(0.1, float(fps))
+    bands = max(1, min(8, int(bands)))
+    shift = 64 // bands
+    mask = np.uint64((1 << shift) - 1)
+
+    as_int = [[int(x) for x in fp.tolist()] for fp in fingerprints]
+    buckets: dict[tuple[int, int], list[tuple[int, int]]] = defaultdict(list)
+    for vi, fp in enumerate(fingerprints):
+        ok = _informative(fp) if len(fp) else np.zeros(0, bool)
+        for b in range(bands):
+            vals = (fp >> np.uint64(b * shift)) & mask
+            for t in np.nonzero(ok)[0].tolist():
+                buckets[(b, int(vals[t]))].append((vi, t))
+
+    # Very common buckets are static/generic frames; they only add noise and cost.
+    cap = max(16, 6 * nv)
+    seen: set[tuple[int, int, int, int]] = set()
+    diag: dict[tuple[int, int, int], list[int]] = defaultdict(list)
+    for items in buckets.values():
+        if len(items) < 2 or len(items) > cap:
+            continue
+        for i in range(len(items)):
+            va, ta = items[i]
+            for j in range(i + 1, len(items)):
+                vb, tb = items[j]
+                if va == vb:
+                    continue
+                if va > vb:
+                    va2, ta2, vb2, tb2 = vb, tb, va, ta
+                else:
+                    va2, ta2, vb2, tb2 = va, ta, vb, tb
+                key = (va2, ta2, vb2, tb2)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if bin(as_int[va2][ta2] ^ as_int[vb2][tb2]).count("1") <= int(max_hamming):
+                    diag[(va2, vb2, tb2 - ta2)].append(ta2)
+
+    min_frames = max(2, int(round(float(min_sec) * fps)))
+    for (va, vb, off), ts in diag.items():
+        for a0, a1, hits in _runs(sorted(set(ts)), max_gap=max(2, int(round(2 * fps)))):
+            if (a1 - a0 + 1) < min_frames or hits < 0.5 * (a1 - a0 + 1):
+                continue
+            sa, ea = a0 / fps, (a1 + 1) / fps
+            sb, eb = (a0 + off) / fps, (a1 + 1 + off) / fps
+            da, db = float(durations[va]), float(durations[vb])
+            head = sa <= edge_sec and sb <= edge_sec
+            tail = (da - ea) <= edge_sec and (db - eb) <= edge_sec
+            if head or tail:
+                out[va].append((sa, min(ea, da), "opening/ending"))
+                out[vb].append((sb, min(eb, db), "opening/ending"))
+            else:
+                out[vb].append((sb, min(eb, db), "recap"))
+    return [_merge_ranges(r) for r in out]
+
+
+def subtract_ranges(
+    slices: list[tuple[float, float]], ranges: list[tuple[float, float]], *, min_keep_sec: float = 0.5
+) -> list[tuple[float, float]]:
+    """Remove `ranges` from `slices` (both in seconds); drop leftovers shorter than min_keep_sec."""
+    out: list[tuple[float, float]] = []
+    rs = sorted((float(a), float(b)) for a, b in ranges)
+    for s, e in slices:
+        parts = [(float(s), float(e))]
+        for rs_, re_ in rs:
+            nxt: list[tuple[float, float]] = []
+            for ps, pe in parts:
+                if re_ <= ps or rs_ >= pe:
+                    nxt.append((ps, pe))
+                    continue
+                if rs_ > ps:
+                    nxt.append((ps, rs_))
+                if re_ < pe:
+                    nxt.append((re_, pe))
+            parts = nxt
+        out.extend((round(a, 3), round(b, 3)) for a, b in parts if (b - a) >= float(min_keep_sec))
+    return out
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def source_fingerprint(path: str) -> list:
+    """Cheap identity of a source video (path, size, mtime); a replaced file gets a new fingerprint."""
+    try:
+        st = os.stat(path)
+        return [os.path.abspath(path), int(st.st_size), int(st.st_mtime_ns)]
+    except OSError:
+        return [os.path.abspath(path), 0, 0]
+
+
+def _ass_time(s: str) -> float:
+    try:
+        h, m, sec = s.strip().split(":")
+        return int(h) * 3600 + int(m) * 60 + float(sec)
+    except ValueError:
+        return 0.0
+
+
+def ass_window_digest(ass_path: str, t0: float, t1: float) -> str:
+    """
+    Digest of what libass draws inside [t0, t1): the script header (styles, resolution) plus the
+    Dialogue events overlapping the window, with times made relative to t0. Editing one narration
+    line only changes the digest of the segments that show it.
+    """
+    h = hashlib.sha1()
+    try:
+        with open(ass_path, "r", encoding="utf-8-sig") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return ""
+    for ln in lines:
+        if not ln.startswith("Dialogue:"):
+            if ln.strip():
+                h.update(("H|" + ln + "\n").encode("utf-8"))
+            continue
+        parts = ln[len("Dialogue:") :].split(",", 3)
+        if len(parts) < 4:
+            continue
+        st, en = _ass_time(parts[1]), _ass_time(parts[2])
+        if en <= t0 or st >= t1:
+            continue
+        h.update(f"D|{parts[0].strip()}|{st - t0:.3f}|{en - t0:.3f}|{parts[3]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+# Keys held by running renders, per cache root. Eviction (under the same lock) never removes them, so a
+# render cannot lose a segment between lookup and concat to another render's eviction.
+_RESERVE_LOCK = threading.Lock()
+_RESERVED: dict[str, dict[str, int]] = {}
+
+
+class SegmentCache:
+    """
+    Content-addressed store of rendered segments shared by all render jobs of a project
+    (cache/render_segments/<k[:2]>/<k>.ts).
+
+    Keys hash everything that determines the encoded bytes (source fingerprint, in point, frame count,
+    output geometry, filter-graph version, burned subtitles), so a re-render only encodes segments whose
+    EDL entry changed. Eviction is LRU by file mtime (touched on every hit), bounded by `quota_bytes`.
+    Every looked-up key stays reserved until `release()`; eviction skips keys any render still holds.
+    """
+
+    def __init__(self, root: str, *, quota_bytes: int) -> None:
+        self.root = os.path.abspath(root)
+        self.quota_bytes = max(0, int(quota_bytes))
+        self._lock = threading.Lock()
+        self._held: list[str] = []
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(parts: dict) -> str:
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.ts")
+
+    def lookup(self, key: str) -> str:
+        """Path for `key`, reserved until `release()`; hits are touched (render into it on a miss)."""
+        with _RESERVE_LOCK:
+            held = _RESERVED.setdefault(self.root, {})
+            held[key] = held.get(key, 0) + 1
+        with self._lock:
+            self._held.append(key)
+        p = self.path(key)
+        hit = os.path.isfile(p)
+        if hit:
+            try:
+                os.utime(p, None)
+            except OSError:
+                pass
+        else:
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return p
+
+    def release(self) -> None:
+        """Drop this render's reservations (call once its outputs are written, or on failure)."""
+        with self._lock:
+            keys, self._held = self._held, []
+        with _RESERVE_LOCK:
+            held = _RESERVED.get(self.root, {})
+            for k in keys:
+                n = held.get(k, 0) - 1
+                if n > 0:
+                    held[k] = n
+                else:
+                    held.pop(k, None)
+            if not held:
+                _RESERVED.pop(self.root, None)
+
+    def evict(self, *, keep: set[str] | None = None, log=None) -> None:
+        """
+        Drop least recently used segments until the cache fits the quota. Never removes keys in `keep`
+        or reserved by a running render; runs under the cache-wide lock so no lookup races it.
+        """
+        if self.quota_bytes <= 0:
+            return
+        with _RESERVE_LOCK:
+            self._evict_locked(set(keep or ()) | set(_RESERVED.get(self.root, {})), log)
+
+    def _evict_locked(self, keep: set[str], log) -> None:
+        ents: list[tuple[float, int, str]] = []
+        total = 0
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                p = os.path.join(dirpath, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                # Leftovers of killed encodes.
+                if n.endswith(".part") and st.st_mtime < time.time() - 3600:
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+                    continue
+                total += int(st.st_size)
+                if n.endswith(".ts") and n[:-3] not in keep:
+                    ents.append((float(st.st_mtime), int(st.st_size), p))
+        if total <= self.quota_bytes:
+            return
+        ents.sort()
+        freed = 0
+        removed = 0
+        for _, size, p in ents:
+            if total - freed <= self.quota_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                # In use by another render (Windows); try the next one.
+                continue
+            freed += size
+            removed += 1
+        if log and removed:
+            log(f"Segment cache: evicted {removed} segment(s), {freed / (1 << 20):.1f} MB")
@@ -7,6 +7,7 @@ from typing import Any
 
 from fastapi import Body, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field
 
 from app.core.paths import default_paths
@@ -24,7 +25,8 @@ from app.core.settings import (
     load_settings,
     save_settings,
 )
-from app.jobs.render_job import RenderJobRequest
+from app.jobs.render_batch_job import BatchRenderJobRequest
+from app.jobs.render_job import OutputProfile, RenderJobRequest
 from app.server.job_manager import JobManager
 from app.vision.gemini_proxy import GeminiRelayCaptionProvider
 
@@ -40,12 +42,14 @@ class AddVideosIn(BaseModel):
 class EmbeddingSettingsPatch(BaseModel):
     backend: str | None = None
     model_id: str | None = None
+    clip_model_id: str | None = None
 
 
 class VisionSettingsPatch(BaseModel):
     backend: str | None = None
     api_base: str | None = None
     api_key: str | None = None
+    api_endpoints: list[dict] | None = None
     vision_model: str | None = None
     caption_workers: int | None = None
     caption_in_flight: int | None = None
@@ -59,6 +63,24 @@ class VisionSettingsPatch(BaseModel):
     clip_min_sec: float | None = None
     clip_target_sec: float | None = None
     clip_max_sec: float | None = None
+    caption_global_cache: bool | None = None
+    caption_global_cache_max_entries: int | None = None
+    caption_cache_versions: int | None = None
+    caption_refresh: str | None = None
+    caption_payload_cache_mb: int | None = None
+    caption_hedge_enable: bool | None = None
+    caption_hedge_budget: float | None = None
+    caption_endpoint_max_in_flight: int | None = None
+    caption_dedup_enable: bool | None = None
+    caption_dedup_max_hamming: int | None = None
+    repeat_skip_enable: bool | None = None
+    repeat_min_sec: float | None = None
+    repeat_max_hamming: int | None = None
+    repeat_edge_sec: float | None = None
+    caption_mode: str | None = None
+    index_snapshot_every: int | None = None
+    proxy_mode: str | None = None
+    media_engine: str | None = None
 
 
 class RenderSettingsPatch(BaseModel):
@@ -80,6 +102,17 @@ class RenderSettingsPatch(BaseModel):
     timeline_mode: str | None = None
     bgm_volume: float | None = None
     output_fps: int | None = None
+    lazy_caption_topk: int | None = None
+    match_image_weight: float | None = None
+    render_workers: int | None = None
+    single_encode: bool | None = None
+    segment_cache_mb: int | None = None
+    draft_height: int | None = None
+    segment_group_max: int | None = None
+    mezzanine_min_uses: int | None = None
+    mezzanine_cache_mb: int | None = None
+    draft_proxy_cache_mb: int | None = None
+    draft_proxy_at_index: bool | None = None
 
 
 class SettingsPatch(BaseModel):
@@ -91,6 +124,8 @@ class SettingsPatch(BaseModel):
 class RuntimeVisionIn(BaseModel):
     api_base: str = ""
     api_key: str = ""
+    # Optional extra endpoints: [{"api_base", "api_key", "max_in_flight", "weight"}]
+    endpoints: list[dict] | None = None
 
 
 class StartIndexJobIn(BaseModel):
@@ -112,7 +147,19 @@ class StartIndexJobIn(BaseModel):
     caption_batch_max_images: int | None = None
     skip_head_sec: int | None = None
     skip_tail_sec: int | None = None
+    skip_repeats: bool | None = None
     caption_flush_every: int = 10
+    caption_refresh: str | None = None
+    recaption_clip_ids: list[str] | None = None
+    caption_mode: str | None = None
+    proxy_mode: str | None = None
+
+
+class OutputProfileIn(BaseModel):
+    output_path: str
+    output_width: int
+    output_height: int
+    name: str = ""
 
 
 class StartRenderJobIn(BaseModel):
@@ -128,6 +175,33 @@ class StartRenderJobIn(BaseModel):
     keep_speed: bool = True
     emphasis_phrases: list[str] = Field(default_factory=list)
     emphasis_enable: bool = True
+    quality: str = "final"
+    output_profiles: list[OutputProfileIn] = Field(default_factory=list)
+    preview_hls: bool = False
+
+
+class BatchRenderItemIn(BaseModel):
+    voice_audio_path: str
+    script_text: str
+    output_path: str
+    tts_meta_path: str | None = None
+    # Overrides the batch-level BGM when set.
+    bgm_audio_path: str | None = None
+    emphasis_phrases: list[str] = Field(default_factory=list)
+
+
+class StartBatchRenderJobIn(BaseModel):
+    project_id: str
+    items: list[BatchRenderItemIn] = Field(min_length=1)
+    bgm_audio_path: str | None = None
+    dedup_window_sec: int = 60
+    output_width: int = 1920
+    output_height: int = 1080
+    keep_speed: bool = True
+    emphasis_enable: bool = True
+    quality: str = "final"
+    cross_video_dedup: bool = True
+    max_parallel: int = 0
 
 
 class VisionModelsIn(BaseModel):
@@ -168,6 +242,10 @@ def _settings_to_public_dict(st: AppSettings) -> dict[str, Any]:
         vis = data.get("vision") or {}
         if isinstance(vis, dict) and vis.get("api_key"):
             vis["api_key"] = "***"
+        if isinstance(vis, dict) and isinstance(vis.get("api_endpoints"), list):
+            vis["api_endpoints"] = [
+                {**e, "api_key": "***"} if isinstance(e, dict) and e.get("api_key") else e for e in vis["api_endpoints"]
+            ]
         data["vision"] = vis
     except Exception:
         pass
@@ -209,7 +287,7 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
         api_key = str(inp.api_key or "").strip()
         if not api_base or not api_key:
             raise HTTPException(status_code=400, detail="缺少 api_base/api_key")
-        set_runtime_vision_credentials(api_base=api_base, api_key=api_key)
+        set_runtime_vision_credentials(api_base=api_base, api_key=api_key, endpoints=inp.endpoints)
         return {"ok": True}
 
     @app.delete("/api/runtime/vision")
@@ -227,6 +305,7 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
             emb = EmbeddingSettings(
                 backend=patch.embedding.backend if patch.embedding.backend is not None else cur.embedding.backend,
                 model_id=patch.embedding.model_id if patch.embedding.model_id is not None else cur.embedding.model_id,
+                clip_model_id=patch.embedding.clip_model_id if patch.embedding.clip_model_id is not None else cur.embedding.clip_model_id,
             )
 
         vis = cur.vision
@@ -238,6 +317,7 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
                 # When runtime creds are present, keep file values (avoid persisting secrets).
                 api_base=(cur.vision.api_base if runtime_locked else (pv.api_base if pv.api_base is not None else cur.vision.api_base)),
                 api_key=(cur.vision.api_key if runtime_locked else (pv.api_key if pv.api_key is not None else cur.vision.api_key)),
+                api_endpoints=(cur.vision.api_endpoints if runtime_locked else (pv.api_endpoints if pv.api_endpoints is not None else cur.vision.api_endpoints)),
                 vision_model=pv.vision_model if pv.vision_model is not None else cur.vision.vision_model,
                 caption_workers=int(pv.caption_workers) if pv.caption_workers is not None else int(cur.vision.caption_workers),
                 caption_in_flight=int(pv.caption_in_flight) if pv.caption_in_flight is not None else int(cur.vision.caption_in_flight),
@@ -251,6 +331,24 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
                 clip_min_sec=float(pv.clip_min_sec) if pv.clip_min_sec is not None else float(cur.vision.clip_min_sec),
                 clip_target_sec=float(pv.clip_target_sec) if pv.clip_target_sec is not None else float(cur.vision.clip_target_sec),
                 clip_max_sec=float(pv.clip_max_sec) if pv.clip_max_sec is not None else float(cur.vision.clip_max_sec),
+                caption_global_cache=bool(pv.caption_global_cache) if pv.caption_global_cache is not None else bool(cur.vision.caption_global_cache),
+                caption_global_cache_max_entries=int(pv.caption_global_cache_max_entries) if pv.caption_global_cache_max_entries is not None else int(cur.vision.caption_global_cache_max_entries),
+                caption_cache_versions=int(pv.caption_cache_versions) if pv.caption_cache_versions is not None else int(cur.vision.caption_cache_versions),
+                caption_refresh=str(pv.caption_refresh) if pv.caption_refresh is not None else str(cur.vision.caption_refresh),
+                caption_payload_cache_mb=int(pv.caption_payload_cache_mb) if pv.caption_payload_cache_mb is not None else int(cur.vision.caption_payload_cache_mb),
+                caption_hedge_enable=bool(pv.caption_hedge_enable) if pv.caption_hedge_enable is not None else bool(cur.vision.caption_hedge_enable),
+                caption_hedge_budget=float(pv.caption_hedge_budget) if pv.caption_hedge_budget is not None else float(cur.vision.caption_hedge_budget),
+                caption_endpoint_max_in_flight=int(pv.caption_endpoint_max_in_flight) if pv.caption_endpoint_max_in_flight is not None else int(cur.vision.caption_endpoint_max_in_flight),
+                caption_dedup_enable=bool(pv.caption_dedup_enable) if pv.caption_dedup_enable is not None else bool(cur.vision.caption_dedup_enable),
+                caption_dedup_max_hamming=int(pv.caption_dedup_max_hamming) if pv.caption_dedup_max_hamming is not None else int(cur.vision.caption_dedup_max_hamming),
+                repeat_skip_enable=bool(pv.repeat_skip_enable) if pv.repeat_skip_enable is not None else bool(cur.vision.repeat_skip_enable),
+                repeat_min_sec=float(pv.repeat_min_sec) if pv.repeat_min_sec is not None else float(cur.vision.repeat_min_sec),
+                repeat_max_hamming=int(pv.repeat_max_hamming) if pv.repeat_max_hamming is not None else int(cur.vision.repeat_max_hamming),
+                repeat_edge_sec=float(pv.repeat_edge_sec) if pv.repeat_edge_sec is not None else float(cur.vision.repeat_edge_sec),
+                caption_mode=str(pv.caption_mode) if pv.caption_mode is not None else str(cur.vision.caption_mode),
+                index_snapshot_every=int(pv.index_snapshot_every) if pv.index_snapshot_every is not None else int(cur.vision.index_snapshot_every),
+                proxy_mode=str(pv.proxy_mode) if pv.proxy_mode is not None else str(cur.vision.proxy_mode),
+                media_engine=str(pv.media_engine) if pv.media_engine is not None else str(cur.vision.media_engine),
             )
 
         ren = getattr(cur, "render", RenderSettings())
@@ -275,6 +373,17 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
                 timeline_mode=pr.timeline_mode if pr.timeline_mode is not None else ren.timeline_mode,
                 bgm_volume=float(pr.bgm_volume) if pr.bgm_volume is not None else float(ren.bgm_volume),
                 output_fps=int(pr.output_fps) if pr.output_fps is not None else int(ren.output_fps),
+                lazy_caption_topk=int(pr.lazy_caption_topk) if pr.lazy_caption_topk is not None else int(ren.lazy_caption_topk),
+                match_image_weight=float(pr.match_image_weight) if pr.match_image_weight is not None else float(ren.match_image_weight),
+                render_workers=int(pr.render_workers) if pr.render_workers is not None else int(ren.render_workers),
+                single_encode=bool(pr.single_encode) if pr.single_encode is not None else bool(ren.single_encode),
+                segment_cache_mb=int(pr.segment_cache_mb) if pr.segment_cache_mb is not None else int(ren.segment_cache_mb),
+                draft_height=int(pr.draft_height) if pr.draft_height is not None else int(ren.draft_height),
+                segment_group_max=int(pr.segment_group_max) if pr.segment_group_max is not None else int(ren.segment_group_max),
+                mezzanine_min_uses=int(pr.mezzanine_min_uses) if pr.mezzanine_min_uses is not None else int(ren.mezzanine_min_uses),
+                mezzanine_cache_mb=int(pr.mezzanine_cache_mb) if pr.mezzanine_cache_mb is not None else int(ren.mezzanine_cache_mb),
+                draft_proxy_cache_mb=int(pr.draft_proxy_cache_mb) if pr.draft_proxy_cache_mb is not None else int(ren.draft_proxy_cache_mb),
+                draft_proxy_at_index=bool(pr.draft_proxy_at_index) if pr.draft_proxy_at_index is not None else bool(ren.draft_proxy_at_index),
             )
 
         out = AppSettings(embedding=emb, vision=vis, render=ren)
@@ -322,6 +431,25 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
             raise HTTPException(status_code=404, detail="job not found")
         return {"job": job.snapshot()}
 
+    @app.get("/api/jobs/{job_id}/preview/{name}")
+    def job_preview_file(job_id: str, name: str) -> FileResponse:
+        # Progressive HLS preview of a running render (playlist + .ts segments).
+        try:
+            job = jm.get(job_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="job not found")
+        info = job.get_artifact("preview_hls")
+        d = str(info.get("dir") or "")
+        if not d or name != os.path.basename(name) or not (name.endswith(".m3u8") or name.endswith(".ts")):
+            raise HTTPException(status_code=404, detail="preview not found")
+        path = os.path.join(d, name)
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="preview not found")
+        if name.endswith(".m3u8"):
+            # The playlist grows while rendering: never cache it.
+            return FileResponse(path, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+        return FileResponse(path, media_type="video/mp2t")
+
     @app.post("/api/jobs/index")
     def job_start_index(inp: StartIndexJobIn) -> dict[str, Any]:
         from app.jobs.index_job import IndexJobRequest
@@ -345,7 +473,12 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
             caption_batch_max_images=inp.caption_batch_max_images,
             skip_head_sec=inp.skip_head_sec,
             skip_tail_sec=inp.skip_tail_sec,
+            skip_repeats=inp.skip_repeats,
             caption_flush_every=int(inp.caption_flush_every),
+            caption_refresh=inp.caption_refresh,
+            recaption_clip_ids=tuple(inp.recaption_clip_ids) if inp.recaption_clip_ids else None,
+            caption_mode=inp.caption_mode,
+            proxy_mode=inp.proxy_mode,
         )
         job_id = jm.start_index_job(req)
         return {"job_id": job_id}
@@ -365,10 +498,49 @@ def create_app(*, job_manager: JobManager | None = None) -> FastAPI:
             keep_speed=bool(inp.keep_speed),
             emphasis_enable=bool(inp.emphasis_enable),
             emphasis_phrases=tuple(str(s) for s in (inp.emphasis_phrases or []) if str(s).strip()),
+            quality=str(inp.quality or "final"),
+            output_profiles=tuple(
+                OutputProfile(
+                    output_path=p.output_path,
+                    output_width=int(p.output_width),
+                    output_height=int(p.output_height),
+                    name=str(p.name or ""),
+                )
+                for p in (inp.output_profiles or [])
+            ),
+            preview_hls=bool(inp.preview_hls),
         )
         job_id = jm.start_render_job(req)
         return {"job_id": job_id}
 
+    @app.post("/api/jobs/render-batch")
+    def job_start_render_batch(inp: StartBatchRenderJobIn) -> dict[str, Any]:
+        req = BatchRenderJobRequest(
+            project_id=inp.project_id,
+            items=tuple(
+                RenderJobRequest(
+                    project_id=inp.project_id,
+                    voice_audio_path=it.voice_audio_path,
+                    script_text=it.script_text,
+                    output_path=it.output_path,
+                    tts_meta_path=it.tts_meta_path,
+                    bgm_audio_path=it.bgm_audio_path or inp.bgm_audio_path,
+                    dedup_window_sec=int(inp.dedup_window_sec),
+                    output_width=int(inp.output_width),
+                    output_height=int(inp.output_height),
+                    keep_speed=bool(inp.keep_speed),
+                    emphasis_enable=bool(inp.emphasis_enable),
+                    emphasis_phrases=tuple(str(s) for s in (it.emphasis_phrases or []) if str(s).strip()),
+                    quality=str(inp.quality or "final"),
+                )
+                for it in inp.items
+            ),
+            cross_video_dedup=bool(inp.cross_video_dedup),
+            max_parallel=int(inp.max_parallel),
+        )
+        job_id = jm.start_batch_render_job(req)
+        return {"job_id": job_id}
+
     @app.post("/api/jobs/{job_id}/pause")
     def job_pause(job_id: str) -> dict[str, Any]:
         try:
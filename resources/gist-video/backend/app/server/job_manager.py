@@ -8,6 +8,7 @@ import uuid
 from dataclasses import dataclass, field
 
 from app.jobs.index_job import IndexJobRequest, run_index_job
+from app.jobs.render_batch_job import BatchRenderJobRequest, run_batch_render_job
 from app.jobs.render_job import RenderJobRequest, run_render_job
 
 
@@ -21,7 +22,7 @@ def _now_ts() -> float:
 @dataclass
 class JobState:
     job_id: str
-    kind: str  # "index" | "render"
+    kind: str  # "index" | "render" | "render_batch"
     status: str = "queued"  # queued|running|paused|canceling|canceled|failed|succeeded
     created_at: float = field(default_factory=_now_ts)
     started_at: float | None = None
@@ -29,6 +30,8 @@ class JobState:
     progress_pct: int = 0
     stage: str = ""
     error: str | None = None
+    # Outputs usable while the job runs (e.g. "preview_hls" -> {"dir", "playlist"}).
+    artifacts: dict[str, dict] = field(default_factory=dict)
 
     pause_evt: threading.Event = field(default_factory=threading.Event, repr=False)
     cancel_evt: threading.Event = field(default_factory=threading.Event, repr=False)
@@ -52,8 +55,18 @@ class JobState:
                 "progress_pct": int(self.progress_pct),
                 "stage": str(self.stage or ""),
                 "error": self.error,
+                "artifacts": {k: {"playlist": v.get("playlist")} for k, v in self.artifacts.items()},
             }
 
+    def set_artifact(self, kind: str, info: dict) -> None:
+        with self._lock:
+            self.artifacts[kind] = dict(info)
+
+    def get_artifact(self, kind: str) -> dict:
+        """Copy of one artifact ({} when the job hasn't published it)."""
+        with self._lock:
+            return dict(self.artifacts.get(kind) or {})
+
     def add_subscriber(self) -> tuple[queue.Queue, list[dict]]:
         q: queue.Queue = queue.Queue()
         with self._lock:
@@ -101,9 +114,13 @@ class JobManager:
         q, history = job.add_subscriber()
         return job, q, history
 
-    def start_index_job(self, req: IndexJobRequest) -> str:
+    def _start_job(self, kind: str, run) -> str:
+        """
+        Register a job of `kind` and run `run(job, progress, log)` on its own thread. Status, error
+        and done/cancel events are handled here, identically for every job kind.
+        """
         job_id = uuid.uuid4().hex
-        job = JobState(job_id=job_id, kind="index")
+        job = JobState(job_id=job_id, kind=kind)
         with self._lock:
             self._jobs[job_id] = job
 
@@ -120,7 +137,7 @@ class JobManager:
             job.status = "running"
             job.emit({"type": "state", "ts": _now_ts(), "status": job.status})
             try:
-                run_index_job(req, _progress, _log, job.pause_evt, job.cancel_evt)
+                run(job, _progress, _log)
             except Exception as e:
                 tb = traceback.format_exc()
                 # Job functions raise RuntimeError("Cancelled") when cancel_evt is set.
@@ -140,53 +157,33 @@ class JobManager:
             job.finished_at = _now_ts()
             job.emit({"type": "done", "ts": _now_ts(), "status": job.status})
 
-        t = threading.Thread(target=_run, name=f"job-index-{job_id}", daemon=True)
+        t = threading.Thread(target=_run, name=f"job-{kind.replace('_', '-')}-{job_id}", daemon=True)
         job._thread = t
         t.start()
         return job_id
 
-    def start_render_job(self, req: RenderJobRequest) -> str:
-        job_id = uuid.uuid4().hex
-        job = JobState(job_id=job_id, kind="render")
-        with self._lock:
-            self._jobs[job_id] = job
+    def start_index_job(self, req: IndexJobRequest) -> str:
+        def _run(job: JobState, progress, log) -> None:
+            run_index_job(req, progress, log, job.pause_evt, job.cancel_evt)
 
-        def _progress(pct: int, stage: str) -> None:
-            job.progress_pct = int(pct)
-            job.stage = str(stage or "")
-            job.emit({"type": "progress", "ts": _now_ts(), "pct": int(pct), "stage": str(stage or "")})
+        return self._start_job("index", _run)
 
-        def _log(msg: str) -> None:
-            job.emit({"type": "log", "ts": _now_ts(), "message": str(msg or "")})
+    def start_render_job(self, req: RenderJobRequest) -> str:
+        def _run(job: JobState, progress, log) -> None:
+            def _artifact(info: dict) -> None:
+                kind = str(info.get("kind") or "")
+                job.set_artifact(kind, info)
+                job.emit({"type": "artifact", "ts": _now_ts(), "kind": kind, "playlist": info.get("playlist")})
 
-        def _run() -> None:
-            job.started_at = _now_ts()
-            job.status = "running"
-            job.emit({"type": "state", "ts": _now_ts(), "status": job.status})
-            try:
-                run_render_job(req, _progress, _log, job.pause_evt, job.cancel_evt)
-            except Exception as e:
-                tb = traceback.format_exc()
-                if job.cancel_evt.is_set() or str(e).strip().lower() == "cancelled":
-                    job.status = "canceled"
-                    job.finished_at = _now_ts()
-                    job.emit({"type": "done", "ts": _now_ts(), "status": job.status})
-                    return
-                job.status = "failed"
-                job.error = tb
-                job.finished_at = _now_ts()
-                job.emit({"type": "error", "ts": _now_ts(), "error": tb})
-                job.emit({"type": "done", "ts": _now_ts(), "status": job.status})
-                return
+            run_render_job(req, progress, log, job.pause_evt, job.cancel_evt, artifact=_artifact)
 
-            job.status = "succeeded"
-            job.finished_at = _now_ts()
-            job.emit({"type": "done", "ts": _now_ts(), "status": job.status})
+        return self._start_job("render", _run)
 
-        t = threading.Thread(target=_run, name=f"job-render-{job_id}", daemon=True)
-        job._thread = t
-        t.start()
-        return job_id
+    def start_batch_render_job(self, req: BatchRenderJobRequest) -> str:
+        def _run(job: JobState, progress, log) -> None:
+            run_batch_render_job(req, progress, log, job.pause_evt, job.cancel_evt)
+
+        return self._start_job("render_batch", _run)
 
     def pause(self, job_id: str) -> dict:
         job = self.get(job_id)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app.core.paths import default_paths
+from app.core.util import atomic_write_json
+
+
+# Serialize flushes across jobs in the same process (concurrent index jobs share one cache file).
+_GLOBAL_FLUSH_LOCK = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bytes_digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _short_key(cap_key: str) -> str:
+    # cache_key() can contain a long project hint; keep entry keys compact.
+    return hashlib.sha1(str(cap_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+def _is_usable_caption(v: object) -> bool:
+    if not isinstance(v, str):
+        return False
+    s = v.strip()
+    return bool(s) and not s.startswith("__FAILED__")
+
+
+class GlobalCaptionCache:
+    """
+    Content-addressed caption cache shared by all projects (data/caption_cache.json).
+
+    Entries are keyed by (provider cache_key, sha1 of the frame JPEG bytes), so the same episode
+    imported into another project (or re-imported after a move) reuses captions instead of paying again.
+    Eviction is LRU by last use, bounded by `max_entries`.
+    """
+
+    def __init__(self, path: str, *, max_entries: int = 50000) -> None:
+        self._path = path
+        self._max_entries = max(100, int(max_entries))
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = self._read_disk()
+        self._dirty = 0
+
+    @staticmethod
+    def default(*, max_entries: int = 50000) -> "GlobalCaptionCache":
+        return GlobalCaptionCache(os.path.join(default_paths().data_dir, "caption_cache.json"), max_entries=max_entries)
+
+    def _read_disk(self) -> dict[str, dict]:
+        if not os.path.isfile(self._path):
+            return {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            ents = raw.get("entries") if isinstance(raw, dict) else None
+            if isinstance(ents, dict):
+                return {str(k): v for k, v in ents.items() if isinstance(v, dict) and _is_usable_caption(v.get("t"))}
+        except Exception:
+            pass
+        return {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def dirty(self) -> int:
+        return self._dirty
+
+    def get(self, cap_key: str, digest: str) -> str | None:
+        if not digest:
+            return None
+        k = f"{_short_key(cap_key)}|{digest}"
+        with self._lock:
+            ent = self._entries.get(k)
+            if ent is None:
+                return None
+            ent["u"] = time.time()
+            return str(ent.get("t") or "")
+
+    def put(self, cap_key: str, digest: str, text: str) -> None:
+        if not digest or not _is_usable_caption(text):
+            return
+        k = f"{_short_key(cap_key)}|{digest}"
+        with self._lock:
+            self._entries[k] = {"t": str(text).strip(), "u": time.time()}
+            self._dirty += 1
+
+    def flush(self, *, force: bool = False) -> None:
+        if self._dirty <= 0 and not force:
+            return
+        with _GLOBAL_FLUSH_LOCK:
+            # Merge with what other jobs wrote since we loaded (newest use wins), then evict LRU.
+            disk = self._read_disk()
+            with self._lock:
+                for k, ent in disk.items():
+                    cur = self._entries.get(k)
+                    if cur is None or float(ent.get("u", 0.0) or 0.0) > float(cur.get("u", 0.0) or 0.0):
+                        self._entries[k] = ent
+                if len(self._entries) > self._max_entries:
+                    keep = sorted(self._entries.items(), key=lambda kv: float(kv[1].get("u", 0.0) or 0.0), reverse=True)
+                    self._entries = dict(keep[: self._max_entries])
+                data = {"version": 1, "updated_at": time.time(), "entries": dict(self._entries)}
+                self._dirty = 0
+            atomic_write_json(self._path, data)
+
+
+def _load_caption_map(path: str) -> dict[str, str]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if isinstance(raw, dict):
+            return {str(k): str(v) for k, v in raw.items()}
+    except Exception:
+        pass
+    return {}
+
+
+class CaptionVersionStore:
+    """
+    Per-project frame captions, stored per provider cache_key.
+
+    - index/frame_captions.json keeps the ACTIVE version (same format as before).
+    - index/caption_versions/<key>.json keeps previous versions; the newest `keep` versions survive.
+    - index/caption_cache_meta.json records the active cache_key and known versions.
+
+    Switching back to a model/prompt/hint that was captioned before restores its captions instantly.
+    """
+
+    def __init__(self, index_dir: str, *, keep: int = 3) -> None:
+        self._index_dir = index_dir
+        self._keep = max(1, int(keep))
+        self.captions_path = os.path.join(index_dir, "frame_captions.json")
+        self.meta_path = os.path.join(index_dir, "caption_cache_meta.json")
+        self.versions_dir = os.path.join(index_dir, "caption_versions")
+
+    def _version_path(self, cap_key: str) -> str:
+        return os.path.join(self.versions_dir, f"{_short_key(cap_key)}.json")
+
+    def _read_meta(self) -> dict | None:
+        if not os.path.isfile(self.meta_path):
+            return None
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            return raw if isinstance(raw, dict) else {}
+        except Exception:
+            return {}
+
+    def active_key(self) -> str:
+        return str((self._read_meta() or {}).get("cache_key") or "").strip()
+
+    def load_active(self) -> dict[str, str]:
+        return _load_caption_map(self.captions_path)
+
+    def activate(self, cap_key: str, *, log, legacy_refresh: bool = True) -> dict[str, str]:
+        """
+        Make `cap_key` the active version and return its captions.
+        The previously active version is archived (not discarded).
+        """
+        meta = self._read_meta()
+        captions = _load_caption_map(self.captions_path)
+        versions: list[dict] = []
+        old_key = ""
+        if meta is not None:
+            old_key = str(meta.get("cache_key") or "").strip()
+            for v in meta.get("versions") or []:
+                if isinstance(v, dict) and str(v.get("cache_key") or "").strip():
+                    versions.append({"cache_key": str(v["cache_key"]), "used_at": float(v.get("used_at", 0.0) or 0.0)})
+            if old_key and not any(v["cache_key"] == old_key for v in versions):
+                versions.append({"cache_key": old_key, "used_at": float(meta.get("updated_at", 0.0) or 0.0)})
+
+        # First run after upgrade (no meta yet): we don't know which prompt/model produced these captions.
+        if meta is None and captions and legacy_refresh:
+            log("Caption cache metadata missing; re-captioning all frames to apply current prompt/model...")
+            captions = {}
+
+        if old_key and old_key != cap_key:
+            if captions:
+                atomic_write_json(self._version_path(old_key), captions)
+            restored = _load_caption_map(self._version_path(cap_key))
+            if restored:
+                log(f"Caption prompt/model changed ({old_key} -> {cap_key}). Restored {len(restored)} cached captions of that version.")
+            else:
+                log(f"Caption prompt/model changed ({old_key} -> {cap_key}). No cached version; captions will be regenerated.")
+            captions = restored
+            atomic_write_json(self.captions_path, captions)
+
+        now = time.time()
+        versions = [v for v in versions if v["cache_key"] != cap_key]
+        versions.append({"cache_key": cap_key, "used_at": now})
+        versions.sort(key=lambda v: float(v["used_at"]), reverse=True)
+        for v in versions[self._keep :]:
+            try:
+                os.remove(self._version_path(v["cache_key"]))
+            except OSError:
+                pass
+        versions = versions[: self._keep]
+        # The active version lives in frame_captions.json; drop its (now stale) archive copy.
+        try:
+            os.remove(self._version_path(cap_key))
+        except OSError:
+            pass
+        atomic_write_json(self.meta_path, {"cache_key": cap_key, "updated_at": now, "versions": versions})
+        return captions
+
+    def stale_captions(self, cap_key: str) -> dict[str, str]:
+        """
+        Captions from older versions (newest first wins), used as provisional text while a new
+        version is being filled on demand.
+        """
+        meta = self._read_meta() or {}
+        out: dict[str, str] = {}
+        versions = [v for v in (meta.get("versions") or []) if isinstance(v, dict)]
+        versions.sort(key=lambda v: float(v.get("used_at", 0.0) or 0.0), reverse=True)
+        for v in versions:
+            k = str(v.get("cache_key") or "")
+            if not k or k == cap_key:
+                continue
+            for fk, txt in _load_caption_map(self._version_path(k)).items():
+                if fk not in out and _is_usable_caption(txt):
+                    out[fk] = txt
+        return out
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+
+# Clips flagged with any of these are excluded from matching.
+BLOCK_FLAGS = {"ad", "intro", "outro", "credit"}
+
+
+def merge_caps(clip_caps: list[str]) -> str:
+    """Clip text: the distinct frame captions (FLAGS suffix stripped), joined with ' ; '."""
+    uniq: list[str] = []
+    seen: set[str] = set()
+    for c in clip_caps:
+        c2 = (c or "").strip()
+        if " FLAGS:" in c2:
+            c2 = c2.split(" FLAGS:", 1)[0].strip()
+        if not c2 or c2 in seen:
+            continue
+        seen.add(c2)
+        uniq.append(c2)
+    return " ; ".join(uniq)
+
+
+def flags_from_caps(clip_caps: list[str]) -> set[str]:
+    flags: set[str] = set()
+    for c in clip_caps:
+        s = (c or "").strip()
+        if " FLAGS:" not in s:
+            continue
+        _, f = s.split(" FLAGS:", 1)
+        for part in f.split(","):
+            p = part.strip().lower()
+            if p:
+                flags.add(p)
+    return flags
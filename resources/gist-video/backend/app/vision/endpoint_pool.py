@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+class EndpointRequestError(RuntimeError):
+    """Deterministic client error (4xx other than 429): the request is at fault, not the endpoint."""
+
+
+@dataclass
+class RelayEndpoint:
+    api_base: str
+    api_key: str
+    max_in_flight: int = 4
+    weight: float = 1.0
+    # Runtime state (guarded by EndpointPool's condition).
+    in_flight: int = field(default=0, repr=False)
+    ewma_sec: float | None = field(default=None, repr=False)
+    fails: int = field(default=0, repr=False)
+    open_until: float = field(default=0.0, repr=False)
+    probing: bool = field(default=False, repr=False)
+    ok: int = field(default=0, repr=False)
+    errors: int = field(default=0, repr=False)
+
+    @property
+    def label(self) -> str:
+        # Never log keys; show host + key tail only.
+        k = (self.api_key or "").strip()
+        return f"{self.api_base}#{k[-4:] if len(k) >= 4 else '?'}"
+
+
+class EndpointPool:
+    """
+    Route relay requests across several OpenAI-compatible endpoints (mirrors and/or extra keys).
+
+    - Each endpoint has its own concurrency cap (max_in_flight).
+    - Routing prefers the lowest `ewma_latency * (in_flight + 1) / weight` among healthy endpoints.
+    - Circuit breaker: after `fail_threshold` consecutive failures an endpoint is opened for a cooldown
+      (doubling up to `max_cooldown_sec`); after that one probe request is let through (half-open).
+      Only throttling, server and network errors count; EndpointRequestError releases it neutrally.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[RelayEndpoint],
+        *,
+        fail_threshold: int = 3,
+        cooldown_sec: float = 15.0,
+        max_cooldown_sec: float = 120.0,
+        alpha: float = 0.3,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self._fail_threshold = max(1, int(fail_threshold))
+        self._cooldown = max(0.5, float(cooldown_sec))
+        self._max_cooldown = max(self._cooldown, float(max_cooldown_sec))
+        self._alpha = min(1.0, max(0.01, float(alpha)))
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def total_in_flight(self) -> int:
+        return sum(max(1, int(e.max_in_flight)) for e in self.endpoints)
+
+    def _available(self, e: RelayEndpoint, now: float) -> bool:
+        if e.in_flight >= max(1, int(e.max_in_flight)):
+            return False
+        if e.open_until > now:
+            return False
+        # Half-open: only one probe at a time after the cooldown.
+        if e.fails >= self._fail_threshold and e.probing:
+            return False
+        return True
+
+    def _score(self, e: RelayEndpoint) -> float:
+        # Unmeasured endpoints look fast so every endpoint gets sampled early.
+        lat = e.ewma_sec if e.ewma_sec is not None else 0.0
+        return (lat + 0.05) * (e.in_flight + 1) / max(0.01, float(e.weight))
+
+    def _pick_locked(self, avoid: set[int]) -> RelayEndpoint | None:
+        now = time.monotonic()
+        cands = [e for e in self.endpoints if self._available(e, now)]
+        if not cands:
+            return None
+        preferred = [e for e in cands if id(e) not in avoid]
+        return min(preferred or cands, key=self._score)
+
+    def _all_open_locked(self) -> bool:
+        now = time.monotonic()
+        return all(e.open_until > now or (e.fails >= self._fail_threshold and e.probing) for e in self.endpoints)
+
+    @contextmanager
+    def acquire(self, *, avoid: set[int] | None = None, timeout: float = 600.0):
+        """
+        Borrow an endpoint for one HTTP attempt. `avoid` holds id()s of endpoints to skip if any
+        other one is available (used to send hedged duplicates elsewhere).
+        Raises RuntimeError when every endpoint is circuit-open.
+        """
+        avoid = avoid or set()
+        deadline = time.monotonic() + max(1.0, float(timeout))
+        with self._cond:
+            while True:
+                ep = self._pick_locked(avoid)
+                if ep is not None:
+                    break
+                if self._all_open_locked():
+                    raise RuntimeError("所有 Vision API 端点均暂时不可用（连续失败已熔断），稍后自动重试。")
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise RuntimeError("等待可用 Vision API 端点超时。")
+                self._cond.wait(timeout=min(1.0, left))
+            ep.in_flight += 1
+            if ep.fails >= self._fail_threshold:
+                ep.probing = True
+
+        t0 = time.monotonic()
+        ok: bool | None = False
+        try:
+            yield ep
+            ok = True
+        except EndpointRequestError:
+            ok = None
+            raise
+        finally:
+            self._report(ep, ok=ok, sec=time.monotonic() - t0)
+
+    def _report(self, ep: RelayEndpoint, *, ok: bool | None, sec: float) -> None:
+        """ok=None: the endpoint answered but rejected the request; breaker state is left unchanged."""
+        with self._cond:
+            ep.in_flight = max(0, ep.in_flight - 1)
+            ep.probing = False
+            if ok is None:
+                pass
+            elif ok:
+                ep.ok += 1
+                ep.fails = 0
+                ep.open_until = 0.0
+                ep.ewma_sec = sec if ep.ewma_sec is None else (1.0 - self._alpha) * ep.ewma_sec + self._alpha * sec
+            else:
+                ep.errors += 1
+                ep.fails += 1
+                if ep.fails >= self._fail_threshold:
+                    n = ep.fails - self._fail_threshold
+                    ep.open_until = time.monotonic() + min(self._max_cooldown, self._cooldown * (2**min(n, 8)))
+            self._cond.notify_all()
+
+    def stats(self) -> list[dict]:
+        with self._cond:
+            now = time.monotonic()
+            return [
+                {
+                    "endpoint": e.label,
+                    "ok": int(e.ok),
+                    "errors": int(e.errors),
+                    "ewma_ms": (int(e.ewma_sec * 1000) if e.ewma_sec is not None else None),
+                    "open": bool(e.open_until > now),
+                }
+                for e in self.endpoints
+            ]
+
+
+def build_endpoints(
+    api_base: str, api_key: str, extra: list[dict] | None, *, default_max_in_flight: int = 4
+) -> list[RelayEndpoint]:
+    """Primary api_base/api_key first, then extra endpoints; duplicates (same base + key) are dropped."""
+    out: list[RelayEndpoint] = []
+    seen: set[tuple[str, str]] = set()
+    items: list[dict] = [{"api_base": api_base, "api_key": api_key}] + [e for e in (extra or []) if isinstance(e, dict)]
+    for it in items:
+        base = str(it.get("api_base") or "").strip().rstrip("/")
+        key = str(it.get("api_key") or "").strip()
+        if not base or not key or (base, key) in seen:
+            continue
+        seen.add((base, key))
+        try:
+            mif = int(it.get("max_in_flight") or default_max_in_flight)
+        except Exception:
+            mif = int(default_max_in_flight)
+        try:
+            w = float(it.get("weight") if it.get("weight") is not None else 1.0)
+        except Exception:
+            w = 1.0
+        out.append(RelayEndpoint(api_base=base, api_key=key, max_in_flight=max(1, mif), weight=max(0.01, w)))
+    return out
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-import base64
 import json
 import random
+import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from app.vision.endpoint_pool import EndpointPool, EndpointRequestError, build_endpoints
+from app.vision.hedging import HedgeAttempt, Hedger
+from app.vision.payload_cache import get_payload_cache
 
 
 _PROMPT_VERSION = 4
@@ -97,6 +101,11 @@ def _format_caption_item(item: dict) -> str:
     return cap
 
 
+def _serialize_body(body: dict) -> bytes:
+    # Serialize once; retries resend the same buffer instead of re-encoding megabytes of base64.
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 @dataclass
 class GeminiRelayCaptionProvider:
     api_base: str
@@ -106,6 +115,16 @@ class GeminiRelayCaptionProvider:
     max_retries: int = 5
     backoff_base_sec: float = 0.8
     project_hint: str = ""
+    # Hedged requests: duplicate a request still running past the rolling p95 latency (capped by budget).
+    hedge_enable: bool = False
+    hedge_budget: float = 0.1
+    # Extra relay endpoints pooled with api_base/api_key (see vision.api_endpoints).
+    endpoints: list[dict] | None = None
+    endpoint_max_in_flight: int = 4
+    _hedger: Hedger | None = field(default=None, repr=False, compare=False)
+    _pool: EndpointPool | None = field(default=None, repr=False, compare=False)
+    _init_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    _counters: dict[str, int] = field(default_factory=dict, repr=False, compare=False)
 
     def cache_key(self) -> str:
         # Changing this will trigger re-captioning via index_job caption cache key.
@@ -117,33 +136,175 @@ class GeminiRelayCaptionProvider:
     def set_project_hint(self, hint: str) -> None:
         self.project_hint = str(hint or "").strip()
 
-    def caption_image_groups(self, groups: list[list[str]]) -> list[str]:
+    def _check_config(self) -> None:
+        if not self.endpoints:
+            if not _normalize_api_base(self.api_base):
+                raise RuntimeError("API地址未配置（vision.api_base）。")
+            if not (self.api_key or "").strip():
+                raise RuntimeError("API密钥未配置（vision.api_key）。")
+        if not (self.model or "").strip():
+            raise RuntimeError("Vision模型未配置（vision.vision_model）。")
+        if self._get_pool() is None:
+            raise RuntimeError("没有可用的 Vision API 端点（api_base/api_key 或 api_endpoints）。")
+
+    def _get_pool(self) -> EndpointPool | None:
+        with self._init_lock:
+            if self._pool is None:
+                eps = build_endpoints(
+                    self.api_base, self.api_key, self.endpoints, default_max_in_flight=int(self.endpoint_max_in_flight)
+                )
+                if eps:
+                    self._pool = EndpointPool(eps)
+            return self._pool
+
+    def endpoint_count(self) -> int:
+        pool = self._get_pool()
+        return len(pool) if pool is not None else 0
+
+    def endpoint_capacity(self) -> int:
+        pool = self._get_pool()
+        return pool.total_in_flight if pool is not None else 0
+
+    def _get_hedger(self) -> Hedger | None:
+        if not self.hedge_enable or float(self.hedge_budget) <= 0.0:
+            return None
+        with self._init_lock:
+            if self._hedger is None:
+                # Bounded by how many requests the endpoints take at once (more would only wait for a slot).
+                pool = self._pool
+                capacity = pool.total_in_flight if pool is not None else int(self.endpoint_max_in_flight)
+                self._hedger = Hedger(budget_ratio=float(self.hedge_budget), max_threads=max(4, int(capacity)))
+            return self._hedger
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._init_lock:
+            self._counters[name] = int(self._counters.get(name, 0)) + int(n)
+
+    def stats(self) -> dict[str, int]:
+        with self._init_lock:
+            out: dict[str, int] = dict(self._counters)
+        if self._hedger is not None:
+            out.update(self._hedger.stats())
+        if self._pool is not None and len(self._pool) > 1:
+            eps = self._pool.stats()
+            out["endpoints"] = len(eps)
+            out["endpoints_open"] = sum(1 for e in eps if e["open"])
+        return out
+
+    def close(self) -> None:
+        with self._init_lock:
+            hedger, self._hedger = self._hedger, None
+        if hedger is not None:
+            hedger.close()
+
+    def endpoint_stats(self) -> list[dict]:
+        return self._pool.stats() if self._pool is not None else []
+
+    def _post_chat(self, body: bytes) -> str:
         """
-        Caption multiple clips per request. Each clip can contain multiple frames.
-        Returns one caption string per clip (we write it back to all frames for caching).
+        POST a pre-serialized chat/completions body with retries; return the message content.
+        The same bytes buffer is reused for every attempt.
         """
         try:
             import requests  # type: ignore
         except ModuleNotFoundError as e:
             raise RuntimeError("缺少依赖：requests。请先 pip install requests") from e
 
+        pool = self._get_pool()
+        if pool is None:
+            raise RuntimeError("没有可用的 Vision API 端点（api_base/api_key 或 api_endpoints）。")
+        # Endpoints currently serving this request; a hedged duplicate goes to a different one when possible.
+        busy: list[int] = []
+
+        def _attempt(attempt: HedgeAttempt | None = None) -> dict:
+            self._count("http_attempts")
+            with pool.acquire(avoid=set(busy)) as ep:
+                busy.append(id(ep))
+                try:
+                    url = _normalize_api_base(ep.api_base) + "/chat/completions"
+                    headers = {"Authorization": f"Bearer {ep.api_key}", "Content-Type": "application/json"}
+                    # Use separate connect/read timeouts; SSL EOF often benefits from retry.
+                    # Streamed, so a hedge that lost the race closes the connection instead of reading the body.
+                    r = requests.post(url, headers=headers, data=body, timeout=(10, self.timeout_sec), stream=True)
+                    try:
+                        if attempt is not None:
+                            attempt.on_abandon(r.close)
+                        if r.status_code == 429 or r.status_code >= 500:
+                            raise RuntimeError(f"Vision API临时错误 {r.status_code}: {r.text[:200]}")
+                        if r.status_code >= 400:
+                            # Bad request/model/oversized image: not the endpoint's fault, don't trip its breaker.
+                            raise EndpointRequestError(f"Vision API错误 {r.status_code}: {r.text[:500]}")
+                        return r.json()
+                    except Exception as e:
+                        if attempt is not None and attempt.abandoned:
+                            # Closed by the hedger after the other attempt won: not the endpoint's fault either.
+                            raise EndpointRequestError("hedged duplicate abandoned") from e
+                        raise
+                    finally:
+                        r.close()
+                finally:
+                    busy.remove(id(ep))
+
+        hedger = self._get_hedger()
+        self._count("requests")
+        last_err: Exception | None = None
+        data: dict = {}
+        for attempt in range(int(self.max_retries)):
+            if attempt:
+                self._count("retries")
+            try:
+                data = hedger.call(_attempt) if hedger is not None else _attempt()
+                last_err = None
+                break
+            except EndpointRequestError:
+                # The request itself is bad (4xx): resending the same body cannot succeed.
+                self._count("failed")
+                raise
+            except Exception as e:
+                last_err = e
+                # backoff with jitter
+                if attempt + 1 >= int(self.max_retries):
+                    break
+                sleep_s = float(self.backoff_base_sec) * (2**attempt) + random.uniform(0.0, 0.25)
+                time.sleep(min(10.0, sleep_s))
+
+        if last_err is not None:
+            self._count("failed")
+            raise RuntimeError(
+                "Vision API请求失败（多次重试仍失败）。"
+                "如果你开启了较高并发，请在“API设置”里把并发线程数/最大排队请求调小。"
+                f"\n原始错误：{last_err}"
+            ) from last_err
+
+        try:
+            return data["choices"][0]["message"]["content"]
+        except Exception:
+            self._count("bad_responses")
+            raise RuntimeError(f"Vision API返回格式异常: {str(data)[:500]}")
+
+    def _parse_json(self, text: str) -> dict:
+        try:
+            return _extract_json_text(text)
+        except Exception:
+            self._count("bad_responses")
+            raise
+
+    def caption_image_groups(self, groups: list[list[str]]) -> list[str]:
+        """
+        Caption multiple clips per request. Each clip can contain multiple frames.
+        Returns one caption string per clip (we write it back to all frames for caching).
+        """
         if not groups:
             return []
-        api_base = _normalize_api_base(self.api_base)
-        if not api_base:
-            raise RuntimeError("API地址未配置（vision.api_base）。")
-        if not (self.api_key or "").strip():
-            raise RuntimeError("API密钥未配置（vision.api_key）。")
-        if not (self.model or "").strip():
-            raise RuntimeError("Vision模型未配置（vision.vision_model）。")
+        self._check_config()
 
+        # Payloads are usually pre-encoded by the index job right after frame extraction.
+        payloads = get_payload_cache()
         content: list[dict] = []
         for i, paths in enumerate(groups):
             content.append({"type": "text", "text": f"CLIP {i}"})
             for p in (paths or []):
-                with open(p, "rb") as f:
-                    b64 = base64.b64encode(f.read()).decode("ascii")
-                content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
+                content.append({"type": "image_url", "image_url": {"url": payloads.get(p)}})
 
         hint = (self.project_hint or "").strip()
         hint_line = f"本项目作品/IP 提示：{hint}\\n" if hint else ""
@@ -167,39 +328,8 @@ class GeminiRelayCaptionProvider:
             ],
         }
 
-        url = api_base + "/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        last_err: Exception | None = None
-        for attempt in range(int(self.max_retries)):
-            try:
-                r = requests.post(url, headers=headers, json=body, timeout=(10, self.timeout_sec))
-                if r.status_code in (429, 500, 502, 503, 504):
-                    raise RuntimeError(f"Vision API临时错误 {r.status_code}: {r.text[:200]}")
-                if r.status_code >= 400:
-                    raise RuntimeError(f"Vision API错误 {r.status_code}: {r.text[:500]}")
-                data = r.json()
-                last_err = None
-                break
-            except Exception as e:
-                last_err = e
-                if attempt + 1 >= int(self.max_retries):
-                    break
-                sleep_s = float(self.backoff_base_sec) * (2**attempt) + random.uniform(0.0, 0.25)
-                time.sleep(min(10.0, sleep_s))
-
-        if last_err is not None:
-            raise RuntimeError(
-                "Vision API请求失败（多次重试仍失败）。"
-                "如果你开启了较高并发，请在“API设置”里把并发线程数/最大排队请求调小。"
-                f"\n原始错误：{last_err}"
-            ) from last_err
-
-        try:
-            text = data["choices"][0]["message"]["content"]
-        except Exception:
-            raise RuntimeError(f"Vision API返回格式异常: {str(data)[:500]}")
-
-        obj = _extract_json_text(text)
+        text = self._post_chat(_serialize_body(body))
+        obj = self._parse_json(text)
         out: list[str] = []
         for i in range(len(groups)):
             item = obj.get(str(i)) or obj.get(i) or {}
@@ -210,26 +340,12 @@ class GeminiRelayCaptionProvider:
         return out
 
     def caption_image_paths(self, image_paths: list[str]) -> list[str]:
-        try:
-            import requests  # type: ignore
-        except ModuleNotFoundError as e:
-            raise RuntimeError("缺少依赖：requests。请先 pip install requests") from e
-
         if not image_paths:
             return []
-        api_base = _normalize_api_base(self.api_base)
-        if not api_base:
-            raise RuntimeError("API地址未配置（vision.api_base）。")
-        if not (self.api_key or "").strip():
-            raise RuntimeError("API密钥未配置（vision.api_key）。")
-        if not (self.model or "").strip():
-            raise RuntimeError("Vision模型未配置（vision.vision_model）。")
+        self._check_config()
 
-        images = []
-        for p in image_paths:
-            with open(p, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            images.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
+        payloads = get_payload_cache()
+        images = [{"type": "image_url", "image_url": {"url": payloads.get(p)}} for p in image_paths]
 
         hint = (self.project_hint or "").strip()
         hint_line = f"本项目作品/IP 提示：{hint}\\n" if hint else ""
@@ -267,41 +383,8 @@ class GeminiRelayCaptionProvider:
             ],
         }
 
-        url = api_base + "/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        last_err: Exception | None = None
-        for attempt in range(int(self.max_retries)):
-            try:
-                # Use separate connect/read timeouts; SSL EOF often benefits from retry.
-                r = requests.post(url, headers=headers, json=body, timeout=(10, self.timeout_sec))
-                if r.status_code in (429, 500, 502, 503, 504):
-                    raise RuntimeError(f"Vision API临时错误 {r.status_code}: {r.text[:200]}")
-                if r.status_code >= 400:
-                    raise RuntimeError(f"Vision API错误 {r.status_code}: {r.text[:500]}")
-                data = r.json()
-                last_err = None
-                break
-            except Exception as e:
-                last_err = e
-                # backoff with jitter
-                if attempt + 1 >= int(self.max_retries):
-                    break
-                sleep_s = float(self.backoff_base_sec) * (2**attempt) + random.uniform(0.0, 0.25)
-                time.sleep(min(10.0, sleep_s))
-
-        if last_err is not None:
-            raise RuntimeError(
-                "Vision API请求失败（多次重试仍失败）。"
-                "如果你开启了较高并发，请在“API设置”里把并发线程数/最大排队请求调小。"
-                f"\n原始错误：{last_err}"
-            ) from last_err
-
-        try:
-            text = data["choices"][0]["message"]["content"]
-        except Exception:
-            raise RuntimeError(f"Vision API返回格式异常: {str(data)[:500]}")
-
-        obj = _extract_json_text(text)
+        text = self._post_chat(_serialize_body(body))
+        obj = self._parse_json(text)
         out: list[str] = []
         for i in range(len(image_paths)):
             item = obj.get(str(i)) or obj.get(i) or {}
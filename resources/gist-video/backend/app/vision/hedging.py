@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies (seconds)."""
+
+    def __init__(self, *, window: int = 200, min_samples: int = 8) -> None:
+        self._lat: deque[float] = deque(maxlen=max(10, int(window)))
+        self._min_samples = max(1, int(min_samples))
+        self._lock = threading.Lock()
+
+    def record(self, sec: float) -> None:
+        with self._lock:
+            self._lat.append(float(sec))
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self._lat) < self._min_samples:
+                return None
+            xs = sorted(self._lat)
+        i = int(round(max(0.0, min(1.0, float(q))) * (len(xs) - 1)))
+        return float(xs[i])
+
+
+class HedgeBudget:
+    """Allow at most `ratio` hedged duplicates per primary request (e.g. 0.1 = +10% requests)."""
+
+    def __init__(self, ratio: float) -> None:
+        self._ratio = max(0.0, float(ratio))
+        self._primaries = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def on_primary(self) -> None:
+        with self._lock:
+            self._primaries += 1
+
+    def has_room(self) -> bool:
+        with self._lock:
+            return (self._hedges + 1) <= self._ratio * max(1, self._primaries)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if (self._hedges + 1) > self._ratio * max(1, self._primaries):
+                return False
+            self._hedges += 1
+            return True
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"primaries": int(self._primaries), "hedges": int(self._hedges)}
+
+
+class HedgeAttempt:
+    """
+    Handle passed to every attempt. When the other attempt wins, the loser is abandoned: callbacks
+    registered with on_abandon() run (e.g. closing its HTTP response so the connection isn't kept busy).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._closers: list = []
+        self.abandoned = False
+
+    def on_abandon(self, fn) -> None:
+        with self._lock:
+            if not self.abandoned:
+                self._closers.append(fn)
+                return
+        _quiet(fn)
+
+    def abandon(self) -> None:
+        with self._lock:
+            self.abandoned = True
+            fns, self._closers = self._closers, []
+        for fn in fns:
+            _quiet(fn)
+
+
+def _quiet(fn) -> None:
+    try:
+        fn()
+    except Exception:
+        pass
+
+
+class Hedger:
+    """
+    Hedged requests for heavy-tailed relay latency.
+
+    When a request is still in flight after the rolling p95 latency, a duplicate is fired and whichever
+    finishes first wins. The loser is abandoned (see HedgeAttempt) and its result dropped. Duplicates are
+    capped by HedgeBudget.
+
+    `fn(attempt)` runs on bounded, lazily created pools: up to `max_threads` primaries (a primary that
+    finds them all busy runs unhedged on the caller's thread, never queued) and a smaller hedge pool.
+    Without a p95 estimate or hedge budget the primary runs on the caller's thread. Call close() when done.
+    """
+
+    def __init__(self, *, budget_ratio: float, quantile: float = 0.95, max_threads: int = 16) -> None:
+        self.tracker = LatencyTracker()
+        self.budget = HedgeBudget(budget_ratio)
+        self._quantile = float(quantile)
+        self._max_threads = max(1, int(max_threads))
+        self._max_hedges = max(1, min(self._max_threads, int(self._max_threads * max(0.0, float(budget_ratio))) + 1))
+        self._primary_slots = threading.BoundedSemaphore(self._max_threads)
+        self._primaries: ThreadPoolExecutor | None = None
+        self._hedges: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.wins = 0
+
+    def _timed(self, fn, attempt: HedgeAttempt):
+        t0 = time.monotonic()
+        out = fn(attempt)
+        self.tracker.record(time.monotonic() - t0)
+        return out
+
+    def _run_primary(self, fn, attempt: HedgeAttempt):
+        try:
+            return self._timed(fn, attempt)
+        finally:
+            self._primary_slots.release()
+
+    def _submit_primary(self, fn, attempt: HedgeAttempt) -> Future | None:
+        if not self._primary_slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            if not self._closed:
+                if self._primaries is None:
+                    self._primaries = ThreadPoolExecutor(max_workers=self._max_threads, thread_name_prefix="caption-primary")
+                return self._primaries.submit(self._run_primary, fn, attempt)
+        self._primary_slots.release()
+        return None
+
+    def _submit_hedge(self, fn, attempt: HedgeAttempt) -> Future | None:
+        with self._lock:
+            if self._closed:
+                return None
+            if self._hedges is None:
+                self._hedges = ThreadPoolExecutor(max_workers=self._max_hedges, thread_name_prefix="caption-hedge")
+            return self._hedges.submit(self._timed, fn, attempt)
+
+    def call(self, fn):
+        self.budget.on_primary()
+        delay = self.tracker.percentile(self._quantile)
+        if delay is None or self._closed or not self.budget.has_room():
+            return self._timed(fn, HedgeAttempt())
+
+        attempts: dict[Future, HedgeAttempt] = {}
+        first = HedgeAttempt()
+        primary = self._submit_primary(fn, first)
+        if primary is None:
+            return self._timed(fn, first)
+        attempts[primary] = first
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.try_acquire():
+            return primary.result()
+        second = HedgeAttempt()
+        hedge = self._submit_hedge(fn, second)
+        if hedge is None:
+            return primary.result()
+        attempts[hedge] = second
+
+        futs = [primary, hedge]
+        last_err: BaseException | None = None
+        while futs:
+            done, _ = wait(futs, return_when=FIRST_COMPLETED)
+            for f in done:
+                futs.remove(f)
+                err = f.exception()
+                if err is None:
+                    if f is hedge:
+                        with self._lock:
+                            self.wins += 1
+                    for other in futs:
+                        other.cancel()
+                        attempts[other].abandon()
+                    return f.result()
+                last_err = err
+        assert last_err is not None
+        raise last_err
+
+    def close(self) -> None:
+        """Stop the pools; attempts in flight finish in the background, queued hedges are dropped."""
+        with self._lock:
+            self._closed = True
+            primaries, hedges = self._primaries, self._hedges
+            self._primaries = self._hedges = None
+        # A submitted primary always has a worker (and a caller waiting on it): never cancel those.
+        if primaries is not None:
+            primaries.shutdown(wait=False)
+        if hedges is not None:
+            hedges.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            wins = int(self.wins)
+        return {**self.budget.stats(), "hedge_wins": wins}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import base64
+import os
+import threading
+from collections import OrderedDict
+
+
+class ImagePayloadCache:
+    """
+    In-memory LRU of ready-to-send `data:image/jpeg;base64,...` URLs, bounded by total bytes.
+
+    The index job warms it right after frames are extracted, so caption requests (and their retries)
+    never re-read or re-encode the JPEGs on the worker threads.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._items: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def _key(path: str) -> tuple[str, int, int]:
+        st = os.stat(path)
+        return (os.path.abspath(path), int(st.st_mtime_ns), int(st.st_size))
+
+    def set_budget(self, max_bytes: int) -> None:
+        with self._lock:
+            self._max_bytes = max(0, int(max_bytes))
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        while self._items and self._bytes > self._max_bytes:
+            _k, v = self._items.popitem(last=False)
+            self._bytes -= len(v)
+
+    def _put_locked(self, key: tuple[str, int, int], url: str) -> None:
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        if len(url) > self._max_bytes:
+            return
+        self._items[key] = url
+        self._bytes += len(url)
+        self._evict_locked()
+
+    def get(self, path: str) -> str:
+        key = self._key(path)
+        with self._lock:
+            url = self._items.get(key)
+            if url is not None:
+                self._items.move_to_end(key)
+                return url
+        with open(path, "rb") as f:
+            url = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+        with self._lock:
+            self._put_locked(key, url)
+        return url
+
+    def put_bytes(self, path: str, data: bytes) -> None:
+        """Register already-encoded JPEG bytes for `path` (file must exist so the key matches later reads)."""
+        key = self._key(path)
+        url = "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+        with self._lock:
+            self._put_locked(key, url)
+
+    def warm(self, paths: list[str]) -> None:
+        for p in paths:
+            try:
+                self.get(p)
+            except OSError:
+                continue
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"items": len(self._items), "bytes": int(self._bytes), "max_bytes": int(self._max_bytes)}
+
+
+# Until a job configures it (vision.caption_payload_cache_mb default).
+_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_LOCK = threading.Lock()
+_CACHE: ImagePayloadCache | None = None
+
+
+def configure_payload_cache(max_bytes: int) -> ImagePayloadCache:
+    """Set the process-wide cache budget (jobs call this once with vision.caption_payload_cache_mb)."""
+    global _CACHE
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = ImagePayloadCache(max_bytes)
+        else:
+            _CACHE.set_budget(max_bytes)
+        return _CACHE
+
+
+def get_payload_cache() -> ImagePayloadCache:
+    """Process-wide payload cache; hot path (caption workers), never reads settings."""
+    global _CACHE
+    cache = _CACHE
+    if cache is not None:
+        return cache
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = ImagePayloadCache(_DEFAULT_MAX_BYTES)
+        return _CACHE
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+
+import numpy as np
+
+from app.core.util import atomic_write_json
+
+
+# Popcount lookup for uint8; 64-bit hamming distance = sum over the 8 bytes.
+_POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash_gray(g: np.ndarray) -> int:
+    """64-bit difference hash of an 8x9 (rows x cols) grayscale image."""
+    g = np.asarray(g, dtype=np.int16).reshape(8, 9)
+    bits = (g[:, 1:] > g[:, :-1]).reshape(-1)
+    return int(np.packbits(bits.astype(np.uint8)).view(">u8")[0])
+
+
+def _tiny_gray_pil(path: str) -> np.ndarray | None:
+    try:
+        from PIL import Image  # type: ignore
+    except Exception:
+        return None
+    with Image.open(path) as im:
+        return np.asarray(im.convert("L").resize((9, 8), Image.BOX), dtype=np.uint8)
+
+
+def _tiny_gray_ffmpeg(ffmpeg: str, path: str) -> np.ndarray | None:
+    p = subprocess.run(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            path,
+            "-vf",
+            "scale=9:8:flags=area,format=gray",
+            "-frames:v",
+            "1",
+            "-f",
+            "rawvideo",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if p.returncode != 0 or len(p.stdout) < 72:
+        return None
+    return np.frombuffer(p.stdout[:72], dtype=np.uint8).reshape(8, 9)
+
+
+def frame_dhash(path: str, *, ffmpeg: str) -> int | None:
+    """dHash of an image file (PIL when available, else a tiny ffmpeg grayscale decode)."""
+    g = None
+    try:
+        g = _tiny_gray_pil(path)
+    except Exception:
+        g = None
+    if g is None:
+        g = _tiny_gray_ffmpeg(ffmpeg, path)
+    return dhash_gray(g) if g is not None else None
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Elementwise hamming distance of uint64 arrays (broadcasting)."""
+    x = np.ascontiguousarray(np.bitwise_xor(a.astype(np.uint64), b.astype(np.uint64)))
+    return _POP8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.int32)
+
+
+class FrameHashStore:
+    """
+    Per-project frame dHash cache (index/frame_phash.json), keyed by frame rel key and
+    invalidated when the JPEG's size/mtime changes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._items: dict[str, list] = {}
+        self._dirty = 0
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                frames = raw.get("frames") if isinstance(raw, dict) else None
+                if isinstance(frames, dict):
+                    self._items = {str(k): v for k, v in frames.items() if isinstance(v, list) and len(v) == 3}
+            except Exception:
+                self._items = {}
+
+    @property
+    def dirty(self) -> int:
+        return self._dirty
+
+    def get(self, key: str, path: str, *, ffmpeg: str) -> int | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        sig = [int(st.st_size), int(st.st_mtime_ns)]
+        ent = self._items.get(key)
+        if ent is not None and [int(ent[0]), int(ent[1])] == sig:
+            try:
+                return int(str(ent[2]), 16)
+            except Exception:
+                pass
+        h = frame_dhash(path, ffmpeg=ffmpeg)
+        if h is None:
+            return None
+        self._items[key] = sig + [f"{h:016x}"]
+        self._dirty += 1
+        return h
+
+    def put(self, key: str, path: str, h: int) -> None:
+        """Record a hash computed elsewhere (e.g. from in-memory decoded pixels)."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._items[key] = [int(st.st_size), int(st.st_mtime_ns), f"{int(h):016x}"]
+        self._dirty += 1
+
+    def flush(self) -> None:
+        if self._dirty <= 0:
+            return
+        atomic_write_json(self._path, {"version": 1, "frames": self._items})
+        self._dirty = 0
+
+
+class ClipHashIndex:
+    """
+    Near-duplicate lookup over clips (one dHash per frame). Two clips match when every
+    corresponding frame is within `max_dist` bits.
+    """
+
+    def __init__(self) -> None:
+        # frames-per-clip -> (clip ids, hash matrix with spare capacity, used rows)
+        self._groups: dict[int, tuple[list[int], np.ndarray, int]] = {}
+
+    def __len__(self) -> int:
+        return sum(n for _ids, _m, n in self._groups.values())
+
+    def add(self, clip_idx: int, hashes: list[int]) -> None:
+        nf = len(hashes)
+        if nf <= 0:
+            return
+        ids, mat, n = self._groups.get(nf, ([], np.zeros((64, nf), dtype=np.uint64), 0))
+        if n >= mat.shape[0]:
+            mat = np.concatenate([mat, np.zeros_like(mat)], axis=0)
+        mat[n] = np.array(hashes, dtype=np.uint64)
+        ids.append(int(clip_idx))
+        self._groups[nf] = (ids, mat, n + 1)
+
+    def find(self, hashes: list[int], max_dist: int) -> int | None:
+        g = self._groups.get(len(hashes))
+        if g is None:
+            return None
+        ids, mat, n = g
+        if n <= 0:
+            return None
+        q = np.array(hashes, dtype=np.uint64)
+        worst = hamming(mat[:n], q[None, :]).max(axis=1)
+        j = int(np.argmin(worst))
+        return ids[j] if int(worst[j]) <= int(max_dist) else None
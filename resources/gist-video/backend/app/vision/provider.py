@@ -13,6 +13,10 @@ class VisionCaptionProvider:
         # Used for invalidating frame caption cache when backend/prompt/model changes.
         return type(self).__name__
 
+    def close(self) -> None:
+        # Release per-provider resources (e.g. hedge threads); the job calls this when it is done.
+        return None
+
 
 @dataclass
 class NullCaptionProvider(VisionCaptionProvider):
@@ -34,6 +38,10 @@ def get_caption_provider() -> VisionCaptionProvider:
             api_base=st.api_base,
             api_key=st.api_key,
             model=st.vision_model,
+            hedge_enable=bool(st.caption_hedge_enable),
+            hedge_budget=float(st.caption_hedge_budget),
+            endpoints=list(st.api_endpoints or []),
+            endpoint_max_in_flight=int(st.caption_endpoint_max_in_flight),
         )
 
     # The legacy ModelScope caption backend has been removed to keep the project lightweight.
@@ -47,12 +55,17 @@ def get_caption_provider() -> VisionCaptionProvider:
         )
 
     # auto
-    if (st.api_base or "").strip() and (st.api_key or "").strip() and (st.vision_model or "").strip():
+    has_endpoint = ((st.api_base or "").strip() and (st.api_key or "").strip()) or bool(st.api_endpoints)
+    if has_endpoint and (st.vision_model or "").strip():
         from app.vision.gemini_proxy import GeminiRelayCaptionProvider
 
         return GeminiRelayCaptionProvider(
             api_base=st.api_base,
             api_key=st.api_key,
             model=st.vision_model,
+            hedge_enable=bool(st.caption_hedge_enable),
+            hedge_budget=float(st.caption_hedge_budget),
+            endpoints=list(st.api_endpoints or []),
+            endpoint_max_in_flight=int(st.caption_endpoint_max_in_flight),
         )
     return NullCaptionProvider()
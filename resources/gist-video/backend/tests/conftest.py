@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import os
+import sys
+
+# Tests import the backend as `app.*`, like _backend_entry.py does.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+import os
+
+from app.jobs.edl_diff import diff_segments, find_previous_render, reuse_segment_file
+
+
+def test_identical_edl_reuses_everything() -> None:
+    same, changed = diff_segments(["a", "b", "c"], ["a", "b", "c"])
+    assert same == {0: 0, 1: 1, 2: 2}
+    assert changed == []
+
+
+def test_changed_segment_is_the_only_rerender() -> None:
+    same, changed = diff_segments(["a", "b", "c", "d"], ["a", "x", "c", "d"])
+    assert same == {0: 0, 2: 2, 3: 3}
+    assert changed == [(1, 2)]
+
+
+def test_insert_and_delete_only_shift_later_segments() -> None:
+    same, changed = diff_segments(["a", "b", "c", "d"], ["a", "new", "b", "c", "d"])
+    assert same == {0: 0, 2: 1, 3: 2, 4: 3}
+    assert changed == [(1, 2)]
+
+    same, changed = diff_segments(["a", "b", "c", "d"], ["a", "c", "d"])
+    assert same == {0: 0, 1: 2, 2: 3}
+    assert changed == []
+
+
+def test_empty_previous_render_changes_everything() -> None:
+    assert diff_segments([], ["a", "b"]) == ({}, [(0, 2)])
+
+
+def test_find_previous_render_matches_output_path(tmp_path) -> None:
+    jobs = tmp_path / "jobs"
+    out = str(tmp_path / "out.mp4")
+    for name, path in (("render_001", out), ("render_002", str(tmp_path / "other.mp4")), ("render_003", out)):
+        d = jobs / name
+        d.mkdir(parents=True)
+        edl = {"outputs": [{"output_path": path, "segment_keys": [name], "segment_files": []}]}
+        (d / "edl.json").write_text(json.dumps(edl), encoding="utf-8")
+
+    prev_dir, prev = find_previous_render(str(jobs), "render_004", out)
+    assert os.path.basename(prev_dir) == "render_003"
+    assert prev["segment_keys"] == ["render_003"]
+    # A job never diffs against itself.
+    prev_dir, _ = find_previous_render(str(jobs), "render_003", out)
+    assert os.path.basename(prev_dir) == "render_001"
+    assert find_previous_render(str(tmp_path / "missing"), "render_004", out) is None
+
+
+def test_reuse_segment_file_links_or_reports_missing(tmp_path) -> None:
+    src = tmp_path / "prev" / "seg.ts"
+    src.parent.mkdir()
+    src.write_bytes(b"ts")
+    dst = tmp_path / "new" / "seg.ts"
+    assert reuse_segment_file(str(src), str(dst))
+    assert dst.read_bytes() == b"ts"
+    assert not reuse_segment_file(str(tmp_path / "gone.ts"), str(tmp_path / "new" / "other.ts"))
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from app.vision.endpoint_pool import EndpointPool, EndpointRequestError, RelayEndpoint, build_endpoints
+
+
+def _pool(n: int = 1, **kw) -> EndpointPool:
+    return EndpointPool([RelayEndpoint(f"https://r{i}.example/v1", f"key-{i}") for i in range(n)], **kw)
+
+
+def _fail(pool: EndpointPool, exc: Exception) -> RelayEndpoint:
+    with pytest.raises(type(exc)):
+        with pool.acquire() as ep:
+            raise exc
+    return ep
+
+
+def test_consecutive_failures_open_the_breaker() -> None:
+    pool = _pool(fail_threshold=2, cooldown_sec=30)
+    ep = _fail(pool, RuntimeError("502"))
+    assert ep.open_until == 0.0
+    _fail(pool, RuntimeError("502"))
+    assert ep.open_until > time.monotonic()
+    assert pool.stats()[0]["open"]
+    with pytest.raises(RuntimeError, match="熔断"):
+        with pool.acquire():
+            pass
+
+
+def test_request_errors_leave_the_breaker_alone() -> None:
+    pool = _pool(fail_threshold=1)
+    ep = _fail(pool, EndpointRequestError("400"))
+    assert (ep.fails, ep.errors, ep.open_until) == (0, 0, 0.0)
+    assert ep.in_flight == 0
+
+
+def test_half_open_probe_closes_on_success_and_backs_off_on_failure() -> None:
+    pool = _pool(fail_threshold=1, cooldown_sec=10, max_cooldown_sec=100)
+    ep = _fail(pool, RuntimeError("timeout"))
+    first_cooldown = ep.open_until - time.monotonic()
+
+    # Cooldown over: one probe goes through; its failure reopens with a doubled cooldown.
+    ep.open_until = 0.0
+    _fail(pool, RuntimeError("timeout"))
+    assert ep.open_until - time.monotonic() > 1.5 * first_cooldown
+
+    ep.open_until = 0.0
+    with pool.acquire() as probe:
+        assert probe.probing
+    assert (ep.fails, ep.open_until, ep.probing) == (0, 0.0, False)
+
+
+def test_routing_prefers_faster_and_avoided_endpoints_last() -> None:
+    pool = _pool(2)
+    fast, slow = pool.endpoints
+    fast.ewma_sec, slow.ewma_sec = 0.1, 2.0
+    with pool.acquire() as ep:
+        assert ep is fast
+    with pool.acquire(avoid={id(fast)}) as ep:
+        assert ep is slow
+
+
+def test_build_endpoints_drops_duplicates_and_blanks() -> None:
+    eps = build_endpoints(
+        "https://a.example/v1/",
+        "k1",
+        [{"api_base": "https://a.example/v1", "api_key": "k1"}, {"api_base": "", "api_key": "x"}, {"api_base": "https://b.example", "api_key": "k2", "max_in_flight": 8}],
+    )
+    assert [(e.api_base, e.max_in_flight) for e in eps] == [("https://a.example/v1", 4), ("https://b.example", 8)]
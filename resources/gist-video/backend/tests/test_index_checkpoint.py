@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+
+from app.jobs.index_checkpoint import IndexCheckpointStore, video_signature
+
+SLICES = [{"start": 0.0, "end": 4.0}, {"start": 4.0, "end": 8.0}]
+
+
+def _row(i: int) -> dict:
+    return {"clip_id": f"v0001_c{i:05d}", "start": 4.0 * i, "end": 4.0 * (i + 1), "frames": [f"f{i}.jpg"], "text": "dropped"}
+
+
+def test_load_returns_header_and_appended_rows(tmp_path) -> None:
+    store = IndexCheckpointStore(str(tmp_path))
+    store.begin("v0001", "sig", slices=SLICES, rows=[])
+    store.append_row("v0001", _row(0))
+    ck = store.load("v0001", "sig")
+    assert ck["status"] == "partial"
+    assert ck["slices"] == SLICES
+    # Only slicing/extraction fields are kept.
+    assert ck["rows"] == [{"clip_id": "v0001_c00000", "start": 0.0, "end": 4.0, "frames": ["f0.jpg"]}]
+
+    store.append_row("v0001", _row(1))
+    store.finish("v0001", "sig", slices=SLICES)
+    ck = store.load("v0001", "sig")
+    assert ck["status"] == "done"
+    assert [r["clip_id"] for r in ck["rows"]] == ["v0001_c00000", "v0001_c00001"]
+
+
+def test_load_rejects_other_signature_or_missing_shard(tmp_path) -> None:
+    store = IndexCheckpointStore(str(tmp_path))
+    store.begin("v0001", "sig", slices=SLICES, rows=[])
+    assert store.load("v0001", "other") is None
+    assert store.load("v0002", "sig") is None
+
+
+def test_torn_last_row_is_ignored_and_compacted_on_resume(tmp_path) -> None:
+    store = IndexCheckpointStore(str(tmp_path))
+    store.begin("v0001", "sig", slices=SLICES, rows=[])
+    store.append_row("v0001", _row(0))
+    with open(os.path.join(store.dir, "v0001.rows.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"clip_id": "v0001_c0')
+    ck = store.load("v0001", "sig")
+    assert len(ck["rows"]) == 1
+
+    store.begin("v0001", "sig", slices=SLICES, rows=ck["rows"])
+    store.append_row("v0001", _row(1))
+    assert len(store.load("v0001", "sig")["rows"]) == 2
+
+
+def test_prune_drops_shards_of_removed_videos(tmp_path) -> None:
+    store = IndexCheckpointStore(str(tmp_path))
+    for vkey in ("v0001", "v0002"):
+        store.begin(vkey, "sig", slices=SLICES, rows=[_row(0)])
+    store.prune({"v0001"})
+    assert sorted(os.listdir(store.dir)) == ["v0001.json", "v0001.rows.jsonl"]
+
+
+def test_video_signature_depends_on_params(tmp_path) -> None:
+    p = tmp_path / "a.mp4"
+    p.write_bytes(b"x")
+    assert video_signature(str(p), {"a": 1}) == video_signature(str(p), {"a": 1})
+    assert video_signature(str(p), {"a": 1}) != video_signature(str(p), {"a": 2})
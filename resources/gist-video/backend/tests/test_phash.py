@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.vision.phash import ClipHashIndex, hamming
+
+
+def _flip(h: int, bits: int) -> int:
+    for b in range(bits):
+        h ^= 1 << (b * 7)
+    return h
+
+
+def test_hamming_counts_differing_bits() -> None:
+    a = np.array([0, 0xFF, (1 << 64) - 1], dtype=np.uint64)
+    b = np.array([0, 0x0F, 0], dtype=np.uint64)
+    assert hamming(a, b).tolist() == [0, 4, 64]
+
+
+def test_find_matches_within_max_dist_on_every_frame() -> None:
+    idx = ClipHashIndex()
+    ref = [0x0123456789ABCDEF, 0x0F0F0F0F0F0F0F0F, 0x1111222233334444]
+    idx.add(7, ref)
+    assert idx.find(ref, 0) == 7
+    near = [_flip(ref[0], 2), ref[1], _flip(ref[2], 4)]
+    assert idx.find(near, 4) == 7
+    assert idx.find(near, 3) is None
+
+
+def test_find_requires_same_frame_count() -> None:
+    idx = ClipHashIndex()
+    idx.add(1, [5, 6, 7])
+    assert idx.find([5, 6], 64) is None
+    assert idx.find([], 64) is None
+
+
+def test_find_returns_closest_clip() -> None:
+    idx = ClipHashIndex()
+    base = 0xAAAAAAAAAAAAAAAA
+    idx.add(1, [_flip(base, 5)])
+    idx.add(2, [_flip(base, 1)])
+    assert idx.find([base], 8) == 2
+
+
+def test_index_grows_past_initial_capacity() -> None:
+    idx = ClipHashIndex()
+    rng = np.random.default_rng(0)
+    hashes = [int(x) for x in rng.integers(0, np.iinfo(np.uint64).max, size=200, dtype=np.uint64)]
+    for i, h in enumerate(hashes):
+        idx.add(i, [h])
+    assert len(idx) == 200
+    assert idx.find([hashes[150]], 0) == 150
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.jobs.repeat_detect import _runs, find_repeats, subtract_ranges
+
+
+def _episode(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.integers(0, np.iinfo(np.uint64).max, size=n, dtype=np.uint64)
+
+
+def test_runs_allow_small_gaps() -> None:
+    assert _runs([], max_gap=2) == []
+    assert _runs([1, 2, 4, 10, 11], max_gap=2) == [(1, 4, 3), (10, 11, 2)]
+
+
+def test_subtract_ranges_splits_and_drops_short_leftovers() -> None:
+    slices = [(0.0, 10.0), (10.0, 20.0)]
+    assert subtract_ranges(slices, [(3.0, 5.0)]) == [(0.0, 3.0), (5.0, 10.0), (10.0, 20.0)]
+    assert subtract_ranges(slices, [(0.2, 19.0)]) == [(19.0, 20.0)]
+    assert subtract_ranges(slices, [(0.0, 9.8)], min_keep_sec=0.5) == [(10.0, 20.0)]
+    assert subtract_ranges(slices, []) == slices
+
+
+def test_find_repeats_detects_opening_and_recap() -> None:
+    rng = np.random.default_rng(1)
+    a = _episode(rng, 600)
+    b = _episode(rng, 600)
+    # Same opening near the head of both episodes (at different offsets).
+    b[10:40] = a[5:35]
+    # The middle of episode 1 is recapped in the middle of episode 2.
+    b[400:430] = a[200:230]
+
+    found = find_repeats([a, b], [600.0, 600.0], min_sec=20, edge_sec=100)
+    assert found[0] == [(5.0, 35.0, "opening/ending")]
+    assert found[1] == [(10.0, 40.0, "opening/ending"), (400.0, 430.0, "recap")]
+
+
+def test_find_repeats_ignores_short_matches_and_single_video() -> None:
+    rng = np.random.default_rng(2)
+    a = _episode(rng, 300)
+    b = _episode(rng, 300)
+    b[50:60] = a[50:60]
+    assert find_repeats([a, b], [300.0, 300.0], min_sec=20) == [[], []]
+    assert find_repeats([a], [300.0]) == [[]]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+import time
+
+from app.jobs.segment_cache import SegmentCache
+
+
+def _write(path: str, size: int, mtime: float) -> None:
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_key_is_order_independent() -> None:
+    assert SegmentCache.key({"a": 1, "b": [2, 3]}) == SegmentCache.key({"b": [2, 3], "a": 1})
+    assert SegmentCache.key({"a": 1}) != SegmentCache.key({"a": 2})
+
+
+def test_lookup_counts_hits_and_misses(tmp_path) -> None:
+    cache = SegmentCache(str(tmp_path), quota_bytes=0)
+    p = cache.lookup("ab" * 20)
+    assert os.path.isdir(os.path.dirname(p))
+    _write(p, 10, time.time())
+    assert cache.lookup("ab" * 20) == p
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.release()
+
+
+def test_evict_drops_least_recently_used_first(tmp_path) -> None:
+    cache = SegmentCache(str(tmp_path), quota_bytes=250)
+    now = time.time()
+    keys = ["aa" * 20, "bb" * 20, "cc" * 20]
+    for age, k in zip((300, 200, 100), keys):
+        os.makedirs(os.path.dirname(cache.path(k)), exist_ok=True)
+        _write(cache.path(k), 100, now - age)
+    cache.evict()
+    assert [os.path.isfile(cache.path(k)) for k in keys] == [False, True, True]
+
+
+def test_evict_keeps_requested_and_reserved_keys(tmp_path) -> None:
+    now = time.time()
+    ours = SegmentCache(str(tmp_path), quota_bytes=100)
+    other = SegmentCache(str(tmp_path), quota_bytes=100)
+    old_kept, old_reserved, new = "aa" * 20, "bb" * 20, "cc" * 20
+    _write(other.lookup(old_reserved), 100, now - 300)
+    for k, age in ((old_kept, 400), (new, 10)):
+        os.makedirs(os.path.dirname(ours.path(k)), exist_ok=True)
+        _write(ours.path(k), 100, now - age)
+
+    # `other` still holds old_reserved (a concurrent render that hasn't concatenated yet).
+    ours.evict(keep={old_kept})
+    assert os.path.isfile(ours.path(old_kept))
+    assert os.path.isfile(ours.path(old_reserved))
+    assert not os.path.isfile(ours.path(new))
+
+    other.release()
+    ours.evict(keep={old_kept})
+    assert not os.path.isfile(ours.path(old_reserved))
+
+
+def test_evict_removes_stale_partial_encodes(tmp_path) -> None:
+    cache = SegmentCache(str(tmp_path), quota_bytes=1 << 20)
+    stale = os.path.join(str(tmp_path), "ab", "x.ts.part")
+    fresh = os.path.join(str(tmp_path), "ab", "y.ts.part")
+    os.makedirs(os.path.dirname(stale), exist_ok=True)
+    _write(stale, 1, time.time() - 7200)
+    _write(fresh, 1, time.time())
+    cache.evict()
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)